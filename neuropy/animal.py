@@ -77,26 +77,32 @@ class Animal(object):
         """Write to self's tree buffer"""
         self.treebuf.write(string)
 
-    def load(self, tracknames=None):
-        treestr = self.level*TAB + self.id + '/'
-        # print string to tree hierarchy and screen
-        self.writetree(treestr + '\n')
-        print(treestr)
+    def find_tracknames(self, tracknames=None):
+        """Return sorted tracknames, or if None, sorted names of all track folders in this
+        animal's path"""
         if tracknames != None:
-            tracknames = tolist(tracknames)
-            dirnames = tracknames
+            dirnames = tolist(tracknames)
         else:
             # all track folder names for this animal:
             dirnames = [ dirname for dirname in os.listdir(self.path)
                          if os.path.isdir(os.path.join(self.path, dirname))
                          and dirname.lower().startswith('tr') ]
-        dirnames.sort() # alphabetical order
-        for dirname in dirnames:
+        return sorted(dirnames) # alphabetical order
+
+    def load(self, tracknames=None, onrecording=None):
+        """Load tracknames, or all tracks if None. If specified, onrecording is called with
+        each recording as soon as it's loaded, see loader.py"""
+        treestr = self.level*TAB + self.id + '/'
+        # print string to tree hierarchy and screen
+        self.writetree(treestr + '\n')
+        print(treestr)
+        for dirname in self.find_tracknames(tracknames):
             path = os.path.join(self.path, dirname)
-            track = Track(path, animal=self)
-            track.load()
-            self.tr[track.id] = track
-            self.__setattr__('tr' + str(track.id), track) # add shortcut attrib
+            track = Track(path, animal=self) # adds itself to self.tr
+            # add shortcut attrib before loading, so that a track's recordings can be
+            # accessed while the rest are still loading in the background:
+            self.__setattr__('tr' + str(track.id), track)
+            track.load(onrecording=onrecording)
 
     def get_rnames(self):
         rnames = []
@@ -0,0 +1,178 @@
+"""Headless batch analysis of many recordings in parallel, outside of IPython. Each
+recording is loaded, analyzed and saved to the result store in its own worker process,
+which then exits, so that only one recording's worth of memory is held per worker at any
+time, and nothing is left over between recordings. Analysis parameters come from an
+explicit config.Config, which is pickled and handed to each worker.
+
+Run from the neuropy folder, e.g.:
+
+python batch.py sc_si /data/ptc22/tr1/* -o ~/results -j 8 -c MINRATE=0.5 -k sisource='mua'
+
+Results are saved to one .npz file per recording, in OUTPATH/ANALYSIS/RECNAME.npz, and can
+be read back with load() or loadall()"""
+
+import os
+import sys
+import time
+import gc
+import argparse
+import ast
+import multiprocessing as mp
+
+import numpy as np
+
+import config
+
+
+## analyses: each takes a loaded Recording and kwargs, and returns a dict of arrays:
+
+def sc_si(rec, **kwargs):
+    """Spike correlations vs LFP or MUA synchrony index, see SpikeCorr.si"""
+    corrs, si, ylabel = rec.sc().si(plot=False, **kwargs)
+    return {'corrs': corrs, 'si': si, 'ylabel': ylabel}
+
+def mua_si(rec, **kwargs):
+    """MUA synchrony index, see Recording.mua_si"""
+    si, t, n = rec.mua_si(plot=False, **kwargs)
+    return {'si': si, 't': t, 'n': n}
+
+def psth(rec, **kwargs):
+    """PSTHs of active neurons by default, see Recording.psth"""
+    t, psths, spikets = rec.psth(plot=False, **kwargs)
+    nids = kwargs.get('nids')
+    # same interpretation as in Recording.traster. nids can also be an array:
+    if nids is None or isinstance(nids, str):
+        nids = {None: rec.n, 'quiet': rec.qn, 'all': rec.alln}[nids]
+    return {'t': t, 'psths': psths, 'nids': np.asarray(sorted(nids))}
+
+def sta(rec, **kwargs):
+    """Spike-triggered averages of all active neurons, see Experiment.sta"""
+    stas = [ s for s in rec.sta(**kwargs).stas if s is not None ]
+    return {'nids': np.asarray([ s.neuron.id for s in stas ]),
+            'rfs': np.asarray([ s.rf for s in stas ])}
+
+ANALYSES = {'sc_si': sc_si, 'mua_si': mua_si, 'psth': psth, 'sta': sta}
+
+
+## result store:
+
+def resultfname(outpath, analysis, recpath):
+    """Return full path to result file of analysis of recording at recpath"""
+    recname = os.path.basename(os.path.normpath(recpath))
+    return os.path.join(outpath, analysis, recname + '.npz')
+
+def save(fname, result, cfg, kwargs):
+    """Save result dict to fname, along with the config and kwargs it was generated with.
+    Write to a temporary file first, so that an interrupted run never leaves behind a
+    truncated result that would later be mistaken for a complete one"""
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmpfname = fname + '.tmp.npz'
+    cfgvals = { name: val for name, val in cfg.items() if name not in config.UNPICKLED }
+    np.savez(tmpfname, _config=repr(cfgvals), _kwargs=repr(kwargs), **result)
+    os.replace(tmpfname, fname)
+
+def load(fname):
+    """Load result dict from fname"""
+    with np.load(fname, allow_pickle=True) as f:
+        return { key: f[key] for key in f.files }
+
+def loadall(outpath, analysis):
+    """Return dict of all stored results of analysis, indexed by recording name"""
+    path = os.path.join(outpath, analysis)
+    fnames = sorted( fname for fname in os.listdir(path) if fname.endswith('.npz')
+                     and not fname.endswith('.tmp.npz') )
+    return { fname[:-len('.npz')]: load(os.path.join(path, fname)) for fname in fnames }
+
+
+## running:
+
+def run1(args):
+    """Load, analyze and save a single recording. Called in a worker process. Return
+    (recpath, result fname or None on error, error message or None, duration in sec)"""
+    recpath, analysis, outpath, cfg, kwargs = args
+    t0 = time.time()
+    fname = resultfname(outpath, analysis, recpath)
+    try:
+        from recording import Recording # import late, after worker process starts
+        with config.using(cfg):
+            rec = Recording(recpath)
+            rec.load()
+            result = ANALYSES[analysis](rec, **kwargs)
+            save(fname, result, cfg, kwargs)
+    except Exception as err:
+        return recpath, None, '%s: %s' % (type(err).__name__, err), time.time() - t0
+    finally:
+        rec = result = None # release the recording before the next one
+        gc.collect()
+    return recpath, fname, None, time.time() - t0
+
+def run(recpaths, analysis, outpath, cfg=None, nprocs=None, overwrite=False, **kwargs):
+    """Run analysis on all recordings in recpaths, nprocs at a time (defaults to number of
+    cores), saving results to outpath. Recordings with existing results are skipped unless
+    overwrite. cfg defaults to the currently active Config. kwargs are passed on to the
+    analysis. Return dict of recpath:error message for each recording that failed"""
+    if analysis not in ANALYSES:
+        raise ValueError('unknown analysis %r, choose from %r' % (analysis, sorted(ANALYSES)))
+    if cfg == None:
+        cfg = config.get()
+    if not overwrite:
+        recpaths = [ recpath for recpath in recpaths
+                     if not os.path.exists(resultfname(outpath, analysis, recpath)) ]
+    print('running %s on %d recordings' % (analysis, len(recpaths)))
+    os.environ.setdefault('MPLBACKEND', 'Agg') # no displays in worker processes
+    argss = [ (recpath, analysis, outpath, cfg, kwargs) for recpath in recpaths ]
+    errors = {}
+    t0 = time.time()
+    # maxtasksperchild=1 gives each recording a fresh process, guaranteeing that all its
+    # memory is returned to the OS when done:
+    pool = mp.Pool(nprocs, maxtasksperchild=1)
+    try:
+        for recpath, fname, err, dt in pool.imap_unordered(run1, argss):
+            if err == None:
+                print('%s -> %s (%.1f sec)' % (recpath, fname, dt))
+            else:
+                print('%s FAILED: %s' % (recpath, err))
+                errors[recpath] = err
+    finally:
+        pool.close()
+        pool.join()
+    print('%d of %d recordings done in %.1f sec'
+          % (len(recpaths)-len(errors), len(recpaths), time.time()-t0))
+    return errors
+
+def parse_keyvals(keyvals):
+    """Parse list of 'KEY=VAL' strings into a dict, evaluating each VAL as a Python
+    literal if possible, otherwise leaving it as a string"""
+    d = {}
+    for keyval in keyvals:
+        key, val = keyval.split('=', 1)
+        try:
+            val = ast.literal_eval(val)
+        except (ValueError, SyntaxError):
+            pass # leave as string
+        d[key.strip()] = val
+    return d
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('analysis', choices=sorted(ANALYSES))
+    parser.add_argument('recpaths', nargs='+', help='recording folders')
+    parser.add_argument('-o', '--outpath', default='.', help='result store folder')
+    parser.add_argument('-j', '--nprocs', type=int, default=None,
+                        help='number of worker processes, defaults to number of cores')
+    parser.add_argument('-c', '--config', nargs='*', default=[], metavar='KEY=VAL',
+                        help='override config values in globals.py')
+    parser.add_argument('-k', '--kwargs', nargs='*', default=[], metavar='KEY=VAL',
+                        help='keyword arguments for the analysis')
+    parser.add_argument('-f', '--overwrite', action='store_true',
+                        help='rerun recordings with existing results')
+    args = parser.parse_args(argv)
+    recpaths = [ recpath for recpath in args.recpaths if os.path.isdir(recpath) ]
+    cfg = config.Config(parse_keyvals(args.config))
+    errors = run(recpaths, args.analysis, args.outpath, cfg=cfg, nprocs=args.nprocs,
+                 overwrite=args.overwrite, **parse_keyvals(args.kwargs))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Persistent on-disk cache of expensive analysis results, so that rerunning an analysis in a
+new session only costs disk I/O. Apply the cached decorator to a method that returns an
+array or a tuple of arrays.
+
+Each result is stored under a key that hashes the identity of the recording files it was
+calculated from (names, sizes and modification times), the method name, its normalized
+arguments, and the active Config. Modifying a recording's files, or any config value,
+therefore results in a new key instead of a stale result. Each result is stored in its own
+folder in config CACHEPATH, as one .npy file per returned value. Arrays are
+memory-mapped, not read, on retrieval. Once the cache grows beyond config CACHESIZE, the
+least recently used results are deleted. Failing to store a result, say on a full or
+read-only disk, only warns, since the result itself is still returned"""
+
+import os
+import shutil
+import hashlib
+import functools
+import inspect
+import warnings
+
+import numpy as np
+
+import config
+
+NOTHASHED = ['MOVIES', 'CACHEPATH', 'CACHESIZE'] # config names that don't affect results
+
+# running total size in bytes of each cache folder, scanned once on first put() to it, then
+# incremented by each put(), so that the cache is only rescanned once it's too big:
+TOTALS = {}
+
+
+def normalize(obj):
+    """Convert obj into a nested structure of tuples and strings with a reproducible repr,
+    for hashing. Arrays are replaced by a hash of their contents, since their repr can be
+    truncated"""
+    if isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        if obj.dtype.hasobject:
+            return ('ndarray', obj.shape, normalize(obj.tolist()))
+        return ('ndarray', obj.dtype.str, obj.shape, hashlib.sha1(obj.data).hexdigest())
+    elif isinstance(obj, dict):
+        return ('dict',) + tuple( (repr(key), normalize(val))
+                                  for key, val in sorted(obj.items(), key=repr) )
+    elif isinstance(obj, (list, tuple, range)):
+        return (type(obj).__name__,) + tuple( normalize(val) for val in obj )
+    elif isinstance(obj, np.generic):
+        return repr(obj.item())
+    else:
+        return repr(obj)
+
+def recordings(obj):
+    """Return list of recordings that obj (a Recording, SpikeCorr, LFP, Experiment,
+    Neuron, etc.) gets its data from"""
+    if hasattr(obj, 'recs'): # SpikeCorr
+        return list(obj.recs)
+    elif hasattr(obj, 'sorts') and hasattr(obj, 'e'): # Recording
+        return [obj]
+    else: # LFP, Experiment, Sort, Neuron
+        return [obj.r]
+
+def fileid(path, recurse=True):
+    """Return identity of all files in path: their names, sizes and modification times.
+    Recurses one level into folders (such as .sort folders) if recurse"""
+    fid = []
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        if entry.is_file():
+            stat = entry.stat()
+            fid.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        elif entry.is_dir() and recurse:
+            fid.append((entry.name, fileid(entry.path, recurse=False)))
+    return fid
+
+def sourceid(recs):
+    """Return identity of all source files of recordings recs, including any track-wide
+    sort files in their parent track folder"""
+    sid = []
+    for rec in recs:
+        sid.append((rec.path, fileid(rec.path)))
+        if rec.tr != None:
+            sid.append((rec.tr.path, fileid(rec.tr.path, recurse=False)))
+    return sid
+
+def sortnames(obj):
+    """Return names of the default sorts of the recordings of obj. Use as the state of
+    cached methods whose results depend on spikes"""
+    return [ rec.sort.name if rec.sort != None else None for rec in recordings(obj) ]
+
+def filterhists(obj):
+    """Return the in-place filters applied to the LFP of each of the recordings of obj,
+    see LFP.filterhist. Use as the state of cached methods whose results depend on LFP"""
+    return [ rec.lfp.filterhist if hasattr(rec, 'lfp') else None
+             for rec in recordings(obj) ]
+
+def key(*parts):
+    """Return a key that hashes the normalized parts, along with the active Config"""
+    cfg = config.get()
+    cfg = { name: val for name, val in cfg.items() if name not in NOTHASHED }
+    return hashlib.sha1(repr(normalize((parts, cfg))).encode()).hexdigest()
+
+def path(key):
+    """Return path to cache folder of key, or None if caching is disabled"""
+    cachepath = config.get()['CACHEPATH']
+    if cachepath == None:
+        return None
+    return os.path.join(cachepath, key)
+
+def get(key):
+    """Return result stored under key, with arrays memory-mapped copy-on-write, so that
+    callers can modify them without affecting the cache. Raise KeyError if there's no
+    such result"""
+    keypath = path(key)
+    if keypath == None or not os.path.isdir(keypath):
+        raise KeyError(key)
+    with open(os.path.join(keypath, 'kind')) as f:
+        kind = f.read()
+    values = []
+    for i in range(len(kind)):
+        fname = os.path.join(keypath, '%d.npy' % i)
+        try:
+            value = np.load(fname, mmap_mode='c')
+        except ValueError: # object arrays can't be memory-mapped
+            value = np.load(fname, allow_pickle=True)
+        if kind[i] in 'sS': # scalar, such as a str, float or int
+            value = value.item()
+        values.append(value)
+    os.utime(keypath) # mark as most recently used
+    if len(values) == 1 and kind == kind.lower(): # single value, not a tuple
+        return values[0]
+    return tuple(values)
+
+def put(key, result):
+    """Store result, an array, scalar, or tuple thereof, under key, then evict least
+    recently used results if the cache is too big. Warn instead of raising if result
+    can't be stored"""
+    keypath = path(key)
+    if keypath == None:
+        return
+    single = type(result) != tuple
+    values = [result] if single else result
+    kind = ''
+    # write to a temporary folder, then rename, so that an interrupted write never
+    # leaves behind an incomplete result:
+    tmppath = keypath + '.tmp%d' % os.getpid()
+    try:
+        os.makedirs(tmppath, exist_ok=True)
+        for i, value in enumerate(values):
+            kind += 's' if np.isscalar(value) or value is None else 'a'
+            np.save(os.path.join(tmppath, '%d.npy' % i), np.asanyarray(value),
+                    allow_pickle=True)
+        if not single:
+            kind = kind.upper() # mark as tuple
+        with open(os.path.join(tmppath, 'kind'), 'w') as f:
+            f.write(kind)
+        nbytes = size(tmppath)
+    except OSError as err:
+        shutil.rmtree(tmppath, ignore_errors=True)
+        warnings.warn("couldn't cache result: %s" % err, category=RuntimeWarning,
+                      stacklevel=2)
+        return
+    try:
+        os.rename(tmppath, keypath)
+    except OSError: # another process stored the same result in the meantime
+        shutil.rmtree(tmppath, ignore_errors=True)
+        nbytes = 0
+    cfg = config.get()
+    cachepath = cfg['CACHEPATH']
+    try:
+        if cachepath in TOTALS:
+            TOTALS[cachepath] += nbytes
+        else: # first put() to this cache folder in this process, includes the new result
+            TOTALS[cachepath] = usage(cachepath)
+        if TOTALS[cachepath] > cfg['CACHESIZE']:
+            evict()
+    except OSError as err:
+        warnings.warn("couldn't evict cached results: %s" % err, category=RuntimeWarning,
+                      stacklevel=2)
+
+def size(path):
+    """Return total size in bytes of all files in path"""
+    return sum( entry.stat().st_size for entry in os.scandir(path) if entry.is_file() )
+
+def results(cachepath):
+    """Return (last use time, size, path) of each result in cachepath, most recently used
+    first"""
+    entries = [ entry for entry in os.scandir(cachepath)
+                if entry.is_dir() and '.tmp' not in entry.name ]
+    return sorted(( (entry.stat().st_mtime, size(entry.path), entry.path)
+                    for entry in entries ), reverse=True)
+
+def usage(cachepath):
+    """Return total size in bytes of all results in cachepath"""
+    return sum( nbytes for mtime, nbytes, keypath in results(cachepath) )
+
+def evict(maxsize=None):
+    """Delete least recently used results until the cache is no bigger than maxsize bytes,
+    which defaults to config CACHESIZE"""
+    cfg = config.get()
+    if maxsize == None:
+        maxsize = cfg['CACHESIZE']
+    cachepath = cfg['CACHEPATH']
+    total, kept = 0, 0
+    for mtime, nbytes, keypath in results(cachepath):
+        total += nbytes
+        if total > maxsize:
+            shutil.rmtree(keypath, ignore_errors=True)
+        else:
+            kept = total
+    TOTALS[cachepath] = kept # resync, other processes may also be writing to cachepath
+
+def clear():
+    """Delete all cached results"""
+    evict(maxsize=0)
+
+def cached(state=None, nocache='plot'):
+    """Decorator that caches the result of a method on disk. The key includes the identity
+    of the source files of the recordings of the method's object, the method's qualified
+    name, all its arguments (with defaults filled in), and the active Config. state is an
+    optional function that takes the object and returns any other of its attributes that
+    affect the result. The cache is bypassed whenever argument nocache is true, which by
+    default means whenever the method is asked to plot, since plotting is a side effect
+    that a cached result can't reproduce"""
+    def decorator(method):
+        signature = inspect.signature(method)
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments['self']
+            if arguments.get(nocache) or config.get()['CACHEPATH'] == None:
+                return method(self, *args, **kwargs)
+            statevals = state(self) if state != None else None
+            k = key(method.__qualname__, sourceid(recordings(self)), arguments, statevals)
+            try:
+                return get(k)
+            except KeyError:
+                pass
+            result = method(self, *args, **kwargs)
+            put(k, result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+"""Analysis configuration. Compute code gets its parameters (MINRATE, CODETRES, LAYERS,
+etc.) from the active Config, instead of directly from the IPython user namespace, so
+that it also runs in plain Python, in subprocesses, and in multiprocessing workers.
+
+In the IPython shell, nothing changes: variables in globals.py can be modified at the
+command line as before, and the default Config picks up their values on every get().
+Elsewhere, defaults come straight from globals.py. To use different values, either
+modify a Config and scope it:
+
+>>> cfg = config.Config(MINRATE=0.5)
+>>> with config.using(cfg):
+...     rec.sc_si()
+
+or just pass the values to scope:
+
+>>> with config.using(MINRATE=0.5):
+...     rec.sc_si()
+"""
+
+import threading
+from contextlib import contextmanager
+
+UNPICKLED = ['MOVIES'] # process-local registries, left out when pickling a Config
+
+
+def globalsdefaults():
+    """Return dict of all upper case variables in globals.py"""
+    import globals # import late, globals imports core
+    return { name: val for name, val in vars(globals).items() if name.isupper() }
+
+def ipython_user_ns():
+    """Return the IPython user namespace, or None if not running in IPython"""
+    try:
+        return get_ipython().user_ns
+    except NameError: # not running in IPython
+        return None
+
+
+class Config(dict):
+    """A dict (with attribute access) of analysis parameters. Starts off with the default
+    values in globals.py, overridden by any args and kwargs. Picklable, so it can be
+    handed to worker processes. Doesn't subclass core.dictattr, since core imports this
+    module"""
+    def __init__(self, *args, **kwargs):
+        super(Config, self).__init__(globalsdefaults())
+        self.update(*args, **kwargs)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError('%r object has no attribute %r' % ('Config', name))
+
+    def __setattr__(self, name, val):
+        self[name] = val
+
+    def update(self, *args, **kwargs):
+        # go through our own __setitem__ so that new keys are checked:
+        for name, val in dict(*args, **kwargs).items():
+            self[name] = val
+
+    def __setitem__(self, name, val):
+        if not name.isupper():
+            raise ValueError('config names must be upper case, got %r' % name)
+        super(Config, self).__setitem__(name, val)
+
+    def sync(self, ns=None):
+        """Update values of existing keys from namespace ns, which defaults to the IPython
+        user namespace. Return self"""
+        if ns == None:
+            ns = ipython_user_ns()
+            if ns == None:
+                return self
+        for name in self:
+            try:
+                super(Config, self).__setitem__(name, ns[name])
+            except KeyError:
+                pass # not defined in ns, keep existing value
+        return self
+
+    def copy(self):
+        return Config(self)
+
+    def __reduce__(self):
+        """Pickle all values except for those in UNPICKLED, such as the MOVIES registry
+        of memmapped movies, which unpickle to their defaults in globals.py instead"""
+        return Config, ({ name: val for name, val in self.items()
+                          if name not in UNPICKLED },)
+
+
+_default = None # default Config, created on first get()
+_local = threading.local() # each thread's own stack of Configs activated by using()
+
+def scoped():
+    """Return this thread's stack of Configs activated by using(). Scopes in one thread,
+    such as the IPython shell, don't affect any other thread, such as a background
+    loader"""
+    try:
+        return _local.stack
+    except AttributeError: # first use in this thread
+        _local.stack = []
+        return _local.stack
+
+def get():
+    """Return the active Config: the innermost one scoped by using(), or else the default
+    one, synced from the IPython user namespace if running in IPython"""
+    global _default
+    stack = scoped()
+    if stack:
+        return stack[-1]
+    if _default is None:
+        _default = Config()
+    return _default.sync()
+
+@contextmanager
+def using(cfg=None, **kwargs):
+    """Context manager that makes cfg (or the currently active Config) the active Config
+    for the duration of the with block, updated with any kwargs. Yields the active Config.
+    Scopes can be nested"""
+    if cfg == None:
+        cfg = get()
+    if kwargs:
+        cfg = Config(cfg, **kwargs)
+    stack = scoped()
+    stack.append(cfg)
+    try:
+        yield cfg
+    finally:
+        stack.pop()
@@ -15,36 +15,77 @@ from copy import copy
 from pprint import pprint
 printraw = sys.stdout.write # useful for raw printing
 
-from PyQt4 import QtGui
-from PyQt4.QtGui import QPixmap, QImage, QPalette, QColor
-from PyQt4.QtCore import Qt, QSize
-
 import numpy as np
 # make overflow, underflow, div by zero, and invalid all raise errors
 # this really should be the default in numpy...
 np.seterr(all='raise', under='ignore') # raise all except float underflow
-import scipy.signal
-from scipy.special import cbrt # real cube root
-import scipy.stats
-from scipy.spatial.distance import pdist#, squareform
-from scipy.stats import linregress
-from scipy.io import loadmat
-
-import matplotlib as mpl
-import matplotlib.cm
-import matplotlib.pyplot as plt
-import pylab as pl
-from pylab import get_current_fig_manager as gcfm
-from matplotlib.collections import LineCollection
-
-import pyximport
-pyximport.install(build_in_temp=False, inplace=True)
-import util # .pyx file
-
-import filter
+
+# Qt, matplotlib and scipy are slow to import, and aren't needed for pure computation.
+# Import them lazily, on first use:
+from lazy import LazyModule, LazyAttr
+QtGui = LazyModule('PyQt4.QtGui')
+QPixmap = LazyAttr('PyQt4.QtGui', 'QPixmap')
+QImage = LazyAttr('PyQt4.QtGui', 'QImage')
+QPalette = LazyAttr('PyQt4.QtGui', 'QPalette')
+QColor = LazyAttr('PyQt4.QtGui', 'QColor')
+Qt = LazyAttr('PyQt4.QtCore', 'Qt')
+QSize = LazyAttr('PyQt4.QtCore', 'QSize')
+
+scipy = LazyModule('scipy') # scipy.signal, scipy.stats, etc. are imported on first use
+cbrt = LazyAttr('scipy.special', 'cbrt') # real cube root
+pdist = LazyAttr('scipy.spatial.distance', 'pdist')
+linregress = LazyAttr('scipy.stats', 'linregress')
+loadmat = LazyAttr('scipy.io', 'loadmat')
+
+mpl = LazyModule('matplotlib') # mpl.cm, mpl.ticker, etc. are imported on first use
+plt = LazyModule('matplotlib.pyplot')
+pl = LazyModule('pylab')
+gcfm = LazyAttr('pylab', 'get_current_fig_manager')
+LineCollection = LazyAttr('matplotlib.collections', 'LineCollection')
+
+filter = LazyModule('filter') # imports scipy.signal
+
+
+def load_util():
+    """Import and return the util extension module. Use a prebuilt util extension if
+    there is one that's at least as new as util.pyx, otherwise compile util.pyx using
+    pyximport, which leaves a prebuilt extension behind for next time"""
+    import importlib.machinery, importlib.util
+    spec = importlib.util.find_spec('util')
+    pyxfname = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'util.pyx')
+    suffixes = tuple(importlib.machinery.EXTENSION_SUFFIXES)
+    if (spec is None or not spec.origin.endswith(suffixes)
+        or os.path.getmtime(spec.origin) < os.path.getmtime(pyxfname)):
+        import pyximport
+        pyimporter, pyximporter = pyximport.install(build_in_temp=False, inplace=True)
+        # pyximport's importer comes after the regular one, which would just import the
+        # stale extension, so move it to the front:
+        sys.meta_path.remove(pyximporter)
+        sys.meta_path.insert(0, pyximporter)
+    import util # .pyx file
+    return util
+
+util = load_util()
+
+import info
+import config
+import cache
+import raster
 from colour import CCWHITERGBDICT1, CCBLACKDICT0, CCBLACKDICT1
 
 
+# classes that subclass Qt and matplotlib classes, imported from gui module on first use:
+GUINAMES = ['NeuropyWindow', 'RevCorrWindow', 'NeuropyScalarFormatter',
+            'NeuropyAutoLocator']
+
+def __getattr__(name):
+    """Lazily import classes in GUINAMES from the gui module, so that eg `from core import
+    RevCorrWindow` still works without importing Qt when core is imported"""
+    if name in GUINAMES:
+        import gui
+        return getattr(gui, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
 TAB = '    ' # 4 spaces
 EPOCH = datetime.datetime(1899, 12, 30, 0, 0, 0) # epoch for datetime stamps in .ptcs
 
@@ -442,43 +483,27 @@ class DensePopulationRaster(object):
         ypos = np.array([ neurons[nid].pos[1] for nid in nids ])
         supis, midis, deepis = laminarity(ypos, r.tr.absname)
         nn = len(nids)
-        t, y, c = [], [], []
-        for nidi, nid in enumerate(nids):
-            n = neurons[nid]
-            lo, hi = n.spikes.searchsorted(trange)
-            spikes = n.spikes[lo:hi]
-            nspikes = len(spikes)
-            if nspikes > 0:
-                t.append(spikes)
-                y.append(np.tile(nidi, nspikes)) # depth rank below top of electrode
-                if supis[nidi]: nc = 'r'
-                elif midis[nidi]: nc = 'g'
-                elif deepis[nidi]: nc = 'b'
-                else: nc = 'y'
-                c.append(np.tile(nc, nspikes))
-
-        t = np.hstack(t)
+        spikes = [ neurons[nid].spikes for nid in nids ]
+        y = np.arange(nn) # depth rank below top of electrode
+        # one colour per neuron, according to its layer:
+        c = np.tile('y', nn)
+        c[supis], c[midis], c[deepis] = 'r', 'g', 'b'
         # spike time multiplier to use for raster labels:
         tx = {'us': 1, 'ms': 1000, 'sec': 1000000}[units]
-        if tx != 1:
-            t = t / tx # don't do in-place, allow conversion to float
-        y = np.hstack(y)
-        c = np.hstack(c)
-
-        s = 50
-        # manual size or color settings override the automatic values
-        if size != None:
-            s = size
+
+        # manual color setting overrides the automatic values:
         if color != None:
-            c = color
+            c = [color] * nn
 
         if figsize[1] == None:
             figsize = figsize[0], 1 + nn / 7 # ~1/7th vertical inch per neuron
         f = pl.figure(figsize=figsize)
         a = f.add_subplot(111)
-        a.scatter(t, y, marker=marker, c=c, alpha=alpha, s=s)
         a.set_xlim(trange/tx)
         a.set_ylim(nn, -1) # invert the y axis
+        # draw counts image when zoomed out, spike ticks when zoomed in:
+        self.lod = raster.LODRaster(a, spikes, y, c, nids, trange, tx=tx, tickheight=0.8,
+                                    marker=marker, size=size, alpha=alpha)
         # turn off annoying "+2.41e3" type offset on x axis:
         formatter = mpl.ticker.ScalarFormatter(useOffset=False)
         a.xaxis.set_major_formatter(formatter)
@@ -518,59 +543,39 @@ class SpatialPopulationRaster(object):
             nids = norder
             self.norder = norder
             print(norder)
-        t, y, c, s = [], [], [], []
-        for nidi, nid in enumerate(nids):
-            n = neurons[nid]
-            lo, hi = n.spikes.searchsorted(trange)
-            spikes = n.spikes[lo:hi]
-            nspikes = len(spikes)
-            if nspikes > 0:
-                t.append(spikes)
-                if norder == None:
-                    ypos = n.pos[1]
-                else:
-                    ypos = nidi
-                y.append(np.tile(ypos, nspikes)) # -ve, distance below top of electrode
-                nc = CCWHITERGBDICT1[nid] # for max colour alternation, use DICT0 and nidi
-                c.append(np.tile(nc, nspikes))
-                # use big points for low rate cells, small points for high rate cells:
-                #ms = max(min(10000/nspikes, 50), 5)
-                #s.append(np.tile(ms, nspikes))
-        t = np.hstack(t)
+        spikes = [ neurons[nid].spikes for nid in nids ]
+        if norder == None:
+            y = [ neurons[nid].pos[1] for nid in nids ] # distance below top of electrode
+        else:
+            y = np.arange(len(nids))
+        # for max colour alternation, use DICT0 and nidi:
+        c = [ CCWHITERGBDICT1[nid] for nid in nids ]
         # spike time multiplier to use for raster labels:
         tx = {'us': 1, 'ms': 1000, 'sec': 1000000}[units]
-        if tx != 1:
-            t = t / tx # don't do in-place, allow conversion to float
-        y = np.hstack(y)
-        c = np.hstack(c)
-        c.shape = -1, 3
-        #s = np.hstack(s)
-        s = 50
-
-        # manual size or color settings override the automatic values
-        if size != None:
-            s = size
+
+        # manual color setting overrides the automatic values:
         if color != None:
-            c = color
+            c = [color] * len(nids)
 
         if figsize[1] == None:
             figsize = figsize[0], 6.5
         f = pl.figure(figsize=figsize)
         a = f.add_subplot(111)
-        ec = 'none'
-        if marker == '|':
-            ec = c
-        a.scatter(t, y, marker=marker, c=c, edgecolor=ec, alpha=alpha, s=s)
-        a.invert_yaxis() # increasingly +ve values down y axis
         a.set_xlim(trange/tx)
         if norder == None: # set y axis limits according to spatial extent of probe
             # grab first neuron's sort.chanpos, should be the same for all:
             chanpos = neurons[nids[0]].sort.chanpos
             ymax = chanpos[:, 1].max() # max chan distance below top of probe
             ymax = np.ceil(ymax / 50) * 50 # round up to nearest multiple of 100 um
-            a.set_ylim(ymax, 0)
-        else: # autoscale 'nidi' integer y axis
-            a.autoscale(enable=True, axis='y', tight=True)
+            a.set_ylim(ymax, 0) # increasingly +ve values down y axis
+            tickheight = ymax / 50
+        else: # 'nidi' integer y axis
+            a.set_ylim(len(nids) - 0.5, -0.5)
+            tickheight = 0.8
+        # draw counts image when zoomed out, spike ticks when zoomed in:
+        self.lod = raster.LODRaster(a, spikes, y, c, nids, trange, tx=tx,
+                                    tickheight=tickheight, marker=marker, size=size,
+                                    alpha=alpha)
         # turn off annoying "+2.41e3" type offset on x axis:
         formatter = mpl.ticker.ScalarFormatter(useOffset=False)
         a.xaxis.set_major_formatter(formatter)
@@ -586,92 +591,7 @@ class SpatialPopulationRaster(object):
             a.set_title(titlestr)
         f.tight_layout(pad=0.3) # crop figure to contents
         self.f = f
-    '''
-    def _onmotion(self, event):
-        """Called during mouse motion over figure. Pops up neuron and
-        experiment info in a tooltip when hovering over a neuron row."""
-        self.f.canvas.mpl_connect('motion_notify_event', self._onmotion)
-        self.f.canvas.mpl_connect('key_press_event', self._onkeypress)
-
-        if event.inaxes: # if mouse is inside the axes
-            # use ydata to get index into sorted list of neurons:
-            nii = int(math.floor(event.ydata))
-            ni = self.nids[nii]
-            neuron = self.neurons[ni]
-            currentexp = None
-            for e in self.e.values(): # for all experiments
-                estart = (e.trange[0]-self.t0)/self.tconv
-                eend = (e.trange[1]-self.t0)/self.tconv
-                if estart < event.xdata  < eend:
-                    currentexp = e
-                    break # don't need to check any of the other experiments
-            # print timepoint down to nearest us, in units of ms:
-            tip = 't: %.3f ms\n' % event.xdata
-            tip += 'n%d: %d spikes' % (neuron.id, neuron.nspikes)
-            if currentexp == None:
-                tip += '\nno experiment'
-            else:
-                tip += '\nexperiment %s: %r' % (currentexp.id, currentexp.name)
-            self.tooltip.SetTip(tip) # update the tooltip
-            self.tooltip.Enable(True) # make sure it's enabled
-        else: # mouse is outside the axes
-            self.tooltip.Enable(False) # disable the tooltip
-
-    def _onkeypress(self, event):
-        """Called during a figure keypress"""
-        key = event.guiEvent.GetKeyCode() # wx dependent
-        #print(key)
-        # could also just use the backend-neutral event.key, but that doesn't recognize
-        # as many keypresses, like pgup, pgdn, etc.
-        if not event.guiEvent.ControlDown(): # Ctrl key isn't down, wx dependent
-            if key == wx.WXK_RIGHT: # pan right
-                self._panx(+0.1)
-            elif key == wx.WXK_LEFT: # pan left
-                self._panx(-0.1)
-            elif key == wx.WXK_UP: # zoom in
-                self._zoomx(1.2)
-            elif key == wx.WXK_DOWN: # zoom out
-                self._zoomx(1/1.2)
-            elif key == wx.WXK_NEXT: # PGDN (page right)
-                self._panx(+1)
-            elif key == wx.WXK_PRIOR: # PGUP (page left)
-                self._panx(-1)
-            elif key == wx.WXK_HOME: # go to start of first Experiment
-                self._panx(left=self.experimentmarkers[0])
-            elif key == wx.WXK_END: # go to end of last Experiment
-                self._panx(left=self.experimentmarkers[-1]-self.width)
-            elif key == ord('['): # skip backwards to previous jump point
-                # current position of left edge of the window in jumpts list:
-                i = self.jumpts.searchsorted(self.left, side='left')
-                i = max(0, i-1) # decrement by 1, do bounds checking
-                self._panx(left=self.jumpts[i])
-            elif key == ord(']'): # skip forwards to next jump point
-                # current position of left edge of the window in jumpts list:
-                i = self.jumpts.searchsorted(self.left, side='right')
-                i = min(i, len(self.jumpts)-1) # bounds checking
-                self._panx(left=self.jumpts[i])
-            elif key == wx.WXK_RETURN: # go to position
-                self._goto()
-            elif key == ord(','): # cycle tick formatter through thousands separators
-                self._cyclethousandssep()
-            elif key == ord('B'): # toggle plotting of bin edges
-                self._togglebinedges()
-        else: # Ctrl key is down
-            if key == wx.WXK_LEFT: # skip backwards to previous experiment marker
-                # current position of left edge of the window in experimentmarkers list:
-                i = self.experimentmarkers.searchsorted(self.left, side='left')
-                i = max(0, i-1) # decrement by 1, do bounds checking
-                self._panx(left=self.experimentmarkers[i])
-            elif key == wx.WXK_RIGHT: # skip forwards to next experiment marker
-                # current position of left edge of the window in experimentmarkers list:
-                i = self.experimentmarkers.searchsorted(self.left, side='right')
-                i = min(i, len(self.experimentmarkers)-1) # bounds checking
-                self._panx(left=self.experimentmarkers[i])
-            elif key == wx.WXK_UP: # zoom in faster
-                self._zoomx(3.0)
-            elif key == wx.WXK_DOWN: # zoom out faster
-                self._zoomx(1/3.0)
-    '''
+
 
 class Codes(object):
     """A 2D array where each row is a neuron code, and each column
@@ -761,7 +681,7 @@ class SpikeCorr(object):
     correlation from the unshifted value."""
     def __init__(self, source, tranges=None, width=None, tres=None,
                  shift=0, shiftcorrect=0, nidskind=None, R=None):
-        uns = get_ipython().user_ns
+        uns = config.get()
         recs, tracks = parse_source(source)
         nidss = get_nids(recs, tracks, kind=nidskind)
         self.recs, self.tracks, self.nidss = recs, tracks, nidss
@@ -825,7 +745,7 @@ class SpikeCorr(object):
             self.R = R
 
     def calc(self):
-        uns = get_ipython().user_ns
+        uns = config.get()
         corrs, counts, pairs = [], [], []
         if self.width != None:
             tranges = []
@@ -866,7 +786,7 @@ class SpikeCorr(object):
 
         # precalculate number of high states in each neuron's code:
         nhigh = np.zeros(nneurons, dtype=np.int64)
-        uns = get_ipython().user_ns
+        uns = config.get()
         if uns['CODEVALS'] != [0, 1]:
             raise RuntimeError("counting of high states assumes CODEVALS = [0, 1]")
         for nii0 in range(nneurons):
@@ -939,6 +859,13 @@ class SpikeCorr(object):
         pairs = np.asarray(pairs)
         return corrs, counts, pairs
 
+    def pair_laminarity(self, nids, pairs, inclusive=False):
+        """Return RGB colours and laminar indices of pairs, given as rows of indices into
+        nids, see core.pair_laminarity()"""
+        ## TODO: update for multiple tracks
+        geom = self.tracks[0].geometry
+        return geom.pair_laminarity(nids, pairs, inclusive=inclusive)
+
     def clear_codes(self):
         """Delete cached codes from all recordings"""
         for rec in self.recs:
@@ -1016,7 +943,7 @@ class SpikeCorr(object):
             stop += step # make stop end inclusive
         assert start < stop
         shifts = np.arange(start, stop, step) # shift values, in ms
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.calc() # run it once here to init self.nids and self.pairs
         c, supis, midis, deepis, otheris = self.pair_laminarity(self.nids, self.pairs)
         nsup, nmid, ndeep, nother = len(supis), len(midis), len(deepis), len(otheris)
@@ -1067,7 +994,7 @@ class SpikeCorr(object):
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
         # add info text to top/bottom right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(pos[0], pos[1], '%s\n'
                                'tres = %d ms\n'
@@ -1146,7 +1073,7 @@ class SpikeCorr(object):
             a.set_xlabel('correlation coefficient')
             
         # add stuff to top right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         if text:
             a.text(0.99, 0.99, '%s\n'
                                'mean = %.3f\n'
@@ -1205,7 +1132,7 @@ class SpikeCorr(object):
         self.median = np.median(corrs)
         self.stdev = np.std(corrs)
         # add stuff to top right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(0.99, 0.99, '%s\n'
                            'mean = %.3f\n'
@@ -1344,7 +1271,7 @@ class SpikeCorr(object):
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
         # add stuff to top left of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][tr.absname]
         a.text(0.01, 0.99, 'tres = %d ms\n'
                            'phase = %d deg\n'
@@ -1388,7 +1315,6 @@ class SpikeCorr(object):
         corrs = self.corrs
         pairs = self.pairs
         npairs = len(pairs)
-        n = self.r.n
 
         # identify pairs as superficial, middle, deep, or other:
         c, supis, midis, deepis, otheris = self.pair_laminarity(self.nids, pairs)
@@ -1402,11 +1328,8 @@ class SpikeCorr(object):
         deepcorrs = corrs[deepis]
         othercorrs = corrs[otheris]
 
-        # pairwise separations:
-        seps = np.zeros(npairs)
-        for i, pair in enumerate(pairs):
-            nid0, nid1 = nids[pair[0]], nids[pair[1]]
-            seps[i] = dist(n[nid0].pos, n[nid1].pos)
+        # pairwise separations, of all pairs at once:
+        seps = self.tracks[0].geometry.pairseps(nids, pairs)
         supseps = seps[supis]
         midseps = seps[midis]
         deepseps = seps[deepis]
@@ -1434,7 +1357,7 @@ class SpikeCorr(object):
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
         # add stuff to top right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(0.99, 0.99, '%s\n'
                            'tres = %d ms\n'
@@ -1478,7 +1401,6 @@ class SpikeCorr(object):
         corrs = self.corrs
         pairs = self.pairs
         npairs = len(pairs)
-        n = self.r.n
 
         # identify pairs as superficial, middle, deep, or other:
         c, supis, midis, deepis, otheris = self.pair_laminarity(self.nids, pairs)
@@ -1494,11 +1416,8 @@ class SpikeCorr(object):
         deepcorrs = allcorrs[deepis]
         othercorrs = allcorrs[otheris]
 
-        # pairwise separations:
-        allseps = np.zeros(npairs)
-        for i, pair in enumerate(pairs):
-            nid0, nid1 = nids[pair[0]], nids[pair[1]]
-            allseps[i] = dist(n[nid0].pos, n[nid1].pos)
+        # pairwise separations, of all pairs at once:
+        allseps = self.tracks[0].geometry.pairseps(nids, pairs)
         supseps = allseps[supis]
         midseps = allseps[midis]
         deepseps = allseps[deepis]
@@ -1546,7 +1465,7 @@ class SpikeCorr(object):
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
         # add stuff to top right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(0.99, 0.99, '%s\n'
                            'tres = %d ms\n'
@@ -1579,9 +1498,9 @@ class SpikeCorr(object):
         ## TODO: update for multiple tracks
         self.calc()
         assert len(np.unique(self.pairs)) == len(self.nids) # sanity check
-        n = self.r.n
+        geom = self.tracks[0].geometry
         # use just y position of each neuron:
-        pos = np.array([n[nid].pos[1] for nid in self.nids]) # nneurons position array (um)
+        pos = geom.pos[geom.nis(self.nids), 1] # nneurons position array (um)
         pos.shape = -1, 1 # make it 2D for pdist
         sep = pdist(pos) # 1D vector form, requires pairwise combinatorial indexing
         #sep = squareform(sep) # matrix form, with simple 2D indexing
@@ -1591,15 +1510,11 @@ class SpikeCorr(object):
         pairs = self.pairs[pairis]
         sep = sep[pairis] # keep only the relevant pair separation values
         npairs = len(pairs)
-        pairpos = np.zeros((npairs, 2))
-        for pairi, pair in enumerate(pairs):
-            nid0, nid1 = pair
-            pairpos[pairi] = np.mean([pos[nid0], pos[nid1]], axis=0) # mean position of pair
         corrs = self.corrs[pairis]
         
         f = pl.figure(figsize=figsize)
         a = f.add_subplot(111)
-        ypos = pairpos[:, 1]
+        ypos = pos[pairs, 0].mean(axis=1) # mean y position of each pair
         # this is only useful when connecting the dots using plot():
         '''
         sortis = ypos.argsort()
@@ -1644,7 +1559,7 @@ class SpikeCorr(object):
         time. method can be 'weighted mean', 'mean', 'median', 'max', 'min' or 'all'"""
         ## can this work over multiple tracks (ie multiple code arrays), or do I need to
         ## enforce only a single track?
-        uns = get_ipython().user_ns
+        uns = config.get()
         if self.width == None:
             self.width = intround(uns['SCWIDTH'] * 1000000) # convert from sec to us
         if self.tres == None:
@@ -1731,7 +1646,7 @@ class SpikeCorr(object):
         titlestr = lastcmd()
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(0.998, 0.99,
                '%s\n'
@@ -1744,12 +1659,14 @@ class SpikeCorr(object):
         a.legend(loc='upper left', handlelength=1, handletextpad=0.5, labelspacing=0.1)
         f.tight_layout(pad=0.3) # crop figure to contents
 
+    @cache.cached(state=lambda self: (cache.sortnames(self), self.nidss, self.tranges,
+                                      self.width, self.tres, cache.filterhists(self)))
     def si(self, method='mean', inclusive=False, sisource='lfp', kind=None, chani=-1,
            sirange=None, plot=True, layers=False, ms=5, figsize=(7.5, 6.5)):
         """Scatter plot spike correlations vs MUA or LFP synchrony index"""
         ## TODO: update for multiple recs
         rec = self.r
-        uns = get_ipython().user_ns
+        uns = config.get()
         #t0 = time.time()
 
         if sisource not in ['lfp', 'mua']:
@@ -1907,7 +1824,7 @@ class SpikeCorr(object):
         titlestr = lastcmd()
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.r.tr.absname]
         a.text(0.998, 0.99,
                '%s\n'
@@ -1921,94 +1838,6 @@ class SpikeCorr(object):
         f.tight_layout(pad=0.3) # crop figure to contents
 
 
-class NeuropyWindow(QtGui.QMainWindow):
-    """Base class for all of neuropy's tool windows"""
-    def __init__(self, parent=None):
-        QtGui.QMainWindow.__init__(self, parent)
-        self.maximized = False
-
-    def keyPressEvent(self, event):
-        key = event.key()
-        if key == Qt.Key_F11:
-            self.toggleMaximized()
-        else:
-            QtGui.QMainWindow.keyPressEvent(self, event) # pass it on
-
-    def mouseDoubleClickEvent(self, event):
-        """Doesn't catch window titlebar doubleclicks for some reason (window manager
-        catches them?). Have to doubleclick on a part of the window with no widgets in it"""
-        self.toggleMaximized()
-
-    def toggleMaximized(self):
-        if not self.maximized:
-            self.normalPos, self.normalSize = self.pos(), self.size()
-            dw = QtGui.QDesktopWidget()
-            rect = dw.availableGeometry(self)
-            self.setGeometry(rect)
-            self.maximized = True
-        else: # restore
-            self.resize(self.normalSize)
-            self.move(self.normalPos)
-            self.maximized = False
-
-
-class RevCorrWindow(NeuropyWindow):
-    def __init__(self, parent=None, title='RevCorrWindow', rfs=None,
-                 nids=None, ts=None, scale=2.0, blanksize=(32, 32)):
-        NeuropyWindow.__init__(self, parent)
-        self.title = title
-        self.rfs = rfs
-        self.nids = nids
-        self.ts = ts
-        self.scale = scale # setting to non-integer will give uneven sized pixels
-
-        cmap = mpl.cm.jet(np.arange(256), alpha=None, bytes=True) # 8 bit RGBA colormap
-        # from Qt docs, need to use ARGB format:
-        # http://qt-project.org/doc/qt-4.8/qimage.html#image-formats
-        # convert to 8 bit ARGB colormap, but due to little-endianness, need to arrange
-        # array columns in reverse BGRA order:
-        cmap[:, [0, 1, 2, 3]] = cmap[:, [2, 1, 0, 3]]
-        colortable = cmap.view(dtype=np.uint32).ravel().tolist() # QVector<QRgb> colors
-        layout = QtGui.QGridLayout() # can set vert and horiz spacing
-        #layout.setContentsMargins(0, 0, 0, 0) # doesn't seem to do anything
-
-        # place time labels along top
-        for ti, t in enumerate(ts):
-            label = QtGui.QLabel(str(t))
-            layout.addWidget(label, 0, ti+1)
-        # plot each row, with its nid label
-        for ni, nid in enumerate(nids):
-            label = QtGui.QLabel('n'+str(nid)) # nid label on left
-            label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            layout.addWidget(label, ni+1, 0)
-            rf = rfs[ni]
-            for ti, t in enumerate(ts):
-                #data = np.uint8(np.random.randint(0, 255, size=(height, width)))
-                if rf == None:
-                    data = np.zeros(blanksize, dtype=np.uint8) # blank placeholder rf
-                else:
-                    data = rf[ti]
-                width, height = data.shape
-                image = QImage(data.data, width, height, QImage.Format_Indexed8)
-                image.ndarray = data # hold a ref, prevent gc
-                image.setColorTable(colortable)
-                image = image.scaled(QSize(scale*width, scale*height)) # scale it
-                pixmap = QPixmap.fromImage(image)
-                label = QtGui.QLabel()
-                label.setPixmap(pixmap)
-                layout.addWidget(label, ni+1, ti+1) # can also control alignment
-
-        mainwidget = QtGui.QWidget(self)
-        mainwidget.setLayout(layout)
-
-        scrollarea = QtGui.QScrollArea()
-        scrollarea.setWidget(mainwidget)
-
-        self.setCentralWidget(scrollarea)
-        self.setWindowTitle(title)
-        #palette = QPalette(QColor(255, 255, 255))
-        #self.setPalette(palette) # set white background, or perhaps more
-
 def mplrevcorr(title='RevCorrWindow', rfs=None, nids=None, ts=None, scale=2, dpi=100,
                margins=True):
     """MPL version of RevCorrWindow, good for saving RFs to a file. This one uses figimage to
@@ -2291,74 +2120,6 @@ class Ising(object):
         # (Or substitute "x.encode('latin-1')" if you have a primitive terminal.)
         '''
 
-class NeuropyScalarFormatter(mpl.ticker.ScalarFormatter):
-    """Overloaded from mpl.ticker.ScalarFormatter for 4 reasons:
-    1) turn off stupid offset
-    2) increase maximum possible number of sigfigs
-    3) increase +ve and -ve order of magnitude thresholds before switching to scientific
-       notation
-    4) keep exponents in engineering notation, ie multiples of 3
-    """
-    def __init__(self, useOffset=False, useMathText=False):
-        # useOffset allows plotting small data ranges with large offsets:
-        # for example: [1+1e-9,1+2e-9,1+3e-9]
-        # useMathText will render the offset an scientific notation in mathtext
-        # can't use this, because derived from an old-style class:
-        #super(NeuropyScalarFormatter, self).__init__(useOffset=useOffset,
-        #                                             useMathText=useMathText)
-        mpl.ticker.ScalarFormatter.__init__(self, useOffset=useOffset, useMathText=useMathText)
-        self.thousandsSep = '' # default to not using a thousands separator
-
-    def _set_orderOfMagnitude(self, range):
-        # if scientific notation is to be used, find the appropriate exponent
-        # if using an numerical offset, find the exponent after applying the offset
-        locs = np.absolute(self.locs)
-        if self.offset: oom = math.floor(math.log10(range))
-        else:
-            if locs[0] > locs[-1]: val = locs[0]
-            else: val = locs[-1]
-            if val == 0: oom = 0
-            else: oom = math.floor(math.log10(val))
-        if oom < -3: # decreased -ve threshold for sci notation
-            # stick to engineering notation, multiples of 3:
-            self.orderOfMagnitude = (oom // 3)*3
-        elif oom > 6: # increased +ve threshold for sci notation
-            # stick to engineering notation, multiples of 3:
-            self.orderOfMagnitude = (oom // 3)*3
-        else:
-            self.orderOfMagnitude = 0
-
-    def _set_format(self):
-        # set the format string to format all the ticklabels
-        locs = (np.array(self.locs)-self.offset) / 10**self.orderOfMagnitude+1e-15
-        # '%1.3f' changed to '%1.10f' to increase maximum number of possible sigfigs:
-        sigfigs = [len(str('%1.10f'% loc).split('.')[1].rstrip('0')) for loc in locs]
-        sigfigs.sort()
-        self.format = '%1.' + str(sigfigs[-1]) + 'f'
-        if self._usetex or self._useMathText: self.format = '$%s$'%self.format
-
-    def pprint_val(self, x):
-        xp = (x-self.offset)/10**self.orderOfMagnitude
-        if np.absolute(xp) < 1e-8: xp = 0
-        s = self.format % xp
-        if self.thousandsSep: # add thousands-separating characters
-            if s.count('.'): # it's got a decimal in there
-                # use the regexp for floats:
-                s = re.sub(r'(?<=\d)(?=(\d\d\d)+\.)', self.thousandsSep, s)
-            else: # it's an int
-                # use the regexp for ints:
-                s = re.sub(r'(?<=\d)(?=(\d\d\d)+$)', self.thousandsSep, s)
-        return s
-
-
-class NeuropyAutoLocator(mpl.ticker.MaxNLocator):
-    """A tick autolocator that generates more ticks than the standard mpl autolocator"""
-    def __init__(self):
-        # standard autolocator:
-        #mpl.ticker.MaxNLocator.__init__(self, nbins=9, steps=[1, 2, 5, 10])
-        mpl.ticker.MaxNLocator.__init__(self) # use MaxNLocator's defaults instead
-
-
 def fix_minor_log_ticks(ax):
     """Fix minor ticks sometimes missing on a log scale due to them exceeding MPL's
     default tick count limit.
@@ -2373,7 +2134,7 @@ def fix_minor_log_ticks(ax):
 def getargstr(obj):
     """Returns object's argument list as a string. Stolen from wx.py package?"""
     import inspect
-    argstr = inspect.formatargspec(*inspect.getargspec(obj))
+    argstr = str(inspect.signature(obj)) # formatargspec is gone in Python >= 3.11
     if inspect.isfunction(obj):
         pass
     elif inspect.ismethod(obj):
@@ -3006,7 +2767,7 @@ def combs(objects, r=2):
     assert r <= n
     i = np.asarray([0]*r)
     # stores all combinations, will be a 1D array of arrays:
-    combs = np.empty(nCr(n, r), dtype=np.object)
+    combs = np.empty(nCr(n, r), dtype=object)
     combi = -1
 
     code = ''
@@ -3067,36 +2828,104 @@ def argcombs(objects, r=2):
                 argcombs[combi, :] = i
     '''
 
-def nCrsamples(objects, r, nsamples=None):
-    """Returns a list of nsamples unique samples, each of length r, sampled from objects"""
-    nobjects = len(objects)
-    maxnsamples = nCr(nobjects, r)
+def nCrsamples(objects, r, nsamples=None, seed=None):
+    """Returns a list of nsamples unique samples, each of length r, sampled from objects.
+    For r == 1, returns a flat list of objects. See combsamples() for the array version"""
+    samples = combsamples(objects, r, nsamples=nsamples, seed=seed)
+    if r == 1: # we're just choosing one item from objects at a time
+        samples = samples.ravel()
+    return samples.tolist()
+
+def combsamples(objects, r, nsamples=None, seed=None, method='auto'):
+    """Returns an (nsamples, r) array of unique random combinations of r objects each,
+    without replacement, in random order. Each row is sorted by object value, to remove
+    permutations, as in sortedsample(). The sampling method
+    depends on how close nsamples is to nCr:
+
+    'enum': enumerate all nCr combinations using combs() and pick nsamples rows from them.
+            Used when nsamples is at least half of nCr
+    'dedup': draw random sorted index tuples and reject duplicates using a set. Used when
+             nsamples is tiny compared to nCr, so that collisions are rare
+    'unrank': draw nsamples distinct ranks in range(nCr) using Floyd's algorithm, and
+              unrank each one into its combination using the combinatorial number system.
+              Never needs to retry, used for everything in between
+
+    seed makes the result reproducible"""
+    objects = np.asarray(objects)
+    n = len(objects)
+    maxnsamples = nCr(n, r)
     if nsamples == None:
         nsamples = maxnsamples # return all possible combinations
     if nsamples > maxnsamples:
         # make sure we're not being asked for more than the maximum possible number of
         # unique samples
         raise ValueError('requested unique nsamples (%d) is larger than nobjects choose '
-                         'r (%d C %d == %d)' % (nsamples, nobjects, r, maxnsamples))
-    # Don't use an exhaustive table, because generating it and then sampling it almost
-    # always takes longer than just picking combs at random and making sure they're unique
-    '''
-    if maxnsamples < something:
-        # generate a table of all possible combinations, and then just pick nsamples from
-        # it without replacement
-        table = combs(objects, r)
-        samples = random.sample(table, nsamples)
-    '''
-    if r == 1: # we're just choosing one item from objects at a time
-        samples = random.sample(objects, nsamples)
-    else: # sample at random and make sure each sample is unique:
-        samples = []
-        for samplei in range(nsamples):
-            sample = sortedsample(objects, r)
-            while sample in samples: # repeat until a unique one is found
-                sample = sortedsample(objects, r)
-            samples.append(sample)
-    return samples
+                         'r (%d C %d == %d)' % (nsamples, n, r, maxnsamples))
+    rng = random.Random(seed) # Python ints, so ranks can exceed int64
+    if method == 'auto':
+        if 2*nsamples >= maxnsamples:
+            method = 'enum'
+        elif nsamples**2 <= maxnsamples: # expect fewer than 1 collision per 2 samples
+            method = 'dedup'
+        else:
+            method = 'unrank'
+    if nsamples == 0:
+        iss = np.empty((0, r), dtype=np.int64)
+    elif method == 'enum':
+        allcombs = np.vstack(combs(np.arange(n), r)) # maxnsamples x r, in rank order
+        iss = allcombs[rng.sample(range(maxnsamples), nsamples)]
+    elif method == 'dedup':
+        samples = set()
+        population = range(n)
+        while len(samples) < nsamples:
+            samples.add(tuple(sorted(rng.sample(population, r))))
+        iss = np.array(sorted(samples), dtype=np.int64).reshape(nsamples, r)
+    elif method == 'unrank':
+        # Floyd's algorithm, picks nsamples distinct ranks uniformly in O(nsamples):
+        ranks = set()
+        for j in range(maxnsamples-nsamples, maxnsamples):
+            rank = rng.randrange(j+1)
+            ranks.add(j if rank in ranks else rank)
+        binom = binomtable(n, r)
+        iss = np.array([ unrankcomb(rank, n, r, binom) for rank in sorted(ranks) ],
+                       dtype=np.int64).reshape(nsamples, r)
+    else:
+        raise ValueError('unknown method %r' % method)
+    # sort each sample by object value rather than by index, and return samples in random
+    # order rather than in rank order, like the old sortedsample() rejection loop did:
+    samples = np.sort(objects[iss], axis=1)
+    order = list(range(nsamples))
+    rng.shuffle(order)
+    return samples[order]
+
+def unrankcomb(rank, n, r, binom=None):
+    """Return the sorted list of r indices into range(n) that is the rank'th combination
+    in lexicographic order, the same order as combs(range(n), r). binom is an optional
+    table from binomtable(n, r), to save recalculating it for every rank"""
+    if binom == None:
+        binom = binomtable(n, r)
+    # count down from the lexicographically last combination, whose rank is nCr - 1, so
+    # that the combinatorial number system can be used directly:
+    x = binom[n][r] - 1 - rank
+    comb = []
+    c = n
+    for k in range(r, 0, -1):
+        # find largest c such that nCr(c, k) <= x, nCr(c, k) == 0 for c < k:
+        c -= 1
+        while binom[c][k] > x:
+            c -= 1
+        x -= binom[c][k]
+        comb.append(n - 1 - c)
+    return comb
+
+def binomtable(n, r):
+    """Return nested lists of Python ints such that binom[m][k] == nCr(m, k) for all m <=
+    n and k <= r, with 0 for k > m. Built up using Pascal's triangle"""
+    binom = [[1] + [0]*r]
+    for m in range(1, n+1):
+        prev = binom[-1]
+        binom.append([1] + [ prev[k-1] + prev[k] for k in range(1, r+1) ])
+    return binom
 
 def sortedsample(objects, r):
     """Randomly sample r things from objects, sorting the result to remove permutations"""
@@ -3215,22 +3044,12 @@ def MI(XY):
     """Given the joint PDF of two variables, return the mutual information (in bits)
     between the two.
     I = sum_X sum_Y P(x, y) * log2( P(x, y) / (P(x) * P(y)) )
-    where P(x) and P(y) are the marginal distributions taken from the joint
-    Is this slow? Needs optimization? Already implemented in scipy?"""
+    where P(x) and P(y) are the marginal distributions taken from the joint. Terms with
+    P(x, y) == 0 or P(x) * P(y) == 0 are skipped. See info.MI for the batched version"""
     XY = np.asarray(XY)
     assert XY.ndim == 2
     XY = ensurenormed(XY)
-    # calculate the marginal probability distributions for X and Y from the joint
-    X = XY.sum(axis=1) # sum over the rows of the joint, get a vector nrows long
-    Y = XY.sum(axis=0) # sum over the cols of the joint, get a vector ncols long
-    I = 0.0
-    for xi, x in enumerate(X):
-        for yi, y in enumerate(Y):
-            if XY[xi, yi] == 0 or (x * y) == 0: # avoid singularities
-                pass # just skip it, assume info contributed is 0 (?????????????????)
-            else:
-                I += XY[xi, yi] * np.log2( XY[xi, yi] / (x * y) )
-    return I
+    return info.MI(XY)[0]
 
 def MIbinarrays(Nbinarray=None, Mbinarray=None, verbose=False):
     """Calculates information that N cells provide about M cells (ie,
@@ -3247,28 +3066,18 @@ def MIbinarrays(Nbinarray=None, Mbinarray=None, verbose=False):
     # (0 and 1)
     # values 0 to 2**N - 1, plus 2**N which is needed as the rightmost bin edge for
     # histogram2d:
-    xedges = np.arange(2**N+1) # include rightmost edge
-    yedges = np.arange(2**M+1) # include rightmost edge
-    bins = [xedges, yedges]
-    # generate joint pdf, *edgesout exclude rightmost edge:
-    jpdf, xedgesout, yedgesout = pmf2d(Nintcodes, Mintcodes, bins)
+    # a single bincount over flattened (N word, M word) indices gives the joint counts:
+    jpdf = info.jointcounts(Nintcodes, Mintcodes, 2**N, 2**M)[0]
+    jpdf = jpdf / float(jpdf.sum())
     #print('jpdf\n', jpdf.__repr__())
     #print('jpdf.sum()', jpdf.sum())
-    assert (np.float64(xedges)[:-1] == xedgesout).all() # sanity check
-    assert (np.float64(yedges)[:-1] == yedgesout).all()
-    # pdf of N cells
-    #Npdf, Nedges = pmf(Nintcodes, bins=range(2**N + 1))
-    #print('first 100 Npdf\n', Npdf[:100].__repr__())
-    # pdf of M cells
-    #Mpdf, Medges = pmf(Mintcodes, bins=range(2**M + 1))
-    #print('first 100 Mpdf\n', Mpdf[:100].__repr__())
     marginalMpdf = jpdf.sum(axis=0)
     # make sure what you get from the joint is what you get when just building up the
     # pdf straight up on its own:
     #assert approx(Mpdf, marginalMpdf).all()
     I = MI(jpdf)
     # mutual info as fraction of entropy in M group of cells:
-    IdivS = I / entropy(marginalMpdf)
+    IdivS = I / info.entropy(marginalMpdf)[0]
     if verbose:
         print('nids', nids)
         print('mids', mids)
@@ -3287,20 +3096,18 @@ def MIbinarrays(Nbinarray=None, Mbinarray=None, verbose=False):
 
 def DKL(p, q):
     """Kullback-Leibler divergence from true probability distribution p
-    to arbitrary distribution q"""
+    to arbitrary distribution q. See info.DKL for the batched version"""
     assert len(p) == len(q)
     p = ensurenormed(p)
     q = ensurenormed(q)
     # avoid singularities:
-    return sum([ pi * np.log2(pi/float(qi)) for pi, qi in zip(p, q) if pi != 0 and qi != 0 ] ) 
+    return info.DKL(p, q)[0]
 
 def DJS(p, q):
     """Jensen-Shannon divergence, a symmetric measure of divergence between
-    distributions p and q"""
-    p = np.asarray(p) # required for adding p and q
-    q = np.asarray(q)
-    m = 1 / 2.0 * (p + q)
-    return 1 / 2.0 * ( DKL(p, m) + DKL(q, m) )
+    distributions p and q. See info.DJS for the batched version. p and q are normalized
+    to sum to 1 first, so they can also be counts"""
+    return info.DJS(p, q)[0]
 
 def lstrip(s, strip):
     """What I think str.lstrip should really do"""
@@ -3404,7 +3211,7 @@ def split_tranges(tranges, width, tres):
 def laminarity(ypos, trackabsname):
     """Return boolean arrays indicating whether depths ypos are superficial, middle,
     or deep layer (or none of the above)"""
-    uns = get_ipython().user_ns
+    uns = config.get()
     try:
         (sup0, sup1), (mid0, mid1), (deep0, deep1) = uns['LAYERS'][trackabsname]
     except KeyError: # trackabsname doesn't exist as key in LAYERS global
@@ -3417,43 +3224,51 @@ def laminarity(ypos, trackabsname):
     #otheris = not(supis + midis + deepis) # True values are other, not needed
     return supis, midis, deepis
 
+SUP, MID, DEEP, OTHER = range(4) # layer labels, see layers()
+
+def layers(ypos, trackabsname):
+    """Return integer layer label of each of depths ypos: SUP, MID, DEEP, or OTHER if
+    none of the above. Where layers overlap, the deeper one wins"""
+    supis, midis, deepis = laminarity(np.asarray(ypos), trackabsname)
+    labels = np.full(len(supis), OTHER)
+    labels[supis], labels[midis], labels[deepis] = SUP, MID, DEEP
+    return labels
+
+def pairlayers(labels, pairs, inclusive=False):
+    """Return layer label of each of pairs, given as rows of indices into layer labels:
+    the layer that both cells are in, or OTHER. If inclusive, label a pair as being in
+    the deepest layer that *either* of its cells is in, or OTHER if neither is in any"""
+    labels = np.asarray(labels)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    l0, l1 = labels[pairs[:, 0]], labels[pairs[:, 1]]
+    if not inclusive:
+        return np.where(l0 == l1, l0, OTHER)
+    # OTHER is the highest label, so mask it out before taking the deeper of each pair:
+    l0, l1 = np.where(l0 == OTHER, -1, l0), np.where(l1 == OTHER, -1, l1)
+    codes = np.maximum(l0, l1)
+    codes[codes == -1] = OTHER
+    return codes
+
+def laminarpairs(codes):
+    """Return RGB colours of pairs with layer labels codes (red, green, blue and yellow for
+    superficial, middle, deep and other), and indices of superficial, middle, deep and
+    other pairs"""
+    cc = mpl.colors.colorConverter
+    rgbs = np.array([ cc.to_rgb(colour) for colour in 'rgby' ]) # indexed by layer label
+    codes = np.asarray(codes)
+    c = rgbs[codes].reshape(-1, 3)
+    supis, midis, deepis, otheris = [ np.where(codes == label)[0]
+                                      for label in (SUP, MID, DEEP, OTHER) ]
+    return c, supis, midis, deepis, otheris
+
 def pair_laminarity(nids, ypos, trackabsname, pairs, inclusive=False):
     """Color cell pairs according to whether they're superficial, deep, or other. If
     inclusive, label a pair as superficial if *either* of the cells are superficial. Ditto
-    for deep. This means many pairs will be counted as both superficial and deep.
-    Return RGB colours and indices into self.pairs"""
-    # y positions of all nids:
-    supis, midis, deepis = laminarity(ypos, trackabsname)
-    npairs = len(pairs)
-    c = np.empty((npairs, 3), dtype=float) # color RGB array
-    cc = mpl.colors.colorConverter
-    REDRGB = cc.to_rgb('r')
-    GREENRGB = cc.to_rgb('g')
-    BLUERGB = cc.to_rgb('b')
-    YELLOWRGB = cc.to_rgb('y')
-    c[:] = YELLOWRGB # init to yellow, other pairs remain yellow
-    if inclusive:
-        for i, (ni0, ni1) in enumerate(pairs):
-            if supis[ni0] or supis[ni1]:
-                c[i] = REDRGB # at least one cell is superficial
-            if midis[ni0] or midis[ni1]:
-                c[i] = GREENRGB # at least one cell is middle
-            if deepis[ni0] or deepis[ni1]:
-                c[i] = BLUERGB # at least one cell is deep
-    else:
-        for i, (ni0, ni1) in enumerate(pairs):
-            if supis[ni0] and supis[ni1]:
-                c[i] = REDRGB # both cells are superficial
-            if midis[ni0] and midis[ni1]:
-                c[i] = GREENRGB # both cells are middle
-            if deepis[ni0] and deepis[ni1]:
-                c[i] = BLUERGB # both cells are deep
-    # overwrite boolean neuron indices with boolean pair indices:
-    supis, = np.where((c == REDRGB).all(axis=1))
-    midis, = np.where((c == GREENRGB).all(axis=1))
-    deepis, = np.where((c == BLUERGB).all(axis=1))
-    otheris, = np.where((c == YELLOWRGB).all(axis=1))
-    return c, supis, midis, deepis, otheris
+    for deep. Return RGB colours and indices into pairs, see laminarpairs(). Pairs are rows
+    of indices into nids and their depths ypos. All pairs are labelled at once, see
+    pairlayers()"""
+    codes = pairlayers(layers(ypos, trackabsname), pairs, inclusive=inclusive)
+    return laminarpairs(codes)
 
 def rainbow_text(a, x, y, words, colors, **kwargs):
     """
@@ -3549,7 +3364,7 @@ def parse_source(source):
     track:rid keyvals. Return all collected recordings in a list, as well as the set of all
     associated tracks. Both are sorted in order of their absnames"""
     from track import Track # do this here to prevent circular import
-    uns = get_ipython().user_ns
+    uns = config.get()
     if type(source) == Track:
         rids = uns['BSMSNSDBRIDS'][source.absname]
         recs = [ source.r[rid] for rid in rids ]
@@ -3559,7 +3374,7 @@ def parse_source(source):
         recs = []
         for animal_track, rids in source.items():
             animalname, trackname = animal_track.split('.')
-            tr = uns[animalname].__getattribute__(trackname)
+            tr = get_ipython().user_ns[animalname].__getattribute__(trackname) # not config
             recs.extend([ tr.r[rid] for rid in rids ])
     else:
         raise ValueError('unknown source type %r' % type(source))
@@ -3625,7 +3440,7 @@ def get_nids(recs, tracks, kind=None):
 
     # kind is 'active' or 'quiet'
     nidss = []
-    uns = get_ipython().user_ns
+    uns = config.get()
     MINRATE = uns['MINRATE']
     totaldtsec = 0.0
     for track in tracks:
@@ -0,0 +1,61 @@
+"""Population coupling of many neurons at once: the correlation of each neuron's signal,
+such as its PSTH, with the leave-one-out population rate, i.e. the summed rate of all the
+other neurons in the population. Instead of recalculating the population rate once per
+neuron, calculate each neuron's own rate once, sum them once, and subtract each neuron's
+own rate from the total. Couplings of all neurons then come from a single z-scored
+matrix-vector product, and shuffled couplings at random circular lags from a single FFT
+cross-correlation of all neurons, for O(nn * nt) instead of O(nn**2 * nt) cost"""
+
+import numpy as np
+
+import paircorr
+
+
+def _center(x, total, own):
+    """Return z-scored rows of x, and mean-subtracted total and own rates"""
+    zx = paircorr.zscore(x, dtype=np.float64) # unit norm rows
+    total = np.asarray(total, dtype=np.float64)
+    own = np.asarray(own, dtype=np.float64)
+    pc = total - total.mean()
+    oc = own - own.mean(axis=1, keepdims=True)
+    # norm of each neuron's mean-subtracted leave-one-out rate, pc - oc[i], without ever
+    # building them:
+    norms = np.sqrt(np.maximum(pc @ pc - 2 * (oc @ pc) + (oc**2).sum(axis=1), 0))
+    return zx, pc, oc, norms
+
+def couplings(x, total, own):
+    """Return correlation of each row of x with its leave-one-out population rate, total -
+    own[i]. x and own are (nn, nt), total is (nt,). Rows of own of neurons that aren't part
+    of the population should be 0. Undefined couplings are NaN"""
+    zx, pc, oc, norms = _center(x, total, own)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (zx @ pc - (zx * oc).sum(axis=1)) / norms
+
+def lagcouplings(x, total, own):
+    """Return (nn, nt) array of couplings of each row of x with its leave-one-out
+    population rate circularly shifted by each possible lag. Lag 0 is the actual
+    coupling, see couplings(). Circular shifts don't change the mean or norm of the
+    population rate, so all lags of all neurons come from one FFT cross-correlation"""
+    zx, pc, oc, norms = _center(x, total, own)
+    nt = zx.shape[1]
+    fx = np.conj(np.fft.rfft(np.nan_to_num(zx), axis=1))
+    loo = np.fft.rfft(pc)[np.newaxis] - np.fft.rfft(oc, axis=1) # leave-one-out, in freq
+    # num[i, k] = sum over t of zx[i, t] * (pc - oc[i])[(t + k) % nt]:
+    num = np.fft.irfft(fx * loo, n=nt, axis=1)
+    num[np.isnan(zx).any(axis=1)] = np.nan # keep undefined couplings undefined
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return num / norms[:, np.newaxis]
+
+def randlags(nt, nshuffles, minlag=1):
+    """Return nshuffles random circular lags of nt timepoints, at least minlag timepoints
+    away from lag 0 in both directions"""
+    if nt - minlag < minlag:
+        raise ValueError("nt=%d is too short for minlag=%d" % (nt, minlag))
+    return np.random.randint(minlag, nt - minlag + 1, size=nshuffles)
+
+def shufflecouplings(x, total, own, nshuffles, minlag=1):
+    """Return (nn, nshuffles) array of shuffled couplings of each row of x, each at the
+    same random circular lag of the leave-one-out population rate for all neurons, as a
+    baseline for couplings()"""
+    lags = randlags(x.shape[1], nshuffles, minlag=minlag)
+    return lagcouplings(x, total, own)[:, lags]
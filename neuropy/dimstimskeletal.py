@@ -8,7 +8,9 @@ from io import StringIO
 
 import numpy as np
 
+import config
 import core
+import moviestats
 from core import dictattr, TAB
 
 
@@ -275,37 +277,47 @@ class BlankScreen(Experiment):
 
 
 class Movie(Experiment):
-    def load(self, asarray=False, flip=True):
-        """Load movie frames"""
+    def get_fullfname(self):
+        """Return full local path to the movie file, using MOVIEPATH"""
         # figure out the local path to the same movie file:
         pathparts = core.pathdecomp(self.static.fname) # as it existed on the stim computer
         movi = pathparts.index('mov')
         tail = os.path.join(*pathparts[movi+1:]) # everything after 'mov' folder
-        MOVIEPATH = get_ipython().user_ns['MOVIEPATH']
-        fullfname = os.path.join(MOVIEPATH, tail) # full fname with local MOVIEPATH
-        with open(fullfname, 'rb') as self.f: # open movie file for reading in binary format
-            headerstring = self.f.read(5)
-            if headerstring == 'movie': # start of file has a header
-                self.ncellswide, = struct.unpack('H', self.f.read(2)) # 'H': unsigned short int
-                self.ncellshigh, = struct.unpack('H', self.f.read(2))
-                self.nframes, = struct.unpack('H', self.f.read(2))
-                if self.nframes == 0:
-                    # this was used in ptc15 mseq movies to indicate 2**16 frames, shouldn't
-                    # really worry about this, since we're using slightly modified mseq movies
-                    # now that don't have the extra frame at the end that the ptc15 movies had
-                    # (see comment in Experiment module), and therefore never have a need to
-                    # indicate 2**16 frames
-                    self.nframes = 2**16
-                self.offset = self.f.tell() # header is 11 bytes long
-            else:
-                # no header at the start of the file, set the file pointer back to the
-                # beginning and use these hard coded values:
-                self.f.seek(0)
-                self.ncellswide = self.ncellshigh = 64
-                self.nframes = 6000
-                self.offset = self.f.tell() # header is 0 bytes long
-            self.framesize = self.ncellshigh*self.ncellswide
+        MOVIEPATH = config.get()['MOVIEPATH']
+        return os.path.join(MOVIEPATH, tail) # full fname with local MOVIEPATH
+
+    fullfname = property(get_fullfname)
+
+    def _read_header(self, f):
+        """Read movie header from open file f, set ncellswide, ncellshigh, nframes, offset
+        and framesize, leave f positioned at the start of the first frame"""
+        headerstring = f.read(5)
+        if headerstring == b'movie': # start of file has a header
+            self.ncellswide, = struct.unpack('H', f.read(2)) # 'H': unsigned short int
+            self.ncellshigh, = struct.unpack('H', f.read(2))
+            self.nframes, = struct.unpack('H', f.read(2))
+            if self.nframes == 0:
+                # this was used in ptc15 mseq movies to indicate 2**16 frames, shouldn't
+                # really worry about this, since we're using slightly modified mseq movies
+                # now that don't have the extra frame at the end that the ptc15 movies had
+                # (see comment in Experiment module), and therefore never have a need to
+                # indicate 2**16 frames
+                self.nframes = 2**16
+            self.offset = f.tell() # header is 11 bytes long
+        else:
+            # no header at the start of the file, set the file pointer back to the
+            # beginning and use these hard coded values:
+            f.seek(0)
+            self.ncellswide = self.ncellshigh = 64
+            self.nframes = 6000
+            self.offset = f.tell() # header is 0 bytes long
+        self.framesize = self.ncellshigh*self.ncellswide
 
+    def load(self, asarray=False, flip=True):
+        """Load movie frames"""
+        fullfname = self.fullfname
+        with open(fullfname, 'rb') as self.f: # open movie file for reading in binary format
+            self._read_header(self.f)
             # read in all of the frames. Maybe check first to see if file is > 1GB. If so,
             # _loadaslist() to prevent trying to allocate one huge piece of contiguous memory
             # and raising a MemoryError:
@@ -314,7 +326,7 @@ class Movie(Experiment):
             else:
                 self._loadaslist(flip=flip)
             leftover = self.f.read() # check if there are any leftover bytes in the file
-            if leftover != '':
+            if leftover != b'':
                 print(leftover)
                 print(self.ncellswide, self.ncellshigh, self.nframes)
                 raise RuntimeError('Unread bytes in movie file %r. Width, height, or nframes '
@@ -335,3 +347,68 @@ class Movie(Experiment):
             if flip:
                 frame = frame[::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
             self.frames.append(frame)
+
+    def memmap(self, flip=False):
+        """Return read-only memory-mapped (nframes, height, width) uint8 movie frames,
+        without reading any of them into memory. The memmap is shared with the Movie
+        registered in MOVIES under the same movie file name, so that the same file is
+        never mapped or read more than once per process, no matter how many experiments
+        displayed it"""
+        fname = os.path.split(self.static.fname)[-1] # pathless fname, as used in MOVIES
+        MOVIES = config.get()['MOVIES']
+        movie = MOVIES.get(fname, self) # the registered Movie, if any
+        try:
+            frames = movie._memmap
+        except AttributeError: # hasn't been mapped yet
+            with open(movie.fullfname, 'rb') as f:
+                movie._read_header(f)
+            frames = np.memmap(movie.fullfname, dtype=np.uint8, mode='r',
+                               offset=movie.offset,
+                               shape=(movie.nframes, movie.ncellshigh, movie.ncellswide))
+            movie._memmap = frames
+        if movie is not self: # copy over header values and share the memmap
+            self.ncellswide, self.ncellshigh = movie.ncellswide, movie.ncellshigh
+            self.nframes, self.offset = movie.nframes, movie.offset
+            self.framesize = movie.framesize
+            self._memmap = frames
+        if flip:
+            frames = frames[::, ::-1, ::] # flip all frames vertically, a view
+        return frames
+
+    def stats(self, frameis=None, crop=None, flip=True, nprocs=None):
+        """Return dict of per-frame global motion (pix/frame, one per successive pair of
+        frames), contrast and luminance of frames frameis (default: all), calculated in
+        parallel on first call, and cached to disk per movie file, see moviestats.py. crop
+        is an optional ((y0, y1), (x0, x1)) tuple of cell ranges to keep, after flipping"""
+        return moviestats.get(self, frameis=frameis, crop=crop, flip=flip, nprocs=nprocs)
+
+    def iterframes(self, start=0, stop=None, chunksize=1000, crop=None, downsample=1,
+                   flip=False):
+        """Iterate over frames in range(start, stop), chunksize frames at a time, reading
+        them from the memmap. Yields (framei, frames) tuples, where framei is the index of
+        the first frame in the chunk. crop is an optional ((y0, y1), (x0, x1)) tuple of
+        cell ranges to keep. downsample is an integer factor by which to spatially
+        downsample each frame, by averaging over downsample x downsample blocks of cells.
+        Cropping is done before downsampling. Chunks are copied into memory as uint8, or
+        as float32 if downsampled, so memory use is bounded by chunksize"""
+        allframes = self.memmap(flip=flip)
+        if stop == None:
+            stop = len(allframes)
+        for framei in range(start, stop, chunksize):
+            frames = allframes[framei:min(framei+chunksize, stop)]
+            yield framei, self.resize(frames, crop=crop, downsample=downsample)
+
+    def resize(self, frames, crop=None, downsample=1):
+        """Return a copy of (nframes, height, width) frames, optionally cropped and
+        spatially downsampled. See iterframes()"""
+        if crop != None:
+            (y0, y1), (x0, x1) = crop
+            frames = frames[:, y0:y1, x0:x1]
+        if downsample == 1:
+            return np.array(frames) # copy, pulls frames into memory if memmapped
+        ds = downsample
+        nframes, height, width = frames.shape
+        height, width = height // ds * ds, width // ds * ds # drop any partial blocks
+        frames = np.float32(frames[:, :height, :width])
+        frames.shape = nframes, height // ds, ds, width // ds, ds
+        return frames.mean(axis=(2, 4))
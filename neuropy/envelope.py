@@ -0,0 +1,110 @@
+"""Min/max envelope decimation for fast plotting of long continuous signals, such as LFP
+and MUA. An EnvelopePyramid holds the min and max of each signal in bins of 2**k samples,
+for all k. An EnvelopeLines draws the signals into axes from the pyramid level with about
+one bin per screen pixel, and switches levels on every zoom and pan. Drawing the min and
+max of each bin as a vertical zigzag looks the same as drawing every sample, but the
+number of vertices drawn stays about constant, regardless of signal length"""
+
+import numpy as np
+
+from core import LineCollection # lazily imported
+
+
+class EnvelopePyramid(object):
+    """Per-row min and max of 2D data (rows are signals, columns are samples) in bins of
+    2**k samples. Level 0 is the data itself, each subsequent level halves the number of
+    bins, down to about MINNBINS bins"""
+    MINNBINS = 256 # min number of bins in top level
+
+    def __init__(self, data):
+        data = np.asarray(data)
+        assert data.ndim == 2
+        self.data = data
+        lo = hi = data
+        self.mins, self.maxs = [lo], [hi] # level 0 is just the data
+        while lo.shape[1] > 2*self.MINNBINS:
+            n = lo.shape[1]
+            neven = n // 2 * 2
+            newlo = np.minimum(lo[:, 0:neven:2], lo[:, 1:neven:2])
+            newhi = np.maximum(hi[:, 0:neven:2], hi[:, 1:neven:2])
+            if n % 2: # last bin holds just the odd sample out
+                newlo = np.hstack([newlo, lo[:, -1:]])
+                newhi = np.hstack([newhi, hi[:, -1:]])
+            lo, hi = newlo, newhi
+            self.mins.append(lo)
+            self.maxs.append(hi)
+
+    nt = property(lambda self: self.data.shape[1])
+    nlevels = property(lambda self: len(self.mins))
+
+    def level(self, nsamples, npixels):
+        """Return the coarsest level with at least one bin per pixel, when showing nsamples
+        samples across npixels pixels"""
+        samplesperpixel = nsamples / max(npixels, 1)
+        if samplesperpixel < 2:
+            return 0
+        return min(int(np.floor(np.log2(samplesperpixel))), self.nlevels - 1)
+
+    def envelope(self, k, i0, i1, rows=None):
+        """Return sample indices i and values y (one row per signal in rows) of the level k
+        envelope covering samples i0 to i1. For k > 0, each bin contributes its min and max,
+        positioned at the bin's first and last sample respectively"""
+        if rows is None:
+            rows = slice(None)
+        if k == 0:
+            return np.arange(i0, i1), self.data[rows, i0:i1]
+        binw = 2**k
+        b0, b1 = i0 // binw, -(-i1 // binw) # floor and ceil
+        lo, hi = self.mins[k][rows, b0:b1], self.maxs[k][rows, b0:b1]
+        y = np.empty((len(lo), 2*lo.shape[1]), dtype=lo.dtype)
+        y[:, 0::2] = lo
+        y[:, 1::2] = hi
+        i = np.repeat(np.arange(b0, b1) * binw, 2)
+        i[1::2] += binw - 1
+        i = np.minimum(i, self.nt - 1) # last bin may be partial
+        return i, y
+
+
+class EnvelopeLines(object):
+    """A LineCollection in axes a that plots rows of an EnvelopePyramid, redrawn from the
+    level appropriate for the axes' pixel width whenever its x limits change. Sample i is
+    plotted at x = t[i], where t is sorted, and row r's values v at y = v*yscale +
+    yoffsets[r]. Only samples within irange are ever plotted. kwargs are passed to the
+    LineCollection"""
+    def __init__(self, a, pyramid, t, rows=None, yscale=1, yoffsets=0, irange=None,
+                 **kwargs):
+        self.a = a
+        self.pyramid = pyramid
+        assert len(t) == pyramid.nt
+        self.t = t
+        if rows is None:
+            rows = np.arange(len(pyramid.data))
+        self.rows = np.asarray(rows)
+        self.yscale = yscale
+        self.yoffsets = np.zeros(len(self.rows)) + yoffsets # broadcast
+        if irange == None:
+            irange = 0, pyramid.nt
+        self.irange = irange
+        self.lc = LineCollection(self.segments(*irange), **kwargs)
+        a.add_collection(self.lc) # add to axes' pool of LCs, updates data limits
+        a.callbacks.connect('xlim_changed', self.update)
+
+    def segments(self, i0, i1):
+        """Return (nrows, npoints, 2) array of line vertices covering samples i0 to i1"""
+        npixels = self.a.bbox.width
+        k = self.pyramid.level(i1 - i0, npixels)
+        i, y = self.pyramid.envelope(k, i0, i1, rows=self.rows)
+        segments = np.empty((len(y), len(i), 2))
+        segments[:, :, 0] = self.t[i]
+        segments[:, :, 1] = y * self.yscale + self.yoffsets[:, np.newaxis]
+        return segments
+
+    def update(self, a=None):
+        """Redraw the visible range of samples at the appropriate level"""
+        i0, i1 = self.t.searchsorted(sorted(self.a.get_xlim()))
+        lo, hi = self.irange
+        # 1 sample margin on either side, so lines continue to the axes edges:
+        i0, i1 = max(i0 - 1, lo), min(i1 + 1, hi)
+        i1 = max(i0, i1)
+        self.lc.set_segments(self.segments(i0, i1))
+        self.a.figure.canvas.draw_idle()
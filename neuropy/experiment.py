@@ -4,13 +4,13 @@ import os
 from io import StringIO
 
 import numpy as np
-import matplotlib as mpl
-from scipy.io import loadmat
 
 import core
+import config
+from core import mpl, loadmat # lazily imported
 from core import getargstr, TAB, rstrip, dictattr, intround, toiter, tolist, recarray2dict
 from core import joinpath, lastcmd
-from core import Codes, RevCorrWindow
+from core import Codes
 import neuron
 
 # many of these are required when eval'ing the textheader:
@@ -114,7 +114,7 @@ class BaseExperiment(object):
                 # prevent replication of movie frame data in memory
                 if type(self.e) == Movie:
                     fname = os.path.split(self.e.static.fname)[-1] # pathless fname
-                    uns = get_ipython().user_ns
+                    uns = config.get()
                     if fname not in uns['MOVIES']:
                         # add movie experiment, indexed according to movie data file name,
                         # to prevent from ever loading its frames more than once
@@ -146,7 +146,7 @@ class BaseExperiment(object):
     def get_nonnulltrange(self):
         """Find outermost non-NULL din times, such as at the end and beginning of pre and post
         experiment periods of blank screen, respectively"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         NULLDIN = uns['NULLDIN']
         dint, dinval = self.din[:, 0], self.din[:, 1]
         nni, = np.where(dinval != NULLDIN)
@@ -264,7 +264,7 @@ class BaseExperiment(object):
             self.e.static.fname = m.fname # update fake dimstim experiment's fname too
             # extensionless fname, fname should've been defined in the textheader
             m.name = os.path.splitext(m.fname)[0]
-            uns = get_ipython().user_ns
+            uns = config.get()
             if m.name not in uns['MOVIES']:
                 # and it very well may not be, cuz the textheader inits movies with no args,
                 # leaving fname==None at first, which prevents it from being added to
@@ -277,7 +277,7 @@ class BaseExperiment(object):
             spath = self.oldparams.moviepath.split('\\') # ptc15 has purely MS path separators
             matchi = spath.index('Movies')
             relpath = joinpath(spath[matchi+1 ::])
-            MOVIEPATH = get_ipython().user_ns['MOVIEPATH']
+            MOVIEPATH = config.get()['MOVIEPATH']
             path = os.path.join(MOVIEPATH, relpath)
             m.fname = os.path.join(path, m.fname)
             self.e.static.fname = m.fname # update
@@ -754,14 +754,14 @@ class RevCorrs(object):
         MPL = True|False|'axes'"""
         rfs = [] # list of receptive fields to pass to ReceptiveFieldFrame object
         if normed == 'global': # normalize across all timepoints for all neurons
-            vmin = min([ sta.rf.min() for sta in self.stas ]) # global min
-            vmax = max([ sta.rf.max() for sta in self.stas ]) # global max
-        for sta in (self.stas):
-            if sta is None:
+            vmin = min([ rc.rf.min() for rc in self.rcs if rc is not None ]) # global min
+            vmax = max([ rc.rf.max() for rc in self.rcs if rc is not None ]) # global max
+        for rc in self.rcs:
+            if rc is None:
                 rf = None
             else:
                 # create a copy to manipulate for display purposes, (nt, width, height):
-                rf = sta.rf.copy()
+                rf = rc.rf.copy()
                 if normed: # either 'global' or True
                     if normed == True: # normalize across the timepoints for this Neuron
                         vmin, vmax = rf.min(), rf.max()
@@ -780,7 +780,7 @@ class RevCorrs(object):
         elif MPL == 'axes':
             core.mplrevcorraxes(title=title, rfs=rfs, nids=self.nids, ts=self.ts, scale=scale)
         else:
-            win = RevCorrWindow(title=title, rfs=rfs, nids=self.nids, ts=self.ts, scale=scale)
+            win = core.RevCorrWindow(title=title, rfs=rfs, nids=self.nids, ts=self.ts, scale=scale)
             win.show()
             return win # necessary in IPython
 
@@ -789,12 +789,21 @@ class STAs(RevCorrs):
     though: it plots all the Neuron.STA objects in a single window"""
     def calc(self):
         self.stas = [] # store STAs in a list
-        for neuron in self.neurons:
-            if neuron == None:
+        for n in self.neurons:
+            if n == None:
                 sta = None
             else:
-                sta = neuron.sta(experiment=self.experiment, trange=self.trange, nt=self.nt)
+                # get existing STA, or a new uncalculated one:
+                sta = n.sta(experiment=self.experiment, trange=self.trange, nt=self.nt,
+                            calc=False)
             self.stas.append(sta)
+        # calculate all the new ones at once, sharing one frame gather per timepoint:
+        newstas = [ sta for sta in self.stas if sta is not None and not sta.done ]
+        neuron.STA.calcmany(newstas)
+        for sta in newstas:
+            if sta.done and not [ _sta for _sta in sta.neuron._stas if _sta is sta ]:
+                sta.neuron._stas.append(sta) # cache it in its Neuron
+        self.rcs = self.stas # for plotting
 
     def plot(self, normed=True, scale=2.0, MPL=False, margins=True):
         win = RevCorrs.plot(self, normed=normed, title=lastcmd(), scale=scale, MPL=MPL,
@@ -805,12 +814,21 @@ class STAs(RevCorrs):
 
 class STCs(RevCorrs):
     """Just a container class for multiple Neuron.STC objects. The plot() method is unique
-    though: it plots all the Neuron.STC objects in a single figure"""
+    though: it plots the top eigenvector of all the Neuron.STC objects in a single figure"""
+    def __init__(self, nids=None, experiment=None, trange=None, nt=10, **kwargs):
+        RevCorrs.__init__(self, nids=nids, experiment=experiment, trange=trange, nt=nt)
+        self.kwargs = kwargs # passed on to each Neuron.STC
+
     def calc(self):
         self.stcs = [] # store STCs in a list
-        for neuron in self.neurons:
-            stco = neuron.stc(experiment=self.experiment, trange=self.trange, nt=self.nt)
+        for n in self.neurons:
+            if n == None:
+                stco = None
+            else:
+                stco = n.stc(experiment=self.experiment, trange=self.trange, nt=self.nt,
+                             **self.kwargs)
             self.stcs.append(stco)
+        self.rcs = self.stcs # for plotting
 
     def plot(self, normed=True, scale=2.0, MPL=False):
         super(STCs, self).plot(normed=normed, title=lastcmd(), scale=scale, MPL=MPL)
@@ -825,14 +843,117 @@ class ExperimentRevCorr(BaseExperiment):
         stas.calc()
         return stas
 
-    def stc(self, nids=None, trange=None, nt=10):
+    def stc(self, nids=None, trange=None, nt=10, **kwargs):
         """Returns an STCs RevCorrs object"""
-        stcs = STCs(nids=nids, experiment=self, trange=trange, nt=nt)
+        stcs = STCs(nids=nids, experiment=self, trange=trange, nt=nt, **kwargs)
         stcs.calc()
-        return stcso
+        return stcs
+    stc.__doc__ += '\n\n**kwargs:\n'
+    stc.__doc__ += getargstr(neuron.STC.__init__)
+
+
+class Tunes(object):
+    """Stimulus tuning analysis of multiple neurons at once. Builds an (nneurons, nsweeps)
+    spike count matrix once, from which tuning curves for any sweeptable variable, with
+    any fixed variable constraints, are calculated for all neurons with a single bincount.
+    See Neuron.Tune for the single neuron equivalent"""
+    def __init__(self, nids=None, experiment=None, tdelay=None, strange=None):
+        """tdelay: time delay in us to use between stimulus and response"""
+        self.experiment = experiment
+        self.nids, self.neurons = RevCorrs.parse_nids(self, nids)
+        if tdelay == None:
+            if 'flash' in self.experiment.name: # flashgrating or flashbar
+                tdelay = 40000 # akin to a revcorr timepoint for STA
+            else:
+                tdelay = 0
+        self.tdelay = tdelay
+        self.strange = strange
+        # flatten all sweep tranges into a single (ntrials, 2) array, and keep track of
+        # the sweep index of each trial:
+        sweeptranges = self.experiment.sweeptranges
+        # 65535 indicates blank screen, which has no corresponding sweeptable entry:
+        sweepis = [ sweepi for sweepi in sorted(sweeptranges) if sweepi != 65535 ]
+        tranges = np.vstack([ sweeptranges[sweepi] for sweepi in sweepis ])
+        trialsweepis = np.hstack([ np.tile(sweepi, len(sweeptranges[sweepi]))
+                                   for sweepi in sweepis ])
+        if strange != None:
+            # keep just those trials that fall entirely with strange:
+            keep = (strange[0] <= tranges[:, 0]) & (tranges[:, 1] <= strange[1])
+            tranges, trialsweepis = tranges[keep], trialsweepis[keep]
+        self.nsweeps = nsweeps = max(sweepis) + 1
+        edges = (tranges + tdelay).ravel() # include delay
+        # find which spike indices the start and end of each sweep trange would fall
+        # between. Take difference between those two spike indices to get spike count for
+        # that trange, then sum over all tranges of each sweep index:
+        self.counts = np.zeros((len(self.neurons), nsweeps), dtype=np.int64)
+        for ni, n in enumerate(self.neurons):
+            if n == None: # nid has no spikes during this recording
+                continue
+            spikeis = n.spikes.searchsorted(edges).reshape(-1, 2)
+            trialcounts = spikeis[:, 1] - spikeis[:, 0]
+            self.counts[ni] = np.bincount(trialsweepis, weights=trialcounts,
+                                          minlength=nsweeps)
+        self.var = None # init
+
+    def calc(self, var='ori', fixed=None):
+        """Calculate tuning curves of all neurons for sweeptable variable var, with
+        optional fixed dict of {fixedvar: fixedval(s)} constraints, just like for
+        Neuron.Tune. Returns (x, y), where x are the unique values of var, and y is an
+        (nneurons, len(x)) spike count array"""
+        vals = neuron.sweepvals(self.experiment, var)
+        nvals = len(vals)
+        keep = np.ones(nvals, dtype=bool) # sweep indices to include
+        if fixed != None:
+            for fixedvar, fixedvals in fixed.items():
+                fvals = neuron.sweepvals(self.experiment, fixedvar)[:nvals]
+                keep &= np.isin(fvals, toiter(fixedvals))
+        x, valis = np.unique(vals, return_inverse=True) # x axis
+        nx = len(x)
+        nneurons = len(self.neurons)
+        # sweep indices that were never displayed have 0 counts:
+        counts = np.zeros((nneurons, nvals), dtype=np.int64)
+        ncols = min(nvals, self.nsweeps)
+        counts[:, :ncols] = self.counts[:, :ncols]
+        counts = counts[:, keep]
+        # group by value index, separately for each neuron, with a single bincount:
+        groupis = (np.arange(nneurons)[:, np.newaxis] * nx + valis[keep]).ravel()
+        y = np.bincount(groupis, weights=counts.ravel(), minlength=nneurons*nx)
+        y = np.int64(y).reshape(nneurons, nx) # spike counts for each variable value
+        self.var = var
+        self.x, self.y = x, y
+        self.peaks = x[y.argmax(axis=1)]
+        return x, y
+
+    def pref(self, var='ori', fixed=None):
+        """Return arrays of preferred value of tuning var for all neurons, as well as its
+        strength relative to all the other possible values of var, and its significance.
+        See Neuron.Tune.pref"""
+        if var != 'ori':
+            raise NotImplementedError('preference calc only intended for ori for now')
+        x, y = self.calc(var=var, fixed=fixed)
+        self.theta, self.r, self.z, self.p = neuron.oripref(x, y)
+        return self.theta, self.r, self.z, self.p
+
+
+class ExperimentTune(BaseExperiment):
+    """Mix-in class that defines the stimulus tuning related experiment methods"""
+    def tunes(self, nids=None, tdelay=None, strange=None):
+        """Return a Tunes object for nids, building a new one only if necessary"""
+        try:
+            self._tunes
+        except AttributeError: # self._tunes doesn't exist yet
+            self._tunes = {} # cache of Tunes objects
+        key = (tuple(toiter(nids)), tdelay, None if strange is None else tuple(strange))
+        try:
+            return self._tunes[key]
+        except KeyError:
+            tunes = Tunes(nids=nids, experiment=self, tdelay=tdelay, strange=strange)
+            self._tunes[key] = tunes
+            return tunes
 
 
 class Experiment(ExperimentRevCorr,
+                 ExperimentTune,
                  ExperimentRate,
                  ExperimentCode,
                  BaseExperiment):
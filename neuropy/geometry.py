@@ -0,0 +1,76 @@
+"""Geometry of a population of neurons: the positions of all of a recording's or track's
+neurons, stacked once into an (nn, 2) array of (x, y) um, and the separations of all their
+unique pairs, in np.triu_indices(nn, 1) order, same as pdist and paircorr.py. Separations
+and layer labels of any set of pairs of any subset of neurons are then found by indexing
+into these arrays, instead of looking up the positions and layers of both neurons of each
+pair in a Python loop over pairs. Layer labels are found from the stacked positions on
+every call, since they depend on config LAYERS, which may be temporarily changed with
+config.using()"""
+
+import numpy as np
+
+import core
+import paircorr
+
+
+class Geometry(object):
+    """Positions (um) and layer labels of neurons (a dict of nid:neuron) in the track with
+    trackabsname, one row per nid in sorted order. Pairs are given as rows of indices into
+    some subset of nids, as in SpikeCorr"""
+    def __init__(self, neurons, trackabsname):
+        self.nids = np.sort(list(neurons))
+        self.pos = np.array([ neurons[nid].pos for nid in self.nids ],
+                            dtype=np.float64).reshape(-1, 2)
+        self.trackabsname = trackabsname
+        self._seps = None
+
+    nn = property(lambda self: len(self.nids))
+
+    def get_seps(self):
+        """Separations (um) of all unique pairs of neurons, calculated on first access"""
+        if self._seps is None:
+            self._seps = paircorr.seps(self.pos)
+        return self._seps
+
+    seps = property(get_seps)
+
+    def get_layers(self):
+        """Layer label of each neuron: SUP, MID, DEEP or OTHER, according to the active
+        config LAYERS"""
+        return core.layers(self.pos[:, 1], self.trackabsname)
+
+    layers = property(get_layers)
+
+    def nis(self, nids):
+        """Return row indices of nids"""
+        nids = np.asarray(nids)
+        nis = self.nids.searchsorted(nids)
+        valid = nis < self.nn
+        if not valid.all() or (self.nids[nis[valid]] != nids[valid]).any():
+            raise KeyError("nids %r not found" % np.setdiff1d(nids, self.nids))
+        return nis
+
+    def pairis(self, nids, pairs):
+        """Return indices into self.seps of pairs of nids"""
+        nis = self.nis(nids)
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        i, j = nis[pairs[:, 0]], nis[pairs[:, 1]]
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        if (i == j).any():
+            raise ValueError("can't pair a neuron with itself")
+        # index of pair (i, j), i < j, in the condensed distance vector returned by pdist:
+        return self.nn*i - i*(i+1)//2 + j - i - 1
+
+    def pairseps(self, nids, pairs):
+        """Return separation (um) of each of pairs of nids"""
+        return self.seps[self.pairis(nids, pairs)]
+
+    def pairlayers(self, nids, pairs, inclusive=False):
+        """Return layer label of each of pairs of nids, see core.pairlayers()"""
+        labels = core.layers(self.pos[self.nis(nids), 1], self.trackabsname)
+        return core.pairlayers(labels, pairs, inclusive=inclusive)
+
+    def pair_laminarity(self, nids, pairs, inclusive=False):
+        """Return RGB colours and indices of superficial, middle, deep and other pairs of
+        nids, see core.pair_laminarity()"""
+        return core.laminarpairs(self.pairlayers(nids, pairs, inclusive=inclusive))
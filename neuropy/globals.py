@@ -1,7 +1,9 @@
 """Global variables that can be modified by the user at the IPython command line.
 Access programatically using:
 
-get_ipython().user_ns['VARNAME']
+config.get()['VARNAME']
+
+which also works outside of IPython, see config.py
 """
 import os
 from core import mergeuniquedictvals, dictattr
@@ -14,6 +16,11 @@ SLABPATH = os.path.join(DATAPATH, 'slab') # Swindale Lab
 MOVIEPATH = os.path.join(SLABPATH, 'mov')
 MOVIES = dictattr()
 
+"""On-disk cache of expensive analysis results, see cache.py. Set CACHEPATH to None to
+disable caching. Least recently used results are evicted once CACHESIZE is exceeded"""
+CACHEPATH = os.path.join(DATAPATH, 'cache')
+CACHESIZE = 10 * 2**30 # bytes
+
 # for each recording, load all Sorts, or just the most recent one?
 LOADALLSORTS = False
 
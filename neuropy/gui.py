@@ -0,0 +1,173 @@
+"""Qt windows and matplotlib tick classes. These subclass Qt and matplotlib classes, and
+therefore can't be defined without importing Qt and matplotlib. They're kept here, out of
+core, so that importing core doesn't import either of them. core still exposes them
+as attributes, importing this module on first access"""
+
+import re
+import math
+
+from PyQt4 import QtGui
+from PyQt4.QtGui import QPixmap, QImage, QPalette, QColor
+from PyQt4.QtCore import Qt, QSize
+
+import numpy as np
+import matplotlib as mpl
+import matplotlib.cm
+import matplotlib.ticker
+
+
+class NeuropyWindow(QtGui.QMainWindow):
+    """Base class for all of neuropy's tool windows"""
+    def __init__(self, parent=None):
+        QtGui.QMainWindow.__init__(self, parent)
+        self.maximized = False
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key == Qt.Key_F11:
+            self.toggleMaximized()
+        else:
+            QtGui.QMainWindow.keyPressEvent(self, event) # pass it on
+
+    def mouseDoubleClickEvent(self, event):
+        """Doesn't catch window titlebar doubleclicks for some reason (window manager
+        catches them?). Have to doubleclick on a part of the window with no widgets in it"""
+        self.toggleMaximized()
+
+    def toggleMaximized(self):
+        if not self.maximized:
+            self.normalPos, self.normalSize = self.pos(), self.size()
+            dw = QtGui.QDesktopWidget()
+            rect = dw.availableGeometry(self)
+            self.setGeometry(rect)
+            self.maximized = True
+        else: # restore
+            self.resize(self.normalSize)
+            self.move(self.normalPos)
+            self.maximized = False
+
+
+class RevCorrWindow(NeuropyWindow):
+    def __init__(self, parent=None, title='RevCorrWindow', rfs=None,
+                 nids=None, ts=None, scale=2.0, blanksize=(32, 32)):
+        NeuropyWindow.__init__(self, parent)
+        self.title = title
+        self.rfs = rfs
+        self.nids = nids
+        self.ts = ts
+        self.scale = scale # setting to non-integer will give uneven sized pixels
+
+        cmap = mpl.cm.jet(np.arange(256), alpha=None, bytes=True) # 8 bit RGBA colormap
+        # from Qt docs, need to use ARGB format:
+        # http://qt-project.org/doc/qt-4.8/qimage.html#image-formats
+        # convert to 8 bit ARGB colormap, but due to little-endianness, need to arrange
+        # array columns in reverse BGRA order:
+        cmap[:, [0, 1, 2, 3]] = cmap[:, [2, 1, 0, 3]]
+        colortable = cmap.view(dtype=np.uint32).ravel().tolist() # QVector<QRgb> colors
+        layout = QtGui.QGridLayout() # can set vert and horiz spacing
+        #layout.setContentsMargins(0, 0, 0, 0) # doesn't seem to do anything
+
+        # place time labels along top
+        for ti, t in enumerate(ts):
+            label = QtGui.QLabel(str(t))
+            layout.addWidget(label, 0, ti+1)
+        # plot each row, with its nid label
+        for ni, nid in enumerate(nids):
+            label = QtGui.QLabel('n'+str(nid)) # nid label on left
+            label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            layout.addWidget(label, ni+1, 0)
+            rf = rfs[ni]
+            for ti, t in enumerate(ts):
+                #data = np.uint8(np.random.randint(0, 255, size=(height, width)))
+                if rf == None:
+                    data = np.zeros(blanksize, dtype=np.uint8) # blank placeholder rf
+                else:
+                    data = rf[ti]
+                width, height = data.shape
+                image = QImage(data.data, width, height, QImage.Format_Indexed8)
+                image.ndarray = data # hold a ref, prevent gc
+                image.setColorTable(colortable)
+                image = image.scaled(QSize(scale*width, scale*height)) # scale it
+                pixmap = QPixmap.fromImage(image)
+                label = QtGui.QLabel()
+                label.setPixmap(pixmap)
+                layout.addWidget(label, ni+1, ti+1) # can also control alignment
+
+        mainwidget = QtGui.QWidget(self)
+        mainwidget.setLayout(layout)
+
+        scrollarea = QtGui.QScrollArea()
+        scrollarea.setWidget(mainwidget)
+
+        self.setCentralWidget(scrollarea)
+        self.setWindowTitle(title)
+        #palette = QPalette(QColor(255, 255, 255))
+        #self.setPalette(palette) # set white background, or perhaps more
+
+
+class NeuropyScalarFormatter(mpl.ticker.ScalarFormatter):
+    """Overloaded from mpl.ticker.ScalarFormatter for 4 reasons:
+    1) turn off stupid offset
+    2) increase maximum possible number of sigfigs
+    3) increase +ve and -ve order of magnitude thresholds before switching to scientific
+       notation
+    4) keep exponents in engineering notation, ie multiples of 3
+    """
+    def __init__(self, useOffset=False, useMathText=False):
+        # useOffset allows plotting small data ranges with large offsets:
+        # for example: [1+1e-9,1+2e-9,1+3e-9]
+        # useMathText will render the offset an scientific notation in mathtext
+        # can't use this, because derived from an old-style class:
+        #super(NeuropyScalarFormatter, self).__init__(useOffset=useOffset,
+        #                                             useMathText=useMathText)
+        mpl.ticker.ScalarFormatter.__init__(self, useOffset=useOffset, useMathText=useMathText)
+        self.thousandsSep = '' # default to not using a thousands separator
+
+    def _set_orderOfMagnitude(self, range):
+        # if scientific notation is to be used, find the appropriate exponent
+        # if using an numerical offset, find the exponent after applying the offset
+        locs = np.absolute(self.locs)
+        if self.offset: oom = math.floor(math.log10(range))
+        else:
+            if locs[0] > locs[-1]: val = locs[0]
+            else: val = locs[-1]
+            if val == 0: oom = 0
+            else: oom = math.floor(math.log10(val))
+        if oom < -3: # decreased -ve threshold for sci notation
+            # stick to engineering notation, multiples of 3:
+            self.orderOfMagnitude = (oom // 3)*3
+        elif oom > 6: # increased +ve threshold for sci notation
+            # stick to engineering notation, multiples of 3:
+            self.orderOfMagnitude = (oom // 3)*3
+        else:
+            self.orderOfMagnitude = 0
+
+    def _set_format(self):
+        # set the format string to format all the ticklabels
+        locs = (np.array(self.locs)-self.offset) / 10**self.orderOfMagnitude+1e-15
+        # '%1.3f' changed to '%1.10f' to increase maximum number of possible sigfigs:
+        sigfigs = [len(str('%1.10f'% loc).split('.')[1].rstrip('0')) for loc in locs]
+        sigfigs.sort()
+        self.format = '%1.' + str(sigfigs[-1]) + 'f'
+        if self._usetex or self._useMathText: self.format = '$%s$'%self.format
+
+    def pprint_val(self, x):
+        xp = (x-self.offset)/10**self.orderOfMagnitude
+        if np.absolute(xp) < 1e-8: xp = 0
+        s = self.format % xp
+        if self.thousandsSep: # add thousands-separating characters
+            if s.count('.'): # it's got a decimal in there
+                # use the regexp for floats:
+                s = re.sub(r'(?<=\d)(?=(\d\d\d)+\.)', self.thousandsSep, s)
+            else: # it's an int
+                # use the regexp for ints:
+                s = re.sub(r'(?<=\d)(?=(\d\d\d)+$)', self.thousandsSep, s)
+        return s
+
+
+class NeuropyAutoLocator(mpl.ticker.MaxNLocator):
+    """A tick autolocator that generates more ticks than the standard mpl autolocator"""
+    def __init__(self):
+        # standard autolocator:
+        #mpl.ticker.MaxNLocator.__init__(self, nbins=9, steps=[1, 2, 5, 10])
+        mpl.ticker.MaxNLocator.__init__(self) # use MaxNLocator's defaults instead
@@ -0,0 +1,88 @@
+"""Vectorized information theory functions. Distributions are stacked in 2D arrays, one
+distribution (or one sample group) per row, so that thousands of entropies or divergences
+can be calculated in a single call. All logs are masked to skip zero probabilities, so
+nothing here trips the np.seterr(all='raise') setting in core"""
+
+import numpy as np
+
+
+def rows(p):
+    """Return p as a float64 2D array with one distribution per row. A 1D p is treated as
+    a single row"""
+    p = np.asarray(p, dtype=np.float64)
+    if p.ndim == 1:
+        p = p.reshape(1, -1)
+    assert p.ndim == 2, 'expected 1D or 2D array, got %dD' % p.ndim
+    return p
+
+def normalize(p):
+    """Normalize each row of p (counts or probabilities) to sum to 1. Rows that sum to 0
+    are returned as zeros. Last axis is the distribution axis, so this also works on
+    stacks of 2D joint distributions if they're first flattened"""
+    p = rows(p)
+    sums = p.sum(axis=1, keepdims=True)
+    return np.divide(p, sums, out=np.zeros_like(p), where=sums != 0)
+
+def plog2pq(p, q):
+    """Return elementwise p * log2(p / q), with 0 wherever either p or q is 0. p and q
+    must have the same shape"""
+    mask = (p > 0) & (q > 0)
+    out = np.zeros(p.shape)
+    np.divide(p, q, out=out, where=mask)
+    np.log2(out, out=out, where=mask)
+    out *= p # where mask is False, out is still 0
+    return out
+
+def entropy(p):
+    """Return entropy (in bits) of each row of p, which can hold counts or probabilities.
+    Zero probabilities contribute zero entropy"""
+    p = normalize(p)
+    return -plog2pq(p, np.ones(p.shape)).sum(axis=1)
+
+def jointcounts(x, y, nx, ny):
+    """Return joint count matrices of integer codes in x and y. x and y are (ngroups,
+    nt) arrays (or 1D for a single group) with values in range(nx) and range(ny)
+    respectively. Returns an (ngroups, nx, ny) int array, built with a single bincount"""
+    x, y = np.asarray(x), np.asarray(y)
+    if x.ndim == 1:
+        x, y = x.reshape(1, -1), y.reshape(1, -1)
+    assert x.shape == y.shape
+    ngroups = len(x)
+    nxy = nx * ny
+    # offset each group's flattened joint index into its own block of nxy bins:
+    xy = x * ny + y + (np.arange(ngroups) * nxy)[:, np.newaxis]
+    counts = np.bincount(xy.ravel(), minlength=ngroups*nxy)
+    return counts.reshape(ngroups, nx, ny)
+
+def MI(XY):
+    """Return mutual information (in bits) for each joint distribution in XY, an (ngroups,
+    nx, ny) array of joint counts or probabilities. A single 2D joint is treated as one
+    group.
+    I = sum_X sum_Y P(x, y) * log2( P(x, y) / (P(x) * P(y)) )
+    Terms with P(x, y) == 0 or P(x) * P(y) == 0 contribute nothing"""
+    XY = np.asarray(XY, dtype=np.float64)
+    if XY.ndim == 2:
+        XY = XY[np.newaxis]
+    assert XY.ndim == 3
+    ngroups, nx, ny = XY.shape
+    XY = normalize(XY.reshape(ngroups, nx*ny)).reshape(ngroups, nx, ny)
+    X = XY.sum(axis=2) # marginals, ngroups x nx
+    Y = XY.sum(axis=1) # ngroups x ny
+    XxY = X[:, :, np.newaxis] * Y[:, np.newaxis, :] # product of marginals
+    return plog2pq(XY, XxY).sum(axis=(1, 2))
+
+def DKL(p, q):
+    """Kullback-Leibler divergence (in bits) from each row of true distributions p to the
+    corresponding row of q. Either can be 1D, in which case it's broadcast across all rows
+    of the other. Terms where either p or q is 0 are skipped, as in core.DKL"""
+    p, q = normalize(p), normalize(q)
+    p, q = np.broadcast_arrays(p, q)
+    return plog2pq(p, q).sum(axis=1)
+
+def DJS(p, q):
+    """Jensen-Shannon divergence (in bits) between each row of p and the corresponding row
+    of q, a symmetric measure of divergence. Broadcasts like DKL"""
+    p, q = normalize(p), normalize(q)
+    p, q = np.broadcast_arrays(p, q)
+    m = 0.5 * (p + q)
+    return 0.5 * (plog2pq(p, m).sum(axis=1) + plog2pq(q, m).sum(axis=1))
@@ -0,0 +1,70 @@
+"""Lazy importing of heavy modules (Qt, matplotlib, scipy), so that they're only imported
+the first time they're actually used. This keeps startup fast for headless scripts and
+multiprocessing worker processes that never plot anything"""
+
+import importlib
+
+
+class LazyModule(object):
+    """Stand-in for a module that imports it on first attribute access. Accessing an
+    attribute that turns out to be an unimported submodule imports that too, so that
+    lazy scipy.stats.t or mpl.cm.jet work just like their eagerly imported versions"""
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError: # maybe it's a submodule that hasn't been imported yet
+            try:
+                return importlib.import_module(self._name + '.' + attr)
+            except ImportError:
+                raise AttributeError('module %r has no attribute %r' % (self._name, attr))
+
+    def __setattr__(self, attr, val):
+        setattr(self._load(), attr, val)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__['_module'] is None:
+            return '<lazy module %r, not yet imported>' % self._name
+        return repr(self._module)
+
+
+class LazyAttr(object):
+    """Stand-in for an object (usually a class or function) in a module, that imports the
+    module and fetches the object the first time it's called or has any of its attributes
+    accessed. Eg, QImage(...) and QImage.Format_Indexed8 both work"""
+    def __init__(self, modname, attr):
+        self.__dict__['_modname'] = modname
+        self.__dict__['_attr'] = attr
+        self.__dict__['_obj'] = None
+
+    def _load(self):
+        obj = self.__dict__['_obj']
+        if obj is None:
+            obj = getattr(importlib.import_module(self._modname), self._attr)
+            self.__dict__['_obj'] = obj
+        return obj
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        if self.__dict__['_obj'] is None:
+            return '<lazy %s.%s, not yet imported>' % (self._modname, self._attr)
+        return repr(self._obj)
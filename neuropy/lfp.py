@@ -2,13 +2,11 @@
 
 import numpy as np
 
-import matplotlib as mpl
-import pylab as pl
-from pylab import get_current_fig_manager as gcfm
-from matplotlib.collections import LineCollection
-
+import config
+import cache
+from core import mpl, pl, gcfm, filter # lazily imported
 from core import intround, issorted, iterable, lastcmd, split_tranges, tolist
-import filter
+from envelope import EnvelopePyramid, EnvelopeLines
 
 
 class LFP(object):
@@ -25,9 +23,12 @@ class LFP(object):
         self.t1: time in us of last LFP timepoint
         self.tres: temporal resolution in us of each LFP timepoint
         self.uVperAd: number of uV per AD voltage value in LFP data
+        self.filterhist: list of in-place filters applied to data since it was loaded, each
+                         a tuple of method name and arguments. Part of the cache key of si()
         """
         self.r = recording
         self.fname = fname # with full path
+        self.filterhist = []
 
     def load(self):
         with open(self.fname, 'rb') as f:
@@ -82,6 +83,7 @@ class LFP(object):
         self.sampfreq = intround(1e6 / self.tres) # in Hz
         assert self.sampfreq == 1000 # should be 1000 Hz
         self.data = self.data * self.uVperAD # convert to float uV
+        self.filterhist = [] # freshly loaded, unfiltered
         self.UV2UM = 0.05 # transforms LFP voltage in uV to position in um
 
     def save(self):
@@ -98,6 +100,18 @@ class LFP(object):
             self.load()
         return self.data
 
+    def get_envelope(self):
+        """Return min/max envelope pyramid of data, for fast plotting. Built on first call,
+        and rebuilt whenever data has changed"""
+        data = self.get_data()
+        try:
+            env = self._envelope
+        except AttributeError:
+            env = None
+        if env == None or env.data is not data:
+            env = self._envelope = EnvelopePyramid(data)
+        return env
+
     def get_ts(self):
         """Return full set of timestamps, in us"""
         return np.arange(self.t0, self.t1, self.tres)
@@ -136,46 +150,35 @@ class LFP(object):
         if lim2stim:
             t0, t1 = self.apply_lim2stim(t0, t1)
         t0i, t1i = ts.searchsorted((t0, t1))
+        allts = ts # full set of timestamps for envelope, in sec
         ts = ts[t0i:t1i] # constrained set of timestamps, in sec
         chanis = tolist(chanis)
         nchans = len(chanis)
-        # grab desired channels and time range:
-        data = self.data[chanis][:, t0i:t1i]
         if nchans > 1: # convert uV to um:
             totalgain = self.UV2UM * gain
-            data = data * totalgain
+            yscale = -totalgain # set to -ve here because of invert_yaxis() below
+            # y offsets, vertical distance below top of probe, in um:
+            yoffsets = np.array([ self.chanpos[self.chans[chani]][1] for chani in chanis ])
+            maxypos = yoffsets.max()
+            if yunits == 'mm': # convert from um to mm
+                yscale, yoffsets = yscale / 1000, yoffsets / 1000
+                maxypos = maxypos / 1000 # convert from int to float
+                totalgain = totalgain / 1000
         else: # convert uV to mV:
-            data = data / 1000
+            yscale, yoffsets = 1 / 1000, 0
             yunits = 'mV'
-        nt = len(ts)
-        assert nt == data.shape[1]
         if relative2t0:
             # convert ts to time from t0, otherwise plot time from start of ADC clock:
-            ts -= t0
-        x = np.tile(ts, nchans)
-        x.shape = nchans, nt
-        segments = np.zeros((nchans, nt, 2)) # x vals in col 0, yvals in col 1
-        segments[:, :, 0] = x
-        if nchans > 1:
-            segments[:, :, 1] = -data # set to -ve here because of invert_yaxis() below
-        else:
-            segments[:, :, 1] = data
-        if nchans > 1: # add y offsets:
-            maxypos = 0
-            for chanii, chani in enumerate(chanis):
-                chan = self.chans[chani]
-                ypos = self.chanpos[chan][1] # in um
-                segments[chanii, :, 1] += ypos # vertical distance below top of probe
-                maxypos = max(maxypos, ypos)
-            if yunits == 'mm': # convert from um to mm
-                segments[:, :, 1] /= 1000
-                maxypos = maxypos / 1000 # convert from int to float
-                totalgain = totalgain / 1000
-        lc = LineCollection(segments, linewidth=1, linestyle='-', colors=c, alpha=alpha,
-                            antialiased=True, visible=True)
+            ts = ts - t0
+            allts = allts - t0
         f = pl.figure(figsize=figsize)
         a = f.add_subplot(111)
-        a.add_collection(lc) # add to axes' pool of LCs
+        # plot min/max envelope of the data instead of every sample, at a resolution that
+        # depends on the current zoom level:
+        self.lines = EnvelopeLines(a, self.get_envelope(), allts, rows=chanis,
+                                   yscale=yscale, yoffsets=yoffsets, irange=(t0i, t1i),
+                                   linewidth=1, linestyle='-', colors=c, alpha=alpha,
+                                   antialiased=True, visible=True)
         if scalebar: # add vertical scale bar at end of last channel to represent 1 mV:
             if nchans > 1:
                 ymin, ymax = maxypos-500*totalgain, maxypos+500*totalgain # +/- 0.5 mV
@@ -214,7 +217,7 @@ class LFP(object):
             figsize=(20, 3.5)):
         """Plot standard deviation of LFP signal from t0 to t1 on chani, using bins of width
         and tres"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.get_data()
         data = self.data[chani]
         ts = self.get_tssec()
@@ -253,7 +256,7 @@ class LFP(object):
         power values from p0 to p1 in dB, based on channel index chani of LFP data. chanis=0
         uses most superficial channel, chanis=-1 uses deepest channel. If len(chanis) > 1,
         take mean of specified chanis. width and tres are in sec."""
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.get_data()
         ts = self.get_tssec() # full set of timestamps, in sec
         if t0 == None:
@@ -333,7 +336,7 @@ class LFP(object):
         demarcating desynchronized and synchronized periods. relative2t0 controls whether to
         plot relative to t0, or relative to start of ADC clock. lim2stim limits the time range
         only to when a stimulus was on screen, i.e. to the outermost times of non-NULL din"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.get_data()
         ts = self.get_tssec() # full set of timestamps, in sec
         if t0 == None:
@@ -468,6 +471,8 @@ class LFP(object):
         data = data[chanis]
         data, b, a = filter.notch(data, self.sampfreq, freq, bw, gpass, gstop, ftype)
         self.data[chanis] = data
+        self._envelope = None # data changed in-place, rebuild envelope on next plot
+        self.filterhist.append(('notch', chanis, freq, bw, gpass, gstop, ftype))
         return b, a
 
     def naivenotch(self, freqs=60, bws=1):
@@ -475,6 +480,7 @@ class LFP(object):
         in-place. Filtering out by setting components to 0 is probably naive"""
         data = self.get_data()
         self.data = filter.naivenotch(data, self.sampfreq, freqs, bws)
+        self.filterhist.append(('naivenotch', freqs, bws))
 
     def filter(self, chanis=None, f0=0, f1=7, fr=0.5, gpass=0.01, gstop=30, ftype='ellip'):
         """Bandpass filter data on row indices chanis, between f0 and f1 (Hz), with filter
@@ -488,6 +494,8 @@ class LFP(object):
         data = data[chanis]
         data, b, a = filter.filter(data, self.sampfreq, f0, f1, fr, gpass, gstop, ftype)
         self.data[chanis] = data
+        self._envelope = None # data changed in-place, rebuild envelope on next plot
+        self.filterhist.append(('filter', chanis, f0, f1, fr, gpass, gstop, ftype))
         return b, a
 
     def filterord(self, chanis=None, f0=300, f1=None, order=4, rp=None, rs=None,
@@ -500,8 +508,11 @@ class LFP(object):
         data = data[chanis]
         data, b, a = filter.filterord(data, self.sampfreq, f0, f1, order, rp, rs, btype, ftype)
         self.data[chanis] = data
+        self._envelope = None # data changed in-place, rebuild envelope on next plot
+        self.filterhist.append(('filterord', chanis, f0, f1, order, rp, rs, btype, ftype))
         return b, a
 
+    @cache.cached(state=lambda self: self.filterhist) # source files don't reflect filtering
     def si(self, kind=None, chani=-1, width=None, tres=None,
            lfpwidth=None, lfptres=None, loband=None, hiband=None, plot=True,
            showstates='auto', statelinepos=[0.2], lw=4, alpha=1, relative2t0=False,
@@ -531,7 +542,7 @@ class LFP(object):
         'n3stdmean': normalized 3stdmean: (3*std - mean) / (3*std + mean)
 
         """
-        uns = get_ipython().user_ns
+        uns = config.get()
         if kind == None:
             kind = uns['LFPSIKIND']
         if kind in ['L/(L+H)', 'L/H', 'nLH']: # it's a power ratio measure
@@ -818,7 +829,7 @@ class LFP(object):
                 swapaxes=False, figsize=None):
         """Plot synchrony index as a function of time, with hopefully the same
         temporal scale as some of the other plots in self"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         f = pl.figure(figsize=figsize)
         a = f.add_subplot(111)
 
@@ -905,7 +916,7 @@ class LFP(object):
         tedges = np.asarray(list(t-bw/2) + [t[-1]+bw/2])
         stateis = []
         stateis = np.zeros(nt, dtype=int)
-        uns = get_ipython().user_ns
+        uns = config.get()
         ledges = uns['LFPPRBINLEDGES']
         redges = ledges[1:] + [np.inf]
         for statei, (ledge, redge), in enumerate(zip(ledges, redges)):
@@ -933,3 +944,5 @@ class LFP(object):
         data = data[chanis]
         data = filter.wavelet(data, wname, maxlevel)
         self.data[chanis] = data
+        self._envelope = None # data changed in-place, rebuild envelope on next plot
+        self.filterhist.append(('filterwavelet', chanis, wname, maxlevel))
@@ -0,0 +1,97 @@
+"""Background loading of animals, tracks and recordings. Loading a whole animal can take
+minutes. A Loader does it in a background thread of the IPython kernel, so the shell stays
+responsive, and each recording can be analyzed as soon as it's loaded, without waiting
+for the rest. For example:
+
+>>> ptc22 = Animal(path)
+>>> ldr = loader.start(ptc22)
+loaded ptc22.tr1.r01 (1/37)
+>>> ptc22.tr1.r01.praster() # while the rest continue to load
+
+Avoid iterating over a track's recordings while it's still loading, since its recording
+dict grows in the meantime. Call ldr.wait() to block until everything is loaded"""
+
+import os
+import sys
+import time
+import threading
+import traceback
+
+from animal import Animal
+from track import Track
+from recording import Recording
+
+loaders = [] # all started Loaders, most recent last
+
+
+def nrecordings(obj, tracknames=None):
+    """Return number of recordings that loading obj will load"""
+    if isinstance(obj, Recording):
+        return 1
+    elif isinstance(obj, Track):
+        return len(obj.find_rnames())
+    elif isinstance(obj, Animal):
+        return sum( len(Track(os.path.join(obj.path, trackname)).find_rnames())
+                    for trackname in obj.find_tracknames(tracknames) )
+    raise TypeError("don't know how to load %r" % obj)
+
+def printprogress(rec, i, n):
+    """Default progress callback"""
+    print('loaded %s (%d/%d)' % (rec.absname, i, n))
+
+
+class Loader(threading.Thread):
+    """Calls obj.load(**kwargs) in a background thread, where obj is an Animal, Track or
+    Recording. After each recording is loaded, progress(recording, i, n) is called, where
+    i is the number of recordings loaded so far, and n is the total"""
+    def __init__(self, obj, progress=printprogress, **kwargs):
+        threading.Thread.__init__(self, name='Loader(%s)' % obj.name, daemon=True)
+        self.obj = obj
+        self.progress = progress
+        self.kwargs = kwargs
+        self.nloaded = 0
+        self.n = nrecordings(obj, kwargs.get('tracknames'))
+        self.error = None
+        self.t0 = self.t1 = None
+
+    def __repr__(self):
+        state = 'loading' if self.is_alive() else 'done'
+        if self.error != None:
+            state = 'failed: %r' % self.error
+        return '<%s %d/%d, %s>' % (self.name, self.nloaded, self.n, state)
+
+    def run(self):
+        self.t0 = time.time()
+        try:
+            if isinstance(self.obj, Recording): # doesn't call back, do it here
+                self.obj.load(**self.kwargs)
+                self.onrecording(self.obj)
+            else:
+                self.obj.load(onrecording=self.onrecording, **self.kwargs)
+        except Exception as err:
+            self.error = err
+            traceback.print_exc(file=sys.stdout)
+        finally:
+            self.t1 = time.time()
+
+    def onrecording(self, rec):
+        self.nloaded += 1
+        if self.progress != None:
+            self.progress(rec, self.nloaded, self.n)
+
+    def wait(self, timeout=None):
+        """Block until loading is done, or timeout sec have passed. Raise any error that
+        occurred during loading"""
+        self.join(timeout)
+        if self.error != None:
+            raise self.error
+
+    done = property(lambda self: not self.is_alive())
+
+
+def start(obj, progress=printprogress, **kwargs):
+    """Start loading obj in the background, return its Loader"""
+    ldr = Loader(obj, progress=progress, **kwargs)
+    loaders.append(ldr)
+    ldr.start()
+    return ldr
@@ -139,12 +139,16 @@ class NeuropyWindow(QtGui.QMainWindow):
         path = os.path.join(BLABPATH, 'PVCre_0113')
         self.open_animal(path)
 
+    # Loading happens in a background thread in the kernel, see loader.py. The shell stays
+    # responsive, and the thread prints progress to the shell as each recording finishes
+    # loading, each one usable right away:
+
     def open_animal(self, path, tracknames=None):
         a = Animal(path) # init it just to parse its name
         exec_lines = (
         "try: %s; \n"
         "except NameError: %s = Animal(%r)\n"
-        "%s.load(%r)" % (a.name, a.name, path, a.name, tracknames)
+        "loader.start(%s, tracknames=%r);" % (a.name, a.name, path, a.name, tracknames)
         )
         self.ipw.execute(exec_lines)
 
@@ -152,7 +156,7 @@ class NeuropyWindow(QtGui.QMainWindow):
         tr = Track(path) # init it just to parse its id
         exec_lines = (
         "tr%s = Track(%r)\n"
-        "tr%s.load()" % (tr.id, path, tr.id)
+        "loader.start(tr%s);" % (tr.id, path, tr.id)
         )
         self.ipw.execute(exec_lines)
 
@@ -160,7 +164,7 @@ class NeuropyWindow(QtGui.QMainWindow):
         rec = Recording(path) # init it just to parse its id
         exec_lines = (
         "r%s = Recording(%r)\n"
-        "r%s.load()" % (rec.id, path, rec.id)
+        "loader.start(r%s);" % (rec.id, path, rec.id)
         )
         self.ipw.execute(exec_lines)
 
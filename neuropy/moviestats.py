@@ -0,0 +1,99 @@
+"""Per-frame statistics of natural scene movies: global motion (mean optic flow magnitude
+between successive frames), contrast (stdev) and luminance (mean). Optic flow is slow to
+calculate, so the displayed sequence of frames is split into chunks that overlap by one
+frame, and each chunk is processed in its own worker process, each with its own memmap of
+the movie file. Results are stored in the analysis cache (see cache.py), one result per
+movie, frame sequence and crop, and are evicted along with all other least recently used
+results. Since many recordings share the same movies, each movie's stats are calculated
+only once, as long as they stay cached. Requires OpenCV (cv2)"""
+
+import os
+import hashlib
+import multiprocessing as mp
+
+import numpy as np
+
+import cache
+
+# Farneback optic flow parameters, as used in opencv/samples/python2/opt_flow.py:
+FLOWPARAMS = {'pyr_scale': 0.5, 'levels': 3, 'winsize': 15, 'iterations': 3,
+              'poly_n': 5, 'poly_sigma': 1.2, 'flags': 0}
+CHUNKSIZE = 500 # number of frame intervals per chunk
+
+
+def chunks(nframes, chunksize=CHUNKSIZE):
+    """Return (start, stop) frame index ranges of chunks of chunksize frame intervals each,
+    overlapping by one frame, so that every pair of successive frames is in some chunk"""
+    return [ (i0, min(i0 + chunksize + 1, nframes))
+             for i0 in range(0, max(nframes - 1, 1), chunksize) ]
+
+def calcchunk(args):
+    """Calculate stats of frames frameis of the movie file, given as (fname, offset,
+    shape), cropped to crop, and flipped vertically if flip. Called in a worker process.
+    Return mean optic flow magnitude (pix/frame) of each frame interval, and contrast and
+    luminance of each frame"""
+    import cv2 # only needed here, and only in workers
+    (fname, offset, shape), frameis, crop, flip, flowparams = args
+    allframes = np.memmap(fname, dtype=np.uint8, mode='r', offset=offset, shape=shape)
+    if flip:
+        allframes = allframes[:, ::-1] # flip frames vertically, a view
+    frames = allframes.take(frameis, axis=0) # read just the required frames from disk
+    if crop != None:
+        (y0, y1), (x0, x1) = crop
+        frames = frames[:, y0:y1, x0:x1]
+    mot = np.zeros(len(frames) - 1)
+    for i in range(len(frames) - 1):
+        flow = cv2.calcOpticalFlowFarneback(frames[i], frames[i+1], None, **flowparams)
+        mag, ang = cv2.cartToPolar(flow[:, :, 0], flow[:, :, 1]) # mag is in pix/frame
+        mot[i] = mag.mean() # average over entire vector flow field in space
+    con = frames.std(axis=(1, 2))
+    lum = frames.mean(axis=(1, 2))
+    return mot, con, lum
+
+def statskey(movie, frameis, crop, flip):
+    """Return cache key of stats of frames frameis of movie. The key hashes the movie
+    file's identity, frameis, crop, flip and FLOWPARAMS, so any change to any of them
+    results in a new key. Unlike cache.key(), it doesn't hash the active Config, which
+    doesn't affect movie stats"""
+    stat = os.stat(movie.fullfname)
+    parts = (os.path.basename(movie.fullfname), stat.st_size, stat.st_mtime_ns,
+             np.asarray(frameis), crop, flip, FLOWPARAMS)
+    h = hashlib.sha1(repr(cache.normalize(parts)).encode()).hexdigest()
+    name = os.path.splitext(os.path.basename(movie.fullfname))[0]
+    return 'moviestats_%s_%s' % (name, h)
+
+def calc(movie, frameis=None, crop=None, flip=True, nprocs=None, chunksize=CHUNKSIZE):
+    """Calculate stats of frames frameis (default: all) of movie, cropped and flipped as in
+    movie.iterframes(), in nprocs processes (default: all cores). Return dict of mean optic
+    flow magnitude 'mot' (pix/frame) of each successive pair of frames, and contrast 'con'
+    and luminance 'lum' of each frame"""
+    allframes = movie.memmap() # reads header, shares memmap with movie registered in MOVIES
+    if frameis is None:
+        frameis = np.arange(len(allframes))
+    frameis = np.asarray(frameis)
+    src = movie.fullfname, movie.offset, allframes.shape
+    args = [ (src, frameis[i0:i1], crop, flip, FLOWPARAMS)
+             for i0, i1 in chunks(len(frameis), chunksize) ]
+    with mp.Pool(nprocs) as pool:
+        results = pool.map(calcchunk, args) # in order
+    nframes = len(frameis)
+    mot, con, lum = np.zeros(nframes - 1), np.zeros(nframes), np.zeros(nframes)
+    for (i0, i1), (cmot, ccon, clum) in zip(chunks(nframes, chunksize), results):
+        mot[i0:i1-1] = cmot
+        con[i0:i1], lum[i0:i1] = ccon, clum # overlapping frame gets the same values
+    return {'mot': mot, 'con': con, 'lum': lum}
+
+def get(movie, frameis=None, crop=None, flip=True, nprocs=None):
+    """Return stats of frames frameis of movie, see calc(). Get them from the cache if
+    they're there, otherwise calculate and cache them"""
+    if frameis is None:
+        frameis = np.arange(len(movie.memmap()))
+    key = statskey(movie, frameis, crop, flip)
+    try:
+        mot, con, lum = cache.get(key)
+        return {'mot': mot, 'con': con, 'lum': lum}
+    except KeyError:
+        pass
+    stats = calc(movie, frameis=frameis, crop=crop, flip=flip, nprocs=nprocs)
+    cache.put(key, (stats['mot'], stats['con'], stats['lum']))
+    return stats
@@ -6,18 +6,17 @@ import time
 import hashlib
 
 import numpy as np
-import pyximport
-pyximport.install(build_in_temp=False, inplace=True)
-import util # .pyx file
-
-import pylab as pl
-import matplotlib as mpl
-from pylab import get_current_fig_manager as gcfm
 
 import core
+import config
+import cache
+from core import util # .pyx file, see core.load_util()
+from core import scipy, pl, mpl, gcfm # lazily imported
 from core import rstrip, getargstr, iterable, toiter, tolist, intround, trimtranges
-from core import mean_accum, lastcmd, RevCorrWindow
+from core import mean_accum, lastcmd
 from core import PTCSNeuronRecord, SPKNeuronRecord
+import spikerate
+import ratematrix
 from dimstimskeletal import Movie
 
 
@@ -139,7 +138,7 @@ class BinaryCode(object):
     phase is leading (codetrain starts earlier in time), +ve is lagging (codetrain starts
     later in time)"""
     def __init__(self, spikes=None, tranges=None, shift=0):
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.kind = 'binary'
         self.spikes = spikes
         if tranges == None:
@@ -217,7 +216,7 @@ class NeuronCode(object):
             self._codes
         except AttributeError: # self._codes doesn't exist yet
             self._codes = {} # create a dict that'll hold Code objects for this Neuron
-        kind = get_ipython().user_ns['CODEKIND']
+        kind = config.get()['CODEKIND']
         if kind == 'binary': # init a new BinaryCode object
             co = BinaryCode(self.spikes, tranges, shift)
             co_hash = co.hash
@@ -247,7 +246,7 @@ class BaseRate(object):
         # Delete their r and t attribs, if they exist, to prevent comparing them below,
         # since those attribs may not have yet been calculated:
         [ d.__delitem__(key) for d in [selfd, otherd]
-          for key in ['r', 't', 'rawr', 'rawt'] if d.has_key(key) ]
+          for key in ['r', 't', 'rawr', 'rawt'] if key in d ]
         if type(self) == type(other) and selfd == otherd:
             return True
         else:
@@ -278,7 +277,7 @@ class BinRate(BaseRate):
         # t sequence demarcates left bin edges, add tres to trange[1] to make t end inclusive:
         t = np.arange(tstart, tend+self.tres, self.tres)
         s = self.neuron.cut(self.trange) # spike times
-        self.r, self.t = np.histogram(self.neuron.spikes, bins=t)
+        self.r, self.t = np.histogram(s, bins=t)
         self.r = self.r / float(self.tres) * 1000000 # spikes/sec
 
     def plot(self):
@@ -321,9 +320,9 @@ class nISIRate(BaseRate):
         # new set of timepoints to interpolate over:
         self.t = np.arange(tstart, t[-1], self.tres)
         if self.interp == 'sah':
-            self.r = sah(t, r, self.t, keep=False)
+            self.r = spikerate.nisirates([s], self.t, nisi=self.nisi)[0]
         elif self.interp == 'linear':
-            f = sig.interpolate.interp1d(t, r, kind='linear') # returns an interpolation f'n
+            f = scipy.interpolate.interp1d(t, r, kind='linear') # returns an interpolation f'n
             self.r = f(self.t) # interpolate over the new timepoints
             # or maybe try sig.resample() instead
         else:
@@ -337,82 +336,61 @@ class nISIRate(BaseRate):
 
 class WnISIRate(BaseRate):
     """Uses a weighted sum of various n inter spike intervals to calculate rate"""
-    pass
-    #def plot(self)
+    def __init__(self, neuron=None, trange=None, nisis=(1, 2, 3, 4), weights=None,
+                 tres=50000):
+        super(WnISIRate, self).__init__(neuron=neuron, trange=trange)
+        self.kind = 'wnisi'
+        self.nisis = tuple(nisis)
+        self.weights = weights if weights == None else tuple(weights)
+        self.tres = tres
+
+    def calc(self):
+        s = self.neuron.cut(self.trange) # spike times
+        self.t = spikerate.timebase(self.trange, self.tres)
+        self.r = spikerate.wnisirates([s], self.t, nisis=self.nisis,
+                                      weights=self.weights)[0]
+
+    def plot(self):
+        super(WnISIRate, self).plot()
+        pl.title('neuron %d - weighted %r-inter-spike-interval spike rate'
+                 % (self.neuron.id, self.nisis))
 
 
 class IDPRate(BaseRate):
-    """Instantaneous discharge probability. See Pauluis and Baker, 2000"""
-    def __init__(self, neuron=None, IDP_a=4, tres=50000):
+    """Instantaneous discharge probability. See Pauluis and Baker, 2000, and
+    spikerate.idpsteps()"""
+    def __init__(self, neuron=None, trange=None, IDP_a=4, pthresh=0.05, tres=50000):
         super(IDPRate, self).__init__(neuron=neuron, trange=trange)
         self.kind = 'idp'
+        self.IDP_a = IDP_a
+        self.pthresh = pthresh
         self.tres = tres
 
     def calc(self):
+        s = self.neuron.cut(self.trange) # spike times
+        self.t = spikerate.timebase(self.trange, self.tres)
+        self.r = spikerate.idprates([s], self.t, a=self.IDP_a, pthresh=self.pthresh)[0]
 
-        # Step 1: find sudden changes in ISI distribution
-        Is = self.neuron.isi() # intervals
-        # y=gdtrc(a,b,x) returns the integral from x to infinity of the gamma probability
-        # density function. See gdtr, gdtri
-        b = IDP_a
-        # stores the interval indices of significant sudden increases in ISI rate:
-        increaseOnsets = []
-        # stores the interval indices of significant sudden decreases in ISI rate:
-        decreaseOnsets = []
-        for (n,I) in enumerate(Is):
-            try:
-                IDP_mu = Is(n+1) # the next interval
-                a = IDP_a / float(IDP_mu)
-                p1 = gdtrc(a,b,I) # integrate from I to infinity
-                IDP_mu = Is(n+2) # the interval after that
-                a = IDP_a / float(IDP_mu)
-                p2 = gdtrc(a,b,I) # integrate from I to infinity
-                if p1 < pthresh and p2 < pthresh:
-                    # then this nth interval was a sudden increase in ISI firing rate
-                    inreaseOnsets.append(n)
-            except IndexError:
-                pass
-            try:
-                IDP_mu = Is(n-1) # the previous interval
-                a = IDP_a / float(IDP_mu)
-                p1 = gdtrc(a,b,I) # integrate from I to infinity
-                IDP_mu = Is(n-2) # the interval before that
-                a = IDP_a / float(IDP_mu)
-                p2 = gdtrc(a,b,I) # integrate from I to infinity
-                if p1 < pthresh and p2 < pthresh:
-                    # then this nth interval was a sudden increase in ISI firing rate
-                    dereaseOnsets.append(n)
-            except IndexError:
-                pass
-
-        print('IDPRATE IS INCOMPLETE!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
-        raise NotImplementedError
-
-        # Step 2: extend back half an ISI from sudden rate increase, and forward half an ISI
-        # from sudden rate decrease
-
-        # Step 3: sample our new ISI rate with extended intervals with sufficient resolution
-        # ISI rate object with with no interpolation:
-        isi = self.neuron.rate(kind='nisi', nisi=1, interp=None)
-        isi.r
-        isi.t
-        isi = sah(isi)
-
-        # use np.piecewise() ?
-    pass
-    #def plot(self)
+    def plot(self):
+        super(IDPRate, self).plot()
+        pl.title('neuron %d - instantaneous discharge probability spike rate'
+                 % self.neuron.id)
 
 
 class GaussRate(BaseRate):
-    """Uses a sliding Gaussian window to calculate firing rate"""
-    def __init__(self, neuron=None, trange=None, width=200000):
+    """Uses a sliding Gaussian window with sigma = width/2 to calculate firing rate,
+    sampled at tres"""
+    def __init__(self, neuron=None, trange=None, width=200000, tres=50000):
         super(GaussRate, self).__init__(neuron=neuron, trange=trange)
         self.kind = 'gauss'
         self.width = width
+        self.tres = tres
 
     def calc(self):
-        # use scipy.signal.gaussian, use just left half to keep it causal
-        raise NotImplementedError
+        self.t = spikerate.timebase(self.trange, self.tres)
+        # use all spikes, so that rates near the ends of trange include spikes just
+        # outside it:
+        self.r = spikerate.gaussrates([self.neuron.spikes], self.t, self.width)[0]
 
     def plot(self):
         super(GaussRate, self).plot()
@@ -420,15 +398,16 @@ class GaussRate(BaseRate):
 
 
 class RectRate(BaseRate):
-    """Uses a sliding rectangular window to calculate firing rate"""
-    def __init__(self, neuron=None, trange=None, width=200000):
+    """Uses a sliding rectangular window to calculate firing rate, sampled at tres"""
+    def __init__(self, neuron=None, trange=None, width=200000, tres=50000):
         super(RectRate, self).__init__(neuron=neuron, trange=trange)
         self.kind = 'rect'
         self.width = width
+        self.tres = tres
 
     def calc(self):
-        # use scipy.signal.boxcar
-        raise NotImplementedError
+        self.t = spikerate.timebase(self.trange, self.tres)
+        self.r = spikerate.rectrates([self.neuron.spikes], self.t, self.width)[0]
 
     def plot(self):
         super(RectRate, self).plot()
@@ -453,7 +432,7 @@ class RatePDF(object):
         # Delete their n and r and logrrange attribs, if they exist, to prevent comparing
         # them below, since those attribs may not have yet been calculated
         [ d.__delitem__(key) for d in [selfd, otherd] for key in ['n', 'r', 'logrrange']
-          if d.has_key(key) ]
+          if key in d ]
         if type(self) == type(other) and selfd == otherd:
             return True
         else:
@@ -467,7 +446,7 @@ class RatePDF(object):
                 if r == 0:
                     safe[i] = 0.1 # set to 0.1 Hz
             # convert back to tuple, is now safe to take log:
-            self.logrrange = log10(tuple(safe))
+            self.logrrange = np.log10(tuple(safe))
             # r sequence demarcates left rate bin edges
             r = np.logspace(start=self.logrrange[0], stop=self.logrrange[1], num=self.nbins,
                             endpoint=True, base=10.0)
@@ -475,8 +454,10 @@ class RatePDF(object):
             r = np.linspace(start=self.rrange[0], stop=self.rrange[1], num=self.nbins,
                             endpoint=True)
         else:
-            raise ValueError('unknown scale: %r' % scale)
-        self.n, self.r = np.histogram(self.rate.r, bins=r, density=self.density)
+            raise ValueError("unknown scale: %r" % self.scale)
+        # same as np.histogram(self.rate.r, bins=r), and as RateMatrix.pdfs() of one row:
+        self.n = ratematrix.hists(self.rate.r, r, density=self.density)[0]
+        self.r = r
 
     def plot(self):
         pl.figure()
@@ -491,7 +472,7 @@ class RatePDF(object):
         elif self.scale == 'linear':
             barwidth = (self.rrange[1]-self.rrange[0]) / float(self.nbins)
         else:
-            raise ValueError('unknown scale: %r' % scale)
+            raise ValueError("unknown scale: %r" % self.scale)
         pl.bar(left=self.r, height=self.n, width=barwidth)
         # need to set scale of x axis AFTER bars have been plotted, otherwise
         # autoscale_view() call in bar() raises a ValueError for log scale:
@@ -525,7 +506,7 @@ class NeuronRate(object):
         elif kind == 'rect':
             ro = RectRate(neuron=self, **kwargs) # init a new RectRate object
         else:
-            raise ValueError('unknown kind: %r' % self.kind)
+            raise ValueError('unknown kind: %r' % kind)
         for rate in self._rates:
             if ro == rate: # need to define special == method for class Rate()
                 # return the first Rate object whose attributes match what's desired,
@@ -578,11 +559,11 @@ class RevCorr(object):
         try:
             self.movie.frames # check if movie frames have been loaded from file
         except AttributeError:
-            # Load as 3D array instead of as a list of 2D arrays, more convenient for
-            # analysis, although will cause memory problems for really big (>1GB movies).
-            # Don't flip the movie frames vertically for OpenGL's bottom left origin, since
-            # we aren't using OpenGL for analysis:
-            self.movie.load(asarray=True, flip=False)
+            # Memory-map as a 3D array instead of loading it, so only the frames that are
+            # actually needed are read from disk, and the same movie file is shared by all
+            # experiments that displayed it. Don't flip the movie frames vertically for
+            # OpenGL's bottom left origin, since we aren't using OpenGL for analysis:
+            self.movie.frames = self.movie.memmap(flip=False)
         self.nt = nt # number of revcorr timepoints
         self.tis = range(0, nt, 1) # revcorr timepoint indices
         # revcorr timepoint values, stored in a list, not an array. Bad behaviour happens
@@ -599,10 +580,11 @@ class RevCorr(object):
     def __eq__(self, other):
         selfd = self.__dict__.copy()
         otherd = other.__dict__.copy()
-        # delete their rcdini and rf attribs, if they exist, to prevent comparing them below,
-        # since those attribs may not have yet been calculated:
+        # delete their rcdini, rf and other results attribs, if they exist, to prevent
+        # comparing them below, since those attribs may not have yet been calculated:
         [ d.__delitem__(key) for d in [selfd, otherd]
-            for key in ['rcdini', 'rf', 'done'] if d.has_key(key) ]
+            for key in ['rcdini', 'rf', 'done', 'sta', 'eigvals', 'eigvecs', 'nspikes']
+            if key in d ]
         if type(self) == type(other) and selfd == otherd:
             return True
         else:
@@ -637,7 +619,7 @@ class RevCorr(object):
                 rf[ti] = norm(rf[ti]) # normalize the rf separately at each timepoint
         rf *= 255 # scale up to 8 bit values
         rf = rf.round().astype(np.uint8) # downcast from float to uint8
-        win = RevCorrWindow(title=title, rfs=[rf], nids=[self.neuron.id], 
+        win = core.RevCorrWindow(title=title, rfs=[rf], nids=[self.neuron.id], 
                             ts=self.ts, scale=scale)
         win.show()
         return win # necessary in IPython
@@ -645,24 +627,49 @@ class RevCorr(object):
 
 class STA(RevCorr):
     """Spike-triggered average revcorr object"""
+    FRAMECHUNKSIZE = 4096 # max number of frames to convert to float64 at a time
+
     def calc(self):
-        RevCorr.calc(self) # run the base calc() steps first
-        #sys.stdout.write('n%d' % self.neuron.id) # prevents trailing space and newline
-        # init a 3D matrix to store the STA at each timepoint. rf == 'receptive field'
-        self.rf = np.zeros([self.nt, self.height, self.width], dtype=np.float64)
-        if self.rcdini == None: # no spikes for revcorr
-            self.done = True # there's nothing to do
+        STA.calcmany([self])
+
+    @staticmethod
+    def calcmany(stas):
+        """Calculate the rf of all STA objects in stas at once. All must share the same
+        experiment, trange and nt. For each timepoint, a sparse (nstas, nframes) matrix
+        counts how many times each frame was picked by each neuron's spikes. A single
+        sparse-dense product of that matrix with the flattened movie frames then gives
+        the sum of picked frames for all neurons, and dividing by the counts gives the
+        means. Frames are only gathered once per timepoint, instead of once per neuron
+        per timepoint. Each rf is cached on disk, and only those not yet in the cache are
+        calculated, see cache.py"""
+        if len(stas) == 0:
             return
-        # converting from uint8 to float64 seems to speed up mean() method a bit:
-        #frames = np.float64(self.movie.frames)
-        frames = self.movie.frames
-        tstart = time.clock()
-        for ti in self.tis:
-            # this can unintentionally introduce -ve valued indices at the left boundary:
-            rcdini = self.rcdini - ti*self.ndinperframe
-            rcdini = rcdini[rcdini >= 0] # remove any -ve valued indices
-            # get the din values (frame indices) at the rcdini for this timepoint:
-            frameis = self.experiment.din[rcdini, 1]
+        sta0 = stas[0]
+        experiment, trange, nt = sta0.experiment, sta0.trange, sta0.nt
+        # look up each rf in the cache, keep track of those that need to be calculated:
+        srcid = cache.sourceid([experiment.r]), cache.sortnames(experiment)
+        uncached, keys = [], []
+        for sta in stas:
+            assert sta.experiment is experiment and sta.nt == nt
+            assert (np.asarray(sta.trange) == trange).all()
+            key = cache.key('STA', srcid, experiment.id, sta.neuron.id, trange, nt)
+            try:
+                sta.rf = cache.get(key)
+            except KeyError:
+                uncached.append(sta)
+                keys.append(key)
+        for sta in uncached:
+            RevCorr.calc(sta) # run the base calc() steps first
+            # init a 3D matrix to store the STA at each timepoint. rf == 'receptive field'
+            sta.rf = np.zeros([sta.nt, sta.height, sta.width], dtype=np.float64)
+        # only bother with those that have spikes for revcorr:
+        spikingstas = [ sta for sta in uncached if sta.rcdini is not None ]
+        if len(spikingstas) > 0:
+            nstas = len(spikingstas)
+            frames = sta0.movie.frames
+            nframes = len(frames)
+            npixels = sta0.height * sta0.width
+            din = experiment.din
             """
             In ptc15, we erroneously duplicated the first frame of the mseq movies at the
             end, giving us one more frame (0 to 65535 for mseq32) than we should have had (0
@@ -673,22 +680,44 @@ class STA(RevCorr):
             Also, note that 65535 is used to indicate blank screen for all movies, so it should
             also be ignored for all movies for revcorr purposes.
             """
-            fname = self.movie.static.fname.lower()
-            frameis = frameis[frameis != 65535] # remove all occurences of 65535
+            fname = sta0.movie.static.fname.lower()
+            ignorefis = [65535]
             if 'mseq16' in fname:
-                frameis = frameis[frameis != 16383] # remove all occurences of 16383
-            # take the mean of all the frames at this timepoint:
-            # slowest way:
-            #self.rf[ti] = frames[frameis].mean(axis=0)
-            # faster way:
-            #self.rf[ti] = frames.mean(axis=0)
-            # much faster way:
-            # collect the relevant frames for this timepoint, take is much faster than
-            # direct indexing
-            pickedframes = frames.take(frameis, axis=0)
-            self.rf[ti] = mean_accum(pickedframes)
-            #self.rf[ti] = mean_accum2(frames, frameis)
-        self.done = True # flag successful completion of calc()
+                ignorefis.append(16383)
+            # all neurons' rcdini concatenated, and the row index of each entry:
+            rcdini = np.concatenate([ sta.rcdini for sta in spikingstas ])
+            rowis = np.concatenate([ np.tile(i, len(sta.rcdini))
+                                     for i, sta in enumerate(spikingstas) ])
+            for ti in sta0.tis:
+                # this can unintentionally introduce -ve valued indices at the left boundary:
+                tircdini = rcdini - ti*sta0.ndinperframe
+                keep = tircdini >= 0 # remove any -ve valued indices
+                # get the din values (frame indices) at the rcdini for this timepoint:
+                frameis = din[tircdini[keep], 1]
+                tirowis = rowis[keep]
+                keep = ~np.isin(frameis, ignorefis)
+                frameis, tirowis = frameis[keep], tirowis[keep]
+                # duplicate (row, frame) entries are summed on conversion to CSC:
+                counts = scipy.sparse.coo_matrix((np.ones(len(frameis)), (tirowis, frameis)),
+                                                 shape=(nstas, nframes)).tocsc()
+                nspikes = np.asarray(counts.sum(axis=1)).ravel() # nframes picked per row
+                # gather only the frames that were picked, a chunk at a time to limit
+                # memory use when converting from uint8 to float64:
+                pickedfis = np.flatnonzero(np.diff(counts.indptr)) # nonzero columns
+                rfs = np.zeros((nstas, npixels), dtype=np.float64)
+                for i0 in range(0, len(pickedfis), STA.FRAMECHUNKSIZE):
+                    fis = pickedfis[i0:i0+STA.FRAMECHUNKSIZE]
+                    chunk = frames.take(fis, axis=0).reshape(len(fis), npixels)
+                    rfs += counts[:, fis].dot(np.float64(chunk))
+                # rows with no picked frames at this timepoint stay as zeros:
+                nspikes = nspikes[:, np.newaxis]
+                np.divide(rfs, nspikes, out=rfs, where=nspikes > 0)
+                for sta, rf in zip(spikingstas, rfs):
+                    sta.rf[ti] = rf.reshape(sta0.height, sta0.width)
+        for sta, key in zip(uncached, keys):
+            cache.put(key, sta.rf)
+        for sta in stas:
+            sta.done = True # flag successful completion of calc()
 
     def plot(self, normed=True, scale=2.0):
         win = RevCorr.plot(self, normed=normed, title=lastcmd(), scale=scale)
@@ -697,22 +726,102 @@ class STA(RevCorr):
 
 
 class STC(RevCorr):
-    """Spike-triggered correlation revcorr object"""
+    """Spike-triggered covariance revcorr object. Each spike triggers a stimulus vector
+    made up of the nt frames preceding it. The mean and the outer-product sum of these
+    vectors are accumulated in batches of spikes, so that only one batch of frames is ever
+    in memory, and the resulting covariance matrix is eigendecomposed to find its top
+    ncomp components. The covariance matrix is (nt*npixels)**2, so use crop and
+    downsample (see Movie.iterframes) to keep that manageable for big movies"""
+    def __init__(self, neuron=None, experiment=None, trange=None, nt=10, ncomp=4,
+                 crop=None, downsample=1, batchsize=1000, dtype=np.float64):
+        """ncomp: number of top eigenvectors to keep
+        batchsize: number of spikes to accumulate at a time
+        dtype: accumulator dtype, np.float32 halves memory use at the cost of precision"""
+        RevCorr.__init__(self, neuron=neuron, experiment=experiment, trange=trange, nt=nt)
+        self.ncomp = ncomp
+        self.crop = crop
+        self.downsample = downsample
+        self.batchsize = batchsize
+        self.dtype = dtype
+        # frame dimensions after cropping and downsampling:
+        self.height, self.width = self.movie.resize(self.movie.frames[:1], crop=crop,
+                                                    downsample=downsample).shape[1:]
+
     def calc(self):
-        print('INCOMPLETE')
-        super(STC, self).calc() # run the general calc() steps
+        RevCorr.calc(self) # run the base calc() steps first
+        nt, height, width = self.nt, self.height, self.width
+        ndims = nt * height * width
+        self.rf = np.zeros([nt, height, width], dtype=np.float64) # top eigenvector
+        self.sta = np.zeros([nt, height, width], dtype=np.float64)
+        self.eigvals = np.zeros(self.ncomp)
+        self.eigvecs = np.zeros([self.ncomp, nt, height, width])
+        self.nspikes = 0
+        if self.rcdini is None: # no spikes for revcorr
+            self.done = True # there's nothing to do
+            return
+        frames = self.movie.frames
+        din = self.experiment.din
+        # din indices for each spike (rows) at each timepoint (columns):
+        rcdinis = (self.rcdini[:, np.newaxis] -
+                   np.arange(nt)[np.newaxis, :] * self.ndinperframe)
+        rcdinis = rcdinis[(rcdinis >= 0).all(axis=1)] # need all nt frames for each spike
+        frameis = din[rcdinis, 1] # nspikes x nt
+        # remove spikes with any blank screen or erroneous frame indices, see STA.calcmany:
+        ignorefis = [65535]
+        if 'mseq16' in self.movie.static.fname.lower():
+            ignorefis.append(16383)
+        frameis = frameis[~np.isin(frameis, ignorefis).any(axis=1)]
+        nspikes = len(frameis)
+        self.nspikes = nspikes
+        if nspikes < 2: # not enough spikes for a covariance
+            self.done = True
+            return
+        # BLAS symmetric rank-k update, only the upper triangle of C is updated in place:
+        C = np.zeros((ndims, ndims), dtype=self.dtype, order='F')
+        syrk, syr = scipy.linalg.blas.get_blas_funcs(('syrk', 'syr'), (C,))
+        shift = None # shift all stimulus vectors by the first one for numerical stability
+        total = np.zeros(ndims, dtype=np.float64) # sum of shifted stimulus vectors
+        for i0 in range(0, nspikes, self.batchsize):
+            batchframeis = frameis[i0:i0+self.batchsize]
+            nbatch = len(batchframeis)
+            # gather just this batch's frames from the movie, nbatch*nt x height x width:
+            X = self.movie.resize(frames.take(batchframeis.ravel(), axis=0),
+                                  crop=self.crop, downsample=self.downsample)
+            X = np.asarray(X, dtype=self.dtype).reshape(nbatch, ndims)
+            if shift is None:
+                shift = X[0].copy()
+            X -= shift
+            total += X.sum(axis=0)
+            C = syrk(alpha=1.0, a=X, beta=1.0, c=C, trans=1, lower=0, overwrite_c=1)
+        mean = total / nspikes # mean shifted stimulus vector
+        # subtract the mean with a BLAS symmetric rank-1 update, also in place and only on
+        # the upper triangle. Never make a full copy of C, nor convert it to float64:
+        C = syr(alpha=-nspikes, x=mean.astype(C.dtype), a=C, lower=0, overwrite_a=1)
+        C /= nspikes - 1 # unbiased covariance
+        self.sta = (mean + shift).reshape(nt, height, width)
+        # top ncomp eigenvalues and eigenvectors, in descending order, from the upper
+        # triangle of C, which is overwritten:
+        ncomp = min(self.ncomp, ndims)
+        eigvals, eigvecs = scipy.linalg.eigh(C, lower=False, overwrite_a=True,
+                                             check_finite=False,
+                                             subset_by_index=[ndims-ncomp, ndims-1])
+        self.eigvals = eigvals[::-1]
+        self.eigvecs = eigvecs[:, ::-1].T.reshape(ncomp, nt, height, width)
+        self.rf = self.eigvecs[0]
+        self.done = True # flag successful completion of calc()
 
-    def plot(self):
-        print('INCOMPLETE')
-        vals = super(STC, self).plot()
-        return vals
-    plot.__doc__ = RevCorr.plot.__doc__
+    def plot(self, normed=True, scale=2.0):
+        """Plot the top eigenvector of the STC. See RevCorr.plot"""
+        win = RevCorr.plot(self, normed=normed, title=lastcmd(), scale=scale)
+        return win # necessary in IPython
 
 
 class NeuronRevCorr(object):
     """Mix-in class that defines the reverse correlation related Neuron methods"""
-    def sta(self, experiment=None, **kwargs):
-        """Returns an existing STA RevCorr object, or creates a new one if necessary"""
+    def sta(self, experiment=None, calc=True, **kwargs):
+        """Returns an existing STA RevCorr object, or creates a new one if necessary. If
+        calc is False, a new STA object is returned without calculating it or adding it to
+        self._stas, which lets STA.calcmany() calculate many of them at once"""
         try:
             self._stas
         except AttributeError: # self._stas doesn't exist yet
@@ -731,11 +840,13 @@ class NeuronRevCorr(object):
                 # return the first STA object whose attributes match what's desired, and
                 # whose calculation done flag is set. This saves on calc() time and
                 # avoids wasting memory with unnecessary sta objects:
-                if _sta.done:
+                if _sta.done or not calc:
                     return _sta
                 else:
                     _sta.calc() # re-run its calc()
                     return _sta
+        if not calc:
+            return sta
         sta.calc() # no matching STA was found, calculate it
         if sta.done: # if calc() completed without error
             self._stas.append(sta) # add it to the STA object list
@@ -770,6 +881,67 @@ class NeuronRevCorr(object):
     stc.__doc__ += getargstr(STC.__init__)
 
 
+def sweepvals(experiment, var):
+    """Return array of values of sweeptable variable var for all sweep indices in
+    experiment. Orientation values are corrected for the experiment's orientation offset"""
+    try:
+        vals = experiment.sweeptable.data[var]
+    except AttributeError:
+        # something different about ptc15, new bug?. Also, sweeptable values are in a list
+        # instead of an array like for post ptc15. Should be converted to an array
+        # somewhere, so it need not be done here? Also, ptc15 experiments are missing
+        # .s and .d attribs, whose contents seems to be found in .oldparams
+        vals = np.asarray(experiment.sweeptable[var])
+    if var == 'ori': # correct for orientation offset by adding it to ori vals
+        if (vals > 180).any():
+            maxori = 360
+        else:
+            maxori = 180
+        vals = vals.copy() # don't modify the sweeptable!
+        try:
+            vals += experiment.s.orioff # static parameter
+        except AttributeError: # for ptc15, should be fixed:
+            vals += experiment.oldparams['orioff'] # static parameter
+        vals %= maxori
+    return vals
+
+def oripref(oris, counts):
+    """Return orientation preference theta (deg), its strength r, and its significance z
+    and p, given spike counts at each of oris (deg). counts can be 2D, with one row per
+    neuron, in which case all returned values are arrays, one value per row"""
+    counts = np.asarray(counts)
+    # don't allow oris > 180 deg, otherwise completely direction independent responses
+    # will cancel out, resulting in no apparent tuning. Do this by taking mod 180. Then,
+    # double all the angles for proper vector summation in polar space. In fact, it seems
+    # doubling renders mod by 180 redundant:
+    orisrad = 2 * np.asarray(oris) * np.pi/180 # angle double, convert from deg to rad
+    x = (counts*np.cos(orisrad)).sum(axis=-1)
+    y = (counts*np.sin(orisrad)).sum(axis=-1)
+    # arctan2 takes sign of x and y into account, then undo the angle doubling:
+    theta = np.arctan2(y, x) / 2 # rad
+    theta = (theta * 180/np.pi) % 180 # rad to deg, limit to 0 to 180
+    n = np.float64(counts.sum(axis=-1))
+    spiking = n > 0
+    # no spikes: return values representing uniform 0 height distribution
+    r = np.zeros(n.shape)
+    # fraction of total spikes:
+    np.divide(np.sqrt(x**2+y**2), n, out=r, where=spiking)
+    # calc significance of r, eq 4.17 From p70 of Statistical Analysis of Circular
+    # Data, by N.I. Fisher, Cambridge University Press, 1993 (1995 paperback
+    # edition). Also, see Wilkie1983. I'm assuming here that n should be the number
+    # of spikes, ie the number of data points used to create all the vectors, not the
+    # number of vectors (which in this application is the number of orientation
+    # conditions).
+    z = n * r**2 # critical value
+    nn = np.where(spiking, n, 1) # avoid division by 0 for non spiking rows
+    p = np.exp(-z) * (1 + (2*z-z**2)/(4*nn) - (24*z-132*z**2+76*z**3-9*z**4)/(288*nn**2))
+    theta = np.where(spiking, theta, 0.0)
+    p = np.where(spiking, p, 1.0)
+    if counts.ndim == 1: # return scalars
+        return theta[()], r[()], z[()], p[()]
+    return theta, r, z, p
+
+
 class Tune(object):
     """Stimulus tuning analysis object"""
     def __init__(self, neuron=None, experiment=None, tdelay=None, strange=None):
@@ -809,15 +981,7 @@ class Tune(object):
         if fixed != None:
             fixedsweepis = []
             for fixedvar, fixedvals in fixed.items():
-                vals = self.experiment.sweeptable.data[fixedvar]
-                if fixedvar == 'ori': # correct for orientation offset by adding
-                    if (vals > 180).any():
-                        maxori = 360
-                    else:
-                        maxori = 180
-                    vals = vals.copy() # don't modify the sweeptable!
-                    vals += self.experiment.s.orioff # static parameter
-                    vals %= maxori
+                vals = sweepvals(self.experiment, fixedvar)
                 sweepis = []
                 for fixedval in toiter(fixedvals):
                     sweepis.append(np.where(vals == fixedval)[0])
@@ -827,25 +991,7 @@ class Tune(object):
             fixedsweepis = core.intersect1d(fixedsweepis)
             #print(fixedsweepis)
         # get values for var at all unique sweep indices:
-        try:
-            vals = self.experiment.sweeptable.data[var]
-        except AttributeError:
-            # something different about ptc15, new bug?. Also, sweeptable values are in a list
-            # instead of an array like for post ptc15. Should be converted to an array
-            # somewhere, so it need not be done here? Also, ptc15 experiments are missing
-            # .s and .d attribs, whose contents seems to be found in .oldparams
-            vals = np.asarray(self.experiment.sweeptable[var])
-        if var == 'ori': # correct for orientation offset by adding it to ori vals
-            if (vals > 180).any():
-                maxori = 360
-            else:
-                maxori = 180
-            vals = vals.copy() # don't modify the sweeptable!
-            try:
-                vals += self.experiment.s.orioff # static parameter
-            except AttributeError: # for ptc15, should be fixed:
-                vals += self.experiment.oldparams['orioff'] # static parameter
-            vals %= maxori
+        vals = sweepvals(self.experiment, var)
         x = np.unique(vals) # x axis
         y = np.zeros(len(x), dtype=int) # spike counts for each variable value
         for vali, val in enumerate(x):
@@ -870,30 +1016,7 @@ class Tune(object):
             except AttributeError: # first time called
                 pass
         self.calc(var=var, fixed=fixed)
-        # don't allow oris > 180 deg, otherwise completely direction independent responses
-        # will cancel out, resulting in no apparent tuning. Do this by taking mod 180. Then,
-        # double all the angles for proper vector summation in polar space. In fact, it seems
-        # doubling renders mod by 180 redundant:
-        oris, counts = self.x, self.y # oris in deg
-        orisrad = 2 * oris * np.pi/180 # angle double, convert from deg to rad
-        x = (counts*np.cos(orisrad)).sum()
-        y = (counts*np.sin(orisrad)).sum()
-        # arctan2 takes sign of x and y into account, then undo the angle doubling:
-        theta = np.arctan2(y, x) / 2 # rad
-        theta = (theta * 180/np.pi) % 180 # rad to deg, limit to 0 to 180
-        n = counts.sum()
-        if n:
-            r = np.sqrt(x**2+y**2) / n # fraction of total spikes
-            # calc significance of r, eq 4.17 From p70 of Statistical Analysis of Circular
-            # Data, by N.I. Fisher, Cambridge University Press, 1993 (1995 paperback
-            # edition). Also, see Wilkie1983. I'm assuming here that n should be the number
-            # of spikes, ie the number of data points used to create all the vectors, not the
-            # number of vectors (which in this application is the number of orientation
-            # conditions).
-            z = n * r**2 # critical value
-            p = np.exp(-z) * (1 + (2*z-z**2)/(4*n) - (24*z-132*z**2+76*z**3-9*z**4)/(288*n**2))
-        else: # no spikes, return values representing uniform 0 height distribution
-            theta, r, z, p = 0.0, 0.0, 0.0, 1.0
+        theta, r, z, p = oripref(self.x, self.y) # oris in deg
         self.theta, self.r, self.z, self.p = theta, r, z, p # save for potential future calls
         return theta, r, z, p
 
@@ -905,40 +1028,52 @@ class Tune(object):
         Ex: r71.n[1].tune().plot('phase0', fixed={'ori':138, 'sfreqCycDeg':[0.4, 0.8]})
         """
         if var == 'ori':
-            theta, r, z, p = self.pref(var=var, fixed=fixed)
-            txt = ('pref=%.2f\n'
-                   'r=%.2f\n'
-                   'z=%.2f\n'
-                   'p=%.6f' % (theta, r, z, p))
+            pref = self.pref(var=var, fixed=fixed)
         else:
             self.calc(var=var, fixed=fixed)
-            ysum = self.y.sum()
-            if ysum != 0:
-                r = self.y.max() / ysum # fraction of spikes at max
-            else:
-                r = 0.0
-            txt = 'peak=%.2f\nr=%.2f' % (self.peak, r)
-
-        # create a new figure:
-        f = pl.figure(figsize=figsize)
-        a = f.add_subplot(111)
-        fontsize = get_ipython().user_ns['fontsize'] # function
-        fs = fontsize() # save original font size
-        a.plot(self.x, self.y, c='e', ls='--', mew=0, mfc='k', ms=10)
-        a.set_ylim(ymin=0)
-        a.set_xlabel(var)
-        a.set_ylabel('spike count')
-        titlestr = lastcmd()
-        titlestr += ' nid%d' % self.neuron.id
-        if title:
-            a.set_title(titlestr)
-        f.canvas.window().setWindowTitle(titlestr)
-        a.text(0.99, 0.99, txt, transform=a.transAxes,
-               horizontalalignment='right', verticalalignment='top')
-        f.tight_layout(pad=0.3) # crop figure to contents
+            pref = None
+        plottune(self.x, self.y, var, self.neuron.id, pref=pref, figsize=figsize,
+                 title=title)
         return self
 
 
+def plottune(x, y, var, nid, pref=None, figsize=(4, 4), title=False):
+    """Plot tuning curve y of neuron nid over values x of tuning var. pref is its
+    (theta, r, z, p) orientation preference, required if var == 'ori'. Shared by
+    Tune.plot() and Recording.tune(), which plots from the tuning curves of all neurons"""
+    if var == 'ori':
+        theta, r, z, p = pref
+        txt = ('pref=%.2f\n'
+               'r=%.2f\n'
+               'z=%.2f\n'
+               'p=%.6f' % (theta, r, z, p))
+    else:
+        ysum = y.sum()
+        if ysum != 0:
+            r = y.max() / ysum # fraction of spikes at max
+        else:
+            r = 0.0
+        txt = 'peak=%.2f\nr=%.2f' % (x[y.argmax()], r)
+
+    # create a new figure:
+    f = pl.figure(figsize=figsize)
+    a = f.add_subplot(111)
+    fontsize = get_ipython().user_ns['fontsize'] # function
+    fs = fontsize() # save original font size
+    a.plot(x, y, c='e', ls='--', mew=0, mfc='k', ms=10)
+    a.set_ylim(ymin=0)
+    a.set_xlabel(var)
+    a.set_ylabel('spike count')
+    titlestr = lastcmd()
+    titlestr += ' nid%d' % nid
+    if title:
+        a.set_title(titlestr)
+    f.canvas.window().setWindowTitle(titlestr)
+    a.text(0.99, 0.99, txt, transform=a.transAxes,
+           horizontalalignment='right', verticalalignment='top')
+    f.tight_layout(pad=0.3) # crop figure to contents
+
+
 class NeuronTune(object):
     """Mix-in class that defines stimulus tuning analysis method"""
     def tune(self, eid=0, tdelay=None, strange=None):
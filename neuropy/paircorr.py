@@ -0,0 +1,95 @@
+"""Pairwise correlations of signals, such as PSTHs, for many neurons at once. Instead of
+building the full (nn, nn) correlation matrix and walking it in nested loops over neuron
+pairs, calculate correlations blockwise in float32, and return them, along with any other
+per-pair quantities such as separations and cell type pair codes, as flat arrays of the
+unique pairs, in the same order as np.triu_indices(nn, 1) and scipy's pdist. Per-pair
+arrays can then be binned by separation or grouped by cell type pair with searchsorted and
+bincount, without any Python loop over pairs"""
+
+import numpy as np
+
+from core import pdist # lazily imported
+
+BLOCKSIZE = 2048 # number of rows of correlations to calculate at a time
+
+
+def zscore(x, dtype=np.float32):
+    """Normalize each row of x to zero mean and unit norm, so that the dot product of any
+    two normalized rows is their correlation coefficient"""
+    x = np.asarray(x, dtype=dtype)
+    x = x - x.mean(axis=1, keepdims=True)
+    norm = np.sqrt((x**2).sum(axis=1, keepdims=True))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x / norm # constant rows become NaN
+
+def corrmat(x, blocksize=BLOCKSIZE, dtype=np.float32):
+    """Return (nn, nn) correlation matrix of rows of x, like np.corrcoef(x), but
+    calculated blockwise in dtype, to save memory for large nn"""
+    z = zscore(x, dtype=dtype)
+    nn = len(z)
+    rho = np.empty((nn, nn), dtype=dtype)
+    for i0 in range(0, nn, blocksize):
+        i1 = min(i0 + blocksize, nn)
+        np.dot(z[i0:i1], z.T, out=rho[i0:i1])
+    return rho
+
+def corrs(x, blocksize=BLOCKSIZE, dtype=np.float32):
+    """Return correlations of all unique pairs of rows of x, in np.triu_indices(nn, 1)
+    order, without ever holding the full correlation matrix in memory"""
+    z = zscore(x, dtype=dtype)
+    nn = len(z)
+    rhos = []
+    for i0 in range(0, nn, blocksize):
+        i1 = min(i0 + blocksize, nn)
+        block = z[i0:i1] @ z[i0:].T # correlations of rows i0:i1 with rows i0:nn
+        # pairs in block whose column comes after their row, in row-major order:
+        rhos.append(block[np.triu_indices(i1-i0, 1, nn-i0)])
+    if len(rhos) == 0:
+        return np.array([], dtype=dtype)
+    return np.concatenate(rhos)
+
+def pairis(nn):
+    """Return row indices i and j of both neurons of each unique pair, i < j"""
+    return np.triu_indices(nn, 1)
+
+def seps(pos):
+    """Return Euclidean separations of all unique pairs of positions pos (one row per
+    neuron), in the same order as corrs()"""
+    return pdist(pos)
+
+def typepairs(types, ntypes, ordered=True):
+    """Return a code for the combination of integer types (one per neuron) of each unique
+    pair, in the same order as corrs(). For pair (i, j), the code is types[i]*ntypes +
+    types[j]. If not ordered, the smaller type always comes first, so (a, b) and (b, a)
+    type pairs share a code"""
+    types = np.asarray(types)
+    i, j = pairis(len(types))
+    ti, tj = types[i], types[j]
+    if not ordered:
+        ti, tj = np.minimum(ti, tj), np.maximum(ti, tj)
+    return ti*ntypes + tj
+
+def group(codes, values, ncodes):
+    """Return list of arrays of values for each code in range(ncodes)"""
+    sortis = np.argsort(codes, kind='stable')
+    edges = np.asarray(codes)[sortis].searchsorted(np.arange(ncodes+1))
+    values = np.asarray(values)[sortis]
+    return [ values[lo:hi] for lo, hi in zip(edges[:-1], edges[1:]) ]
+
+def binstats(x, y, edges):
+    """Bin y by x, given sorted bin edges. Return count, mean x, mean y and stdev y in each
+    of the len(edges)-1 bins. Values of x outside of edges are ignored. Empty bins have
+    mean and stdev NaN"""
+    x, y = np.asarray(x), np.asarray(y)
+    nbins = len(edges) - 1
+    binis = np.searchsorted(edges, x, side='right') - 1
+    binis[x == edges[-1]] = nbins - 1 # right edge of last bin is inclusive
+    keep = (binis >= 0) & (binis < nbins)
+    binis, x, y = binis[keep], x[keep], y[keep]
+    counts = np.bincount(binis, minlength=nbins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xmeans = np.bincount(binis, weights=x, minlength=nbins) / counts
+        ymeans = np.bincount(binis, weights=y, minlength=nbins) / counts
+        yvars = np.bincount(binis, weights=y**2, minlength=nbins) / counts - ymeans**2
+    ystds = np.sqrt(np.maximum(yvars, 0))
+    return counts, xmeans, ymeans, ystds
@@ -6,6 +6,7 @@ from scipy.stats import linregress
 import pylab as pl
 from pylab import get_current_fig_manager as gcfm
 
+import config
 from core import lastcmd, parse_source
 
 
@@ -13,7 +14,7 @@ def sc_si(source, method='mean', sisource='lfp', kind=None, chani=-1, sirange=No
           layers=False, ms=1, figsize=(7.5, 6.5)):
     """Pool recording.sc().si() results across recordings specified by source,
     plot the result"""
-    uns = get_ipython().user_ns
+    uns = config.get()
     if layers == False:
         layers = ['all']
     elif layers == True:
@@ -111,7 +112,7 @@ def sc_si(source, method='mean', sisource='lfp', kind=None, chani=-1, sirange=No
 def mua_si_lfp_si(source, layers=False, ms=1, figsize=(7.5, 6.5)):
     """Pool recording.mua_si_lfp_si() results across recordings specified by source,
     plot the result"""
-    uns = get_ipython().user_ns
+    uns = config.get()
     recs, tracks = parse_source(source)
     lfpsis, muasis = [], []
     for rec in recs:
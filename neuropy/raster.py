@@ -0,0 +1,200 @@
+"""Level-of-detail rendering of population spike rasters. Drawing millions of individual
+spike markers makes a raster window unusably slow, so a LODRaster instead draws:
+
+- when zoomed out, an image of spike counts per neuron per time bin, taken from whichever
+  level of a precalculated CountPyramid has about one bin per screen pixel
+- when zoomed in far enough that few enough spikes are visible, individual ticks for only
+  the spikes in the visible time window
+
+and switches between the two on every change of the x axis limits. Mouse hover lookups of
+the nearest neuron and spike go through a SpikeIndex, instead of scanning all neurons"""
+
+import numpy as np
+
+from core import mpl # lazily imported
+
+
+class CountPyramid(object):
+    """Spike counts of each neuron (rows) in time bins (columns), at multiple resolutions.
+    Level 0 has the narrowest bins, each subsequent level has bins twice as wide as the
+    previous one, down to MINNBINS bins"""
+    MAXNBINS = 2**17 # max number of level 0 bins
+    MINBINW = 1000 # min level 0 bin width, us
+    MINNBINS = 256 # min number of bins in top level
+
+    def __init__(self, spikes, trange):
+        """spikes is a list of sorted spike time arrays (us), one per neuron. Only spikes
+        within trange are counted"""
+        t0, t1 = trange
+        binw = max(self.MINBINW, int(np.ceil((t1 - t0) / self.MAXNBINS)))
+        nbins = max(1, int(np.ceil((t1 - t0) / binw)))
+        counts = np.zeros((len(spikes), nbins), dtype=np.uint32)
+        for i, s in enumerate(spikes):
+            lo, hi = s.searchsorted(trange)
+            binis = ((s[lo:hi] - t0) // binw).astype(np.int64)
+            counts[i] = np.bincount(binis, minlength=nbins)
+        levels = [counts]
+        while counts.shape[1] > self.MINNBINS:
+            if counts.shape[1] % 2: # pad with an empty bin to get an even number of bins
+                counts = np.hstack([counts, np.zeros((len(counts), 1), dtype=np.uint32)])
+            counts = counts[:, 0::2] + counts[:, 1::2] # sum adjacent pairs of bins
+            levels.append(counts)
+        self.levels = levels
+        self.t0 = t0
+        self.binw0 = binw
+
+    def binw(self, k):
+        """Return bin width (us) of level k"""
+        return self.binw0 * 2**k
+
+    def level(self, binw):
+        """Return the coarsest level whose bins are no wider than binw (us)"""
+        if binw <= self.binw0:
+            return 0
+        k = int(np.floor(np.log2(binw / self.binw0)))
+        return min(k, len(self.levels) - 1)
+
+    def counts(self, k, trange):
+        """Return spike counts of level k covering trange (us), and the (start, end) times
+        (us) of the returned bins"""
+        binw = self.binw(k)
+        counts = self.levels[k]
+        nbins = counts.shape[1]
+        i0 = int(np.clip(np.floor((trange[0] - self.t0) / binw), 0, nbins))
+        i1 = int(np.clip(np.ceil((trange[1] - self.t0) / binw), i0, nbins))
+        return counts[:, i0:i1], (self.t0 + i0*binw, self.t0 + i1*binw)
+
+
+class SpikeIndex(object):
+    """Index of neuron rows sorted by y position, for fast lookup of the neuron and spike
+    nearest to a point in the raster. Spike times within each neuron are already sorted,
+    so each lookup is just two binary searches"""
+    def __init__(self, spikes, ys):
+        ys = np.asarray(ys, dtype=np.float64)
+        self.rowis = ys.argsort(kind='stable')
+        self.ys = ys[self.rowis]
+        self.spikes = spikes
+
+    def nearest(self, t, y):
+        """Return row index of the neuron nearest to y, and its spike time nearest to t
+        (us), or None if it has no spikes"""
+        i = self.ys.searchsorted(y)
+        if i == len(self.ys) or (i > 0 and y - self.ys[i-1] <= self.ys[i] - y):
+            i -= 1
+        rowi = self.rowis[i]
+        s = self.spikes[rowi]
+        if len(s) == 0:
+            return rowi, None
+        j = s.searchsorted(t)
+        if j == len(s) or (j > 0 and t - s[j-1] <= s[j] - t):
+            j -= 1
+        return rowi, s[j]
+
+
+class LODRaster(object):
+    """Level-of-detail raster drawn into axes a. spikes is a list of sorted spike time
+    arrays (us), one per neuron, ys and colours are their y positions and RGB(A) colours.
+    Time is displayed in units of tx us. tickheight is the height of each spike tick in y
+    units"""
+    MAXTICKS = 50000 # max number of visible spikes to draw as individual ticks
+
+    def __init__(self, a, spikes, ys, colours, nids, trange, tx=1, tickheight=0.8,
+                 marker='|', size=None, alpha=1.0):
+        self.a = a
+        self.spikes = spikes
+        self.ys = np.asarray(ys, dtype=np.float64)
+        self.colours = mpl.colors.to_rgba_array(colours)
+        self.nids = nids
+        self.trange = np.asarray(trange)
+        self.tx = tx
+        self.tickheight = tickheight
+        self.marker = marker
+        self.size = size
+        self.alpha = alpha
+        self.pyramid = CountPyramid(spikes, trange)
+        self.index = SpikeIndex(spikes, self.ys)
+        self.ticks = None # collection of individual spike ticks
+        self.image = None # image of spike counts
+        a.set_autoscale_on(False) # redraws in update() mustn't change the axes limits
+        a.callbacks.connect('xlim_changed', self.update)
+        a.format_coord = self.format_coord # describe nearest spike on mouse hover
+        self.update()
+
+    def update(self, a=None):
+        """Redraw as either ticks or an image, depending on number of visible spikes"""
+        trange = np.sort(self.a.get_xlim()) * self.tx # visible trange, us
+        trange = np.clip(trange, *self.trange)
+        loshis = [ s.searchsorted(trange) for s in self.spikes ]
+        nvisible = sum( hi - lo for lo, hi in loshis )
+        if self.ticks != None:
+            self.ticks.remove()
+            self.ticks = None
+        if nvisible <= self.MAXTICKS:
+            self.draw_ticks(loshis)
+            if self.image != None:
+                self.image.set_visible(False)
+        else:
+            self.draw_image(trange)
+        self.a.figure.canvas.draw_idle()
+
+    def draw_ticks(self, loshis):
+        """Draw individual ticks for only the visible spikes"""
+        nspikes = np.array([ hi - lo for lo, hi in loshis ])
+        t = np.hstack([ s[lo:hi] for s, (lo, hi) in zip(self.spikes, loshis) ])
+        t = t / self.tx
+        y = np.repeat(self.ys, nspikes)
+        c = np.repeat(self.colours, nspikes, axis=0)
+        if self.marker == '|':
+            segments = np.empty((len(t), 2, 2))
+            segments[:, :, 0] = t[:, np.newaxis]
+            segments[:, 0, 1] = y - self.tickheight / 2
+            segments[:, 1, 1] = y + self.tickheight / 2
+            lw = 1 if self.size == None else self.size / 50 # 50 is the default marker size
+            self.ticks = mpl.collections.LineCollection(segments, colors=c, linewidths=lw,
+                                                        alpha=self.alpha)
+            self.a.add_collection(self.ticks, autolim=False)
+        else:
+            s = 50 if self.size == None else self.size
+            self.ticks = self.a.scatter(t, y, marker=self.marker, c=c, edgecolor='none',
+                                        alpha=self.alpha, s=s)
+
+    def draw_image(self, trange):
+        """Draw spike counts from the pyramid level with about one bin per pixel. Each
+        neuron is painted as a band tickheight high at its y position, with opacity
+        increasing with spike count"""
+        npixels = max(1, int(self.a.bbox.width))
+        k = self.pyramid.level((trange[1] - trange[0]) / npixels)
+        counts, (t0, t1) = self.pyramid.counts(k, trange)
+        # opacity increases logarithmically with spike count, saturating at the 99th
+        # percentile of nonzero counts:
+        nonzero = counts[counts > 0]
+        maxcount = np.percentile(nonzero, 99) if len(nonzero) > 0 else 1
+        opacity = np.clip(np.log1p(counts) / np.log1p(max(maxcount, 1)), 0, 1)
+        # each neuron spans ROWSPERTICK image rows:
+        ROWSPERTICK = 4
+        yres = self.tickheight / ROWSPERTICK
+        y0 = self.ys.min() - self.tickheight / 2
+        nrows = int(np.ceil((self.ys.max() - self.ys.min()) / yres)) + ROWSPERTICK
+        rgba = np.zeros((nrows, counts.shape[1], 4))
+        rowi0s = np.round((self.ys - self.tickheight / 2 - y0) / yres).astype(int)
+        for rowi0, colour, o in zip(rowi0s, self.colours, opacity):
+            spiking = o > 0 # don't paint over other neurons where this one is silent
+            band = rgba[rowi0:rowi0+ROWSPERTICK]
+            band[:, spiking, :3] = colour[:3]
+            band[:, spiking, 3] = o[spiking] * colour[3] * self.alpha
+        extent = t0 / self.tx, t1 / self.tx, y0, y0 + nrows*yres
+        if self.image == None:
+            self.image = self.a.imshow(rgba, extent=extent, origin='lower', aspect='auto',
+                                       interpolation='nearest')
+        else:
+            self.image.set_data(rgba)
+            self.image.set_extent(extent)
+            self.image.set_visible(True)
+
+    def format_coord(self, x, y):
+        """Return string describing the neuron and spike nearest to x, y"""
+        rowi, spike = self.index.nearest(x * self.tx, y)
+        s = 't=%g, y=%g, n%d' % (x, y, self.nids[rowi])
+        if spike != None:
+            s += ', nearest spike at t=%g' % (spike / self.tx)
+        return s
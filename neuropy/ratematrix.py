@@ -0,0 +1,136 @@
+"""Spike count and rate matrices of many neurons at once, one row per neuron, one column
+per time bin, for an arbitrary set of (possibly overlapping, possibly discontiguous) bin
+tranges. All neurons are binned together in a single searchsorted call, instead of looping
+over neurons. Mean rates, rate series, and rate PDFs of all neurons are then just
+different views of the same matrix, optionally restricted to bins within a set of state
+tranges, and optionally smoothed with a Gaussian kernel, see smooth.py. Rate PDFs of all
+rows are histogrammed at once by hists(), which neuron.RatePDF and the meanratepdf()
+methods also use for their single rows"""
+
+import numpy as np
+
+import smooth
+
+
+def bincounts(ts, nis, nn, bins):
+    """Return (nn, nbins) array of spike counts of each of nn neurons in each of bins (can
+    overlap), given spike times ts and the index of the neuron each spike belongs to, nis.
+    Spikes of all neurons are offset to their own nonoverlapping span of time, so that a
+    single sorted array holds all of them, and a single searchsorted finds all bin edges"""
+    ts, nis = np.asarray(ts, dtype=np.int64), np.asarray(nis, dtype=np.int64)
+    bins = np.asarray(bins, dtype=np.int64)
+    t0 = min(ts.min(), bins.min()) if len(ts) > 0 else bins.min()
+    t1 = max(ts.max(), bins.max()) if len(ts) > 0 else bins.max()
+    span = t1 - t0 + 1
+    keys = np.sort(nis*span + (ts - t0))
+    edges = np.arange(nn)[:, np.newaxis, np.newaxis]*span + (bins - t0)
+    tis = keys.searchsorted(edges.ravel()).reshape(nn, len(bins), 2)
+    return tis[..., 1] - tis[..., 0]
+
+def segments(tranges):
+    """Return start and stop indices of runs of tranges whose start times are evenly spaced
+    by the spacing of the first pair, such as the bins of each recording in a track"""
+    t0s = tranges[:, 0]
+    if len(t0s) < 2:
+        return np.array([0]), np.array([len(t0s)])
+    dt0s = np.diff(t0s)
+    breaks = np.where(dt0s != dt0s[0])[0] + 1 # bins that start a new segment
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(t0s)]])
+    return starts, stops
+
+def within(tranges, stranges):
+    """Return bool array of which tranges fall entirely within any of nonoverlapping
+    stranges"""
+    tranges, stranges = np.asarray(tranges), np.asarray(stranges)
+    stranges = stranges[stranges[:, 0].argsort()]
+    sis = stranges[:, 0].searchsorted(tranges[:, 0], side='right') - 1 # last strange start
+    valid = sis >= 0
+    sis[~valid] = 0
+    return valid & (tranges[:, 1] <= stranges[sis, 1])
+
+def hists(rates, edges, density=True):
+    """Return (nrows, len(edges)-1) array of the distribution of the rates in each row of
+    rates (1D or 2D), with rate bin edges, same as np.histogram() of each row, all rows at
+    once. Rates outside of edges are ignored. If density, normalize each row to unit area,
+    as np.histogram() does"""
+    rates = np.atleast_2d(rates)
+    nrows = len(rates)
+    edges = np.asarray(edges)
+    nedges = len(edges)
+    bis = edges.searchsorted(rates, side='right') - 1
+    bis[rates == edges[-1]] = nedges - 2 # last bin includes its right edge
+    valid = (bis >= 0) & (bis < nedges - 1)
+    rowis = np.broadcast_to(np.arange(nrows)[:, np.newaxis], rates.shape)
+    keys = rowis[valid] * (nedges-1) + bis[valid]
+    n = np.bincount(keys, minlength=nrows*(nedges-1)).reshape(nrows, nedges-1)
+    if not density:
+        return n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return n / n.sum(axis=1, keepdims=True) / np.diff(edges)
+
+
+class RateMatrix(object):
+    """Spike counts of neurons (a dict of nid:neuron, such as a recording's or a track's
+    alln) in each of tranges (us), one row per nid in sorted order, one column per trange.
+    Rows and columns of all views can be restricted to a bool mask of tranges, such as one
+    returned by self.mask()"""
+    def __init__(self, neurons, tranges):
+        self.nids = np.sort(list(neurons))
+        self.tranges = np.asarray(tranges)
+        nn = len(self.nids)
+        trains = [ neurons[nid].spikes for nid in self.nids ]
+        if nn == 0:
+            ts, nis = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        else:
+            ts = np.concatenate(trains)
+            nis = np.repeat(np.arange(nn), [ len(train) for train in trains ])
+        self.counts = bincounts(ts, nis, nn, self.tranges) # (nn, nbins)
+        self.widths = (self.tranges[:, 1] - self.tranges[:, 0]) / 1e6 # bin widths, s
+        self.t = self.tranges.mean(axis=1) # mid bins, us
+
+    nn = property(lambda self: len(self.nids))
+    nbins = property(lambda self: len(self.tranges))
+
+    def get_rates(self):
+        """Firing rate (Hz) of each neuron in each bin"""
+        return self.counts / self.widths
+
+    rates = property(get_rates)
+
+    def mask(self, stranges):
+        """Return bool mask of bins that fall entirely within any of stranges, such as
+        those of a given cortical state"""
+        return within(self.tranges, stranges)
+
+    def series(self, mask=None, sigma=None):
+        """Return (nn, nbins) array of rate series (Hz), of bins in mask, if any. If sigma
+        (us), smooth each series with a Gaussian kernel, separately within each run of
+        evenly spaced bins, so that rates never bleed across gaps between recordings"""
+        rates = self.rates
+        if sigma:
+            starts, stops = segments(self.tranges)
+            for start, stop in zip(starts, stops):
+                if stop - start < 2:
+                    continue
+                tres = self.tranges[start+1, 0] - self.tranges[start, 0]
+                smoothed = smooth.gauss(rates[:, start:stop], sigma, tres)
+                # normalize by kernel sum, to keep rates in Hz:
+                rates[:, start:stop] = smoothed / smooth.kernel(sigma, tres).sum()
+        if mask is not None:
+            rates = rates[:, mask]
+        return rates
+
+    def meanrates(self, mask=None):
+        """Return mean rate (Hz) of each neuron over bins in mask, if any. Only makes
+        sense for nonoverlapping bins"""
+        counts, widths = self.counts, self.widths
+        if mask is not None:
+            counts, widths = counts[:, mask], widths[mask]
+        return counts.sum(axis=1) / widths.sum()
+
+    def pdfs(self, edges, mask=None, sigma=None, density=True):
+        """Return (nn, len(edges)-1) array of the distribution of each neuron's rates over
+        bins in mask, with rate bin edges, same as np.histogram() of each row of
+        self.series(), all rows at once, see hists()"""
+        return hists(self.series(mask=mask, sigma=sigma), edges, density=density)
@@ -7,22 +7,19 @@ from pprint import pprint
 import random
 import multiprocessing as mp
 
-from PyQt4 import QtGui
-getOpenFileName = QtGui.QFileDialog.getOpenFileName
-getSaveFileName = QtGui.QFileDialog.getSaveFileName
-
 import numpy as np
-import scipy.stats
-
-import pylab as pl
-from pylab import get_current_fig_manager as gcfm
-import matplotlib as mpl
-
-import pyximport
-pyximport.install(build_in_temp=False, inplace=True)
-import util # .pyx file
 
 import core
+import config
+import cache
+import info
+import trials
+import paircorr
+import coupling
+import ratematrix
+import smooth
+from core import util # .pyx file, see core.load_util()
+from core import QtGui, scipy, pl, mpl, gcfm # lazily imported
 from core import (SpatialPopulationRaster, DensePopulationRaster, Codes, SpikeCorr,
                   binarray2int, nCr, nCrsamples, iterable, entropy_no_sing, lastcmd, intround,
                   tolist, rstrip, dictattr, pmf, TAB, trimtranges)
@@ -30,8 +27,11 @@ from colour import ColourDict, CCWHITEDICT1
 from sort import Sort
 from lfp import LFP
 from experiment import Experiment
-from neuron import DummyNeuron
+from neuron import DummyNeuron, plottune
 from dimstimskeletal import Movie
+from envelope import EnvelopePyramid, EnvelopeLines
+from ratematrix import RateMatrix
+from geometry import Geometry
 
 '''
 # Good global setting for presentation plots:
@@ -108,6 +108,18 @@ class BaseRecording(object):
     pttype = property(lambda self: self.sort.pttype)
     chanpos = property(lambda self: self.sort.chanpos)
 
+    def get_geometry(self):
+        """Positions, layers and pair separations of all neurons in this recording's default
+        sort, stacked once per sort, see geometry.py"""
+        sort = self.sort
+        try:
+            return sort._geometry
+        except AttributeError: # not built yet for this sort
+            sort._geometry = Geometry(sort.alln, self.tr.absname)
+            return sort._geometry
+
+    geometry = property(get_geometry)
+
     def tree(self):
         """Print tree hierarchy"""
         print(self.treebuf.getvalue(), end='')
@@ -149,7 +161,7 @@ class BaseRecording(object):
         lfpfnames.sort()
 
         # load the specified sort, or just the most recent one, or all of them:
-        uns = get_ipython().user_ns
+        uns = config.get()
         if sortname != None: # just load the one specified at the command line
             sortfdnames = [sortname]
         elif not uns['LOADALLSORTS'] and len(sortfdnames) > 0:
@@ -236,7 +248,7 @@ class BaseRecording(object):
         tranges = np.asarray(tranges)
         assert tranges.ndim == 2 # 2D
         assert tranges.shape[1] == 2 # two columns
-        uns = get_ipython().user_ns
+        uns = config.get()
         alln = self.alln
         nids = sorted(alln) # might as well index into sorted nids, still a list
         for trange in tranges:
@@ -296,7 +308,7 @@ class BaseRecording(object):
             neurons = { nid:self.alln[nid] for nid in neurons }
         nn = len(neurons)
 
-        uns = get_ipython().user_ns
+        uns = config.get()
         if width == None:
             width = uns['MUAWIDTH'] # s
         if tres == None:
@@ -360,9 +372,7 @@ class BaseRecording(object):
         counts = spikeis[:, 1] - spikeis[:, 0]
         if gauss:
             sigma = width / 2
-            x = np.arange(-sigma*5, sigma*5, tres) # Gaussian time base of sufficient span
-            kernel = core.g(0, sigma, x) # Gaussian kernel
-            mua = np.convolve(counts, kernel, mode='same') / (width / 1000000) # spikes/s
+            mua = smooth.gauss(counts, sigma, tres) / (width / 1000000) # spikes/s
         else:
             widths = (tranges[:, 1] - tranges[:, 0]) # width of each trange, in us
             mua = counts / (widths / 1000000) # spikes/s
@@ -382,13 +392,19 @@ class BaseRecording(object):
         # underplot horizontal lines:
         for hline in hlines:
             a.axhline(y=hline, c='e', ls='--', marker=None)
+        # plot min/max envelope of the rates instead of every point, at a resolution that
+        # depends on the current zoom level:
+        rates = np.atleast_2d(rates)
+        env = EnvelopePyramid(rates)
         if layers:
-            a.plot(t, rates[0], 'k-', label='all (%d)' % n[0])
-            a.plot(t, rates[1], 'r-', label='superficial (%d)' % n[1])
-            a.plot(t, rates[2], 'g-', label='middle (%d)' % n[2])
-            a.plot(t, rates[3], 'b-', label='deep (%d)' % n[3])
+            labels = ['all (%d)' % n[0], 'superficial (%d)' % n[1], 'middle (%d)' % n[2],
+                      'deep (%d)' % n[3]]
+            colours = ['k', 'r', 'g', 'b']
         else:
-            a.plot(t, rates, 'k-', label='all (%d)' % n)
+            labels, colours = ['all (%d)' % n], ['k']
+        self.mualines = [ EnvelopeLines(a, env, t, rows=[rowi], colors=c, label=label)
+                          for rowi, (label, c) in enumerate(zip(labels, colours)) ]
+        a.autoscale(enable=True, axis='y')
         a.set_xlabel("time (s)")
         a.set_ylabel(ylabel)
         # limit plot to duration of acquistion, in sec:
@@ -404,7 +420,7 @@ class BaseRecording(object):
         gcfm().window.setWindowTitle(titlestr)
         if title:
             a.set_title(titlestr)
-        uns = get_ipython().user_ns
+        uns = config.get()
         sup, mid, deep = uns['LAYERS'][self.tr.absname]
         if title:
             a.text(0.998, 0.99,
@@ -418,6 +434,7 @@ class BaseRecording(object):
             a.legend(loc='upper left', handlelength=1, handletextpad=0.5, labelspacing=0.1)
         f.tight_layout(pad=0.3) # crop figure to contents
 
+    @cache.cached(state=cache.sortnames)
     def mua_si(self, kind=None, width=None, tres=None, muawidth=None, muatres=None,
                upper=75, lower=25, neurons=None, gauss=False, plot=True, layers=False):
         """Calculate a synchrony index from MUA, using potentially overlapping
@@ -458,7 +475,7 @@ class BaseRecording(object):
         state). This is especially the case for signals with mostly unipolar peaks. If the
         peaks are bipolar, median and mean will probably be quite close.
         """
-        uns = get_ipython().user_ns
+        uns = config.get()
         if kind == None:
             kind = uns['MUASIKIND']
         if width == None:
@@ -681,7 +698,7 @@ class BaseRecording(object):
         titlestr = lastcmd()
         gcfm().window.setWindowTitle(titlestr)
         a.set_title(titlestr)
-        uns = get_ipython().user_ns
+        uns = config.get()
         txt = self.name
         if layers:
             sup, mid, deep = uns['LAYERS'][self.tr.absname]
@@ -696,7 +713,7 @@ class BaseRecording(object):
 
     def calc_meanrates(self):
         """Calculate mean firing rates of all neurons in this recording"""
-        RECNEURONPERIOD = get_ipython().user_ns['RECNEURONPERIOD']
+        RECNEURONPERIOD = config.get()['RECNEURONPERIOD']
         if RECNEURONPERIOD == 'recording':
             # calc n.meanrate using entire recording duration:
             for n in self.alln.values():
@@ -723,7 +740,8 @@ class BaseRecording(object):
         a = f.add_subplot(111)
         if bins == None:
             bins = np.arange(0, 1, 0.05)
-        n, mr = np.histogram(self.meanrates, bins=bins, density=False)
+        mr = np.asarray(bins) # rate bin edges
+        n = ratematrix.hists(self.meanrates, mr, density=False)[0]
         binwidth = mr[1] - mr[0] # take width of first bin
         a.bar(left=mr[:-1], height=n, width=binwidth, bottom=0, color='k', ec='k')
         titlestr = lastcmd()
@@ -733,6 +751,28 @@ class BaseRecording(object):
         a.set_ylabel('neuron count')
         f.tight_layout(pad=0.3) # crop figure to contents
 
+    def ratematrix(self, tranges=None, width=None, tres=None, neurons='all'):
+        """Return a RateMatrix of spike counts of neurons ('all', 'quiet', None for active,
+        or a list of nids) in each of tranges (us). If tranges is None, split each of
+        this recording's trange into bins of width and tres (us), which default to config
+        SCWIDTH and SCTRES, same as SpikeCorr. See ratematrix.py"""
+        if neurons is None:
+            neurons = self.n
+        elif type(neurons) == str:
+            neurons = getattr(self, {'quiet': 'qn', 'all': 'alln'}[neurons])
+        else:
+            neurons = { nid:self.alln[nid] for nid in neurons }
+        if tranges is None:
+            uns = config.get()
+            if width == None:
+                width = intround(uns['SCWIDTH'] * 1000000) # convert from sec to us
+            if tres == None:
+                tres = intround(uns['SCTRES'] * 1000000) # convert from sec to us
+            # split_tranges() requires each trange to be wider than width:
+            tranges = [ trange for trange in [self.trange] if trange[1] - trange[0] > width ]
+            tranges = core.split_tranges(tranges, width, tres) # possibly overlapping
+        return RateMatrix(neurons, tranges)
+
     def cch(self, nid0, nid1=None, trange=50, binw=None, shift=None, nshifts=10,
             rate=False, norm=False, c='k', title=True, figsize=(7.5, 6.5)):
         """Plot cross-correlation histogram given nid0 and nid1. If nid1 is None,
@@ -803,6 +843,7 @@ class BaseRecording(object):
         gcfm().window.setWindowTitle(wtitlestr)
         f.tight_layout(pad=0.3) # crop figure to contents
 
+    @cache.cached(state=cache.sortnames)
     def collectcchs(self, nids, trange, bins, shiftcorrect=False, nshifts=50, normalize=False):
         """Collect cross-correlation histograms for all pairs in nids. trange and bins are in
         us. If shiftcorrect, then calculate shift corrector by shifting one spike train in
@@ -920,7 +961,7 @@ class BaseRecording(object):
     def sc_fullcch(self, trange=10000, blrange=1000, binw=None, shiftcorrect=False):
         """Return spike correlations between all cell pairs, calculated from the
         CCH peak relative to baseline. trange and binw are in ms"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         assert trange > blrange
         trange = np.asarray([-trange, trange]) * 1000 # us
         blrange = np.asarray([-blrange, blrange]) * 1000 # us
@@ -954,7 +995,7 @@ class BaseRecording(object):
         without building an actual CCH. trange is duration over which to calculate spike delta
         ts, and blrange is time away from t=0 to start calculating baseline. trange and
         blrange are in ms"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         binw = uns['CODETRES'] # us, typically 20 ms
         binwsec = binw / 1000000 # sec
         trange *= 1000 # us
@@ -1055,7 +1096,7 @@ class BaseRecording(object):
 
         if stats:
             # add stuff to top right of plot:
-            uns = get_ipython().user_ns
+            uns = config.get()
             a.text(0.99, 0.99, '%s\n'
                                'mean = %.3f\n'
                                'median = %.3f\n'
@@ -1087,9 +1128,11 @@ class RecordingRevCorr(BaseRecording):
         e = self.e[eid]
         return e.sta(nids=nids, trange=trange, nt=nt)
 
-    def stc(self, nids=None, eid=0, trange=None, nt=10):
+    def stc(self, nids=None, eid=0, trange=None, nt=10, **kwargs):
+        """Return an STCs RevCorrs object for experiment eid. kwargs are passed on to
+        each Neuron.STC, see Experiment.stc"""
         e = self.e[eid]
-        return e.stc(nids=nids, trange=trange, nt=nt)
+        return e.stc(nids=nids, trange=trange, nt=nt, **kwargs)
 
 
 class RecordingRaster(BaseRecording):
@@ -1205,7 +1248,7 @@ class RecordingRaster(BaseRecording):
             dt = None # reset so that dinrange code is triggered below
 
         # filter sweepis:
-        uns = get_ipython().user_ns
+        uns = config.get()
         NULLDIN = uns['NULLDIN']
         if sweepis == None: # find unique sweep indices, excluding NULLDIN:
             sweepis = np.unique(allsweepis)
@@ -1506,9 +1549,6 @@ class RecordingRaster(BaseRecording):
 
         if gauss:
             bins = core.split_tranges([(xmin, xmax)], tres, tres) # nonoverlapping, in sec
-            sigma = binw / 2
-            x = np.arange(-sigma*5, sigma*5, tres) # Gaussian time base of sufficient span
-            kernel = core.g(0, sigma, x) # Gaussian kernel
         else:
             bins = core.split_tranges([(xmin, xmax)], binw, tres) # overlapping, in sec
         midbins = bins.mean(axis=1)
@@ -1520,18 +1560,18 @@ class RecordingRaster(BaseRecording):
             ts.sort()
             tsiranges = ts.searchsorted(bins) # indices into sorted ts for each bin
             # number of spikes in each bin, normalized by binw:
-            psth = (tsiranges[:, 1] - tsiranges[:, 0]) / binw
-            if gauss: # convolve spike train with gaussian kernel of width binw:
-                psth = np.convolve(psth, kernel, mode='same')
-            if norm == True: # normalize to set peak of this PSTH to 1:
-                psth = psth / psth.max() # ensure float division
-            elif norm == 'ntrials': # normalize by number of trials:
-                psth = psth / ntrials # ensure float division
-            psths.append(psth) # save
+            psths.append((tsiranges[:, 1] - tsiranges[:, 0]) / binw)
             spikets.append(ts) # ragged array of spike times collapsed over trials
+        psths = np.asarray(psths, dtype=np.float64) # one row per neuron
+        if gauss: # convolve spike trains of all neurons with gaussian kernel of width binw:
+            psths = smooth.gauss(psths, binw / 2, tres)
+        if norm == True: # normalize to set peak of each PSTH to 1:
+            psths = psths / psths.max(axis=1, keepdims=True)
+        elif norm == 'ntrials': # normalize by number of trials:
+            psths = psths / ntrials
 
         if plot == False:
-            return midbins, np.asarray(psths), spikets
+            return midbins, psths, spikets
 
         for nidi, nid in enumerate(nids):
             if overlap and nidi > 0:
@@ -1558,6 +1598,25 @@ class RecordingRaster(BaseRecording):
                 a.set_title(titlestr)
             f.tight_layout(pad=0.3) # crop figure to contents
 
+    def psthcorrs(self, nids=None, natexps=False, strange=None, binw=0.02, tres=0.005,
+                  gauss=False, norm=True, blocksize=paircorr.BLOCKSIZE):
+        """Calculate PSTH correlations of all unique pairs of nids. See self.psth() for kwarg
+        details. Correlations are calculated blockwise in float32, and never as a full
+        matrix, see paircorr.py. Return sorted nids, and the correlation and separation (um)
+        of each pair, in np.triu_indices(len(nids), 1) order"""
+        if nids is None:
+            nids = list(self.n) # use active neurons
+        elif type(nids) == str: # use quiet or all neurons
+            nids = list(getattr(self, {'quiet': 'qn', 'all': 'alln'}[nids]))
+        nids = np.sort(tolist(nids)) # same order as returned PSTHs
+        t, psths, spikets = self.psth(nids=nids, natexps=natexps, strange=strange,
+                                      binw=binw, tres=tres, gauss=gauss, norm=norm,
+                                      plot=False)
+        rhos = paircorr.corrs(psths, blocksize=blocksize)
+        pos = np.array([ self.alln[nid].pos for nid in nids ])
+        seps = paircorr.seps(pos)
+        return nids, rhos, seps
+
     def bintraster(self, nids=None, ttranges=None, sweepis=None, eids=None, natexps=False,
                    t0=None, dt=None, blank=False, strange=None,
                    binw=0.02, tres=0.005, gauss=False):
@@ -1577,9 +1636,6 @@ class RecordingRaster(BaseRecording):
         n2totcount = { nid:len(n2ts[nid]) for nid in nids } # total spike count
         if gauss:
             bins = core.split_tranges([(xmin, xmax)], tres, tres) # nonoverlapping, in sec
-            sigma = binw / 2
-            x = np.arange(-sigma*5, sigma*5, tres) # Gaussian time base of sufficient span
-            kernel = core.g(0, sigma, x) # Gaussian kernel
         else:
             bins = core.split_tranges([(xmin, xmax)], binw, tres) # overlapping, in sec
         nbins = len(bins)
@@ -1596,21 +1652,27 @@ class RecordingRaster(BaseRecording):
                 tsiranges = trialts.searchsorted(bins)
                 # number of spikes in each bin:
                 count[triali] = tsiranges[:, 1] - tsiranges[:, 0]
-                if gauss: # convolve spike count with gaussian kernel of width binw:
-                    count[triali] = np.convolve(count[triali], kernel, mode='same')
                 totcount[triali] = nspikes
+            if gauss: # convolve spike counts of all trials with gaussian kernel of width binw:
+                count = smooth.gauss(count, binw / 2, tres)
             n2count[nid] = count
             n2totcount[nid] = totcount
         return n2count, n2totcount, bins, ttranges
 
     def tlfps(self, chani=-1, sweepis=None, eids=None, natexps=False, t0=None, dt=None,
               blank=True, trange=None, plot=True, figsize=(20, 6.5)):
-        """Calculate trial-aligned LFP traces, constrained to trange"""
+        """Calculate trial-aligned LFP traces, constrained to trange. Return trial time and
+        (ntrials, nt) array of LFP traces of channel chani, or if chani is None, (ntrials,
+        nchans, nt) array of LFP traces of all channels"""
+        if plot and chani is None:
+            raise ValueError("can only plot a single chani")
         ttranges, ttrangesweepis, exptrialis = self.trialtranges(
             sweepis=sweepis, eids=eids, natexps=natexps, t0=t0, dt=dt, blank=blank)
-        lfp = self.lfp.get_data()[chani]
+        lfp = self.lfp.get_data()
+        if chani is not None:
+            lfp = lfp[chani]
         t = np.arange(self.lfp.t0, self.lfp.t1, self.lfp.tres) # in us
-        assert len(lfp) == len(t)
+        assert lfp.shape[-1] == len(t)
         ntrials = len(ttranges)
         if trange != None:
             # keep just those trials that fall entirely with trange:
@@ -1620,21 +1682,10 @@ class RecordingRaster(BaseRecording):
             assert ntrials > 0 # if not, trange is too constrictive
             print('ntrials: %d --> %d after applying trange: %s'
                   % (oldntrials, ntrials, np.asarray(trange)))
-        lfps = [] # one row per trial
-        minnt = len(t) # can't be any greater than this
-        for ttrange in ttranges:
-            ti0, ti1 = t.searchsorted(ttrange)
-            nt = ti1 - ti0
-            if nt < minnt:
-                minnt = nt
-            #print('%d ' % nt, end='')
-            # slice out LFP signal that falls within ttranges of this trial:
-            lfptrial = lfp[ti0:ti1] # not all will be exactly the same length
-            lfps.append(lfptrial)
-        # slice each lfptrial down to length of the shortest:
-        for triali in range(ntrials):
-            lfps[triali] = lfps[triali][:minnt]
-        lfps = np.vstack(lfps)
+        # slice out LFP signal that falls within ttranges of each trial, all trials at once,
+        # each one truncated to the length of the shortest:
+        ti0s, minnt = trials.tis(t, ttranges)
+        lfps = trials.gather(lfp, ti0s, minnt) # one row per trial
         t = t[:minnt] / 1e6 # trial time, in s
         t -= t[0] # start trial time at 0
         if plot:
@@ -1660,7 +1711,7 @@ class RecordingRaster(BaseRecording):
               t0=None, dt=None, blank=True, trange=None, plot=True, figsize=(20, 6.5)):
         """Calculate trial-aligned MUA traces, constrained to trange. See self.mua() for
         kwarg details."""
-        uns = get_ipython().user_ns
+        uns = config.get()
         if width == None:
             width = uns['TMUAWIDTH']
         if tres == None:
@@ -1679,21 +1730,10 @@ class RecordingRaster(BaseRecording):
             assert ntrials > 0 # if not, trange is too constrictive
             print('ntrials: %d --> %d after applying trange: %s'
                   % (oldntrials, ntrials, np.asarray(trange)))
-        muas = [] # one row per trial
-        minnt = len(t) # can't be any greater than this
-        for ttrange in ttranges:
-            ti0, ti1 = t.searchsorted(ttrange)
-            nt = ti1 - ti0
-            if nt < minnt:
-                minnt = nt
-            #print('%d ' % nt, end='')
-            # slice out MUA signal that falls within ttranges of this trial:
-            muatrial = mua[ti0:ti1] # not all will be exactly the same length
-            muas.append(muatrial)
-        # slice each muatrial down to length of the shortest:
-        for triali in range(ntrials):
-            muas[triali] = muas[triali][:minnt]
-        muas = np.vstack(muas)
+        # slice out MUA signal that falls within ttranges of each trial, all trials at once,
+        # each one truncated to the length of the shortest:
+        ti0s, minnt = trials.tis(t, ttranges)
+        muas = trials.gather(mua, ti0s, minnt) # one row per trial
         dt = t[1] - t[0] # should be the same for all intervals
         t = t[:minnt] # one trial's worth of timepoints
         t -= t[0] # relative to start of each trial
@@ -1746,7 +1786,7 @@ class RecordingRaster(BaseRecording):
         nn = len(neurons)
         nids = np.sort(list(neurons))
 
-        uns = get_ipython().user_ns
+        uns = config.get()
         if width == None:
             width = uns['TMUAWIDTH']
         if tres == None:
@@ -1803,10 +1843,104 @@ class RecordingRaster(BaseRecording):
 
         return t, muamean
 
+    def tmuacouplings(self, nids=None, signals=None, muanids='all', width=None, tres=None,
+                      gauss=True, sweepis=None, eids=None, natexps=False, t0=None, dt=None,
+                      blank=True, trange=None, nshuffles=0, minlag=None):
+        """Calculate coupling of each of nids to trial-aligned MUA of all other muanids,
+        constrained to trials that fall entirely within trange. Each neuron's signal is its
+        own trial-averaged rate on the same time base as self.tmua(), unless (len(nids),
+        nt) signals, such as PSTHs, are provided. Each neuron's rate is calculated only
+        once, and the leave-one-out MUA of each neuron is the total minus its own rate, see
+        coupling.py. If nshuffles, also calculate a baseline of that many couplings per
+        neuron at random circular lags of the MUA, at least minlag bins (default: the
+        kernel's or bin's width) from 0. Return sorted nids, their couplings, their
+        leave-one-out MUA (Hz/unit), trial time (s), and their (len(nids), nshuffles)
+        shuffled couplings. See self.mua() for other kwarg details"""
+        if nids is None:
+            nids = list(self.n) # use active neurons
+        elif type(nids) == str: # use quiet or all neurons
+            nids = list(getattr(self, {'quiet': 'qn', 'all': 'alln'}[nids]))
+        if muanids is None:
+            muanids = list(self.n)
+        elif type(muanids) == str:
+            muanids = list(getattr(self, {'quiet': 'qn', 'all': 'alln'}[muanids]))
+        nids, muanids = np.asarray(tolist(nids)), np.sort(tolist(muanids))
+        nidsortis = nids.argsort()
+        nids = nids[nidsortis]
+        if signals is not None:
+            signals = np.asarray(signals)[nidsortis] # same order as sorted nids
+        uids = np.union1d(nids, muanids) # all neurons whose rates are needed
+        nu = len(uids)
+
+        uns = config.get()
+        if width == None:
+            width = uns['TMUAWIDTH']
+        if tres == None:
+            tres = uns['TMUATRES']
+        assert tres <= width
+
+        ttranges, ttrangesweepis, exptrialis = self.trialtranges(
+            sweepis=sweepis, eids=eids, natexps=natexps, t0=t0, dt=dt, blank=blank)
+        if trange != None:
+            # keep just those trials that fall entirely with trange:
+            ttranges = trimtranges(ttranges, trange)
+            assert len(ttranges) > 0 # if not, trange is too constrictive
+        ntrials = len(ttranges)
+
+        # spikes of all neurons in temporal order, and the uids index of each one's neuron:
+        spikes = np.concatenate([ self.alln[nid].spikes for nid in uids ])
+        spikeuis = np.repeat(np.arange(nu), [ len(self.alln[nid].spikes) for nid in uids ])
+        sortis = spikes.argsort(kind='stable')
+        spikes, spikeuis = spikes[sortis], spikeuis[sortis]
+        # slice out spikes of all trials at once, referenced to the start of each trial:
+        sis = spikes.searchsorted(ttranges)
+        ns = sis[:, 1] - sis[:, 0]
+        spikeis = np.repeat(sis[:, 0] - np.cumsum(ns) + ns, ns) + np.arange(ns.sum())
+        tspikes = spikes[spikeis] - np.repeat(ttranges[:, 0], ns)
+        tspikeuis = spikeuis[spikeis]
+
+        # bin spikes of all neurons at once, same as self.calc_mua():
+        mindt = (ttranges[:, 1] - ttranges[:, 0]).min() # duration of the shortest trial
+        widthus, tresus = intround(width * 1000000), intround(tres * 1000000)
+        if gauss:
+            bins = core.split_tranges([[0, mindt]], tresus, tresus) # nonoverlapping, in us
+        else:
+            bins = core.split_tranges([[0, mindt]], widthus, tresus) # overlapping, in us
+        counts = ratematrix.bincounts(tspikes, tspikeuis, nu, bins)
+        if gauss:
+            rates = smooth.gauss(counts, widthus / 2, tresus) / width # spikes/s
+        else:
+            widths = (bins[:, 1] - bins[:, 0]) / 1000000 # width of each bin, in s
+            rates = counts / widths # spikes/s
+        rates /= ntrials # trial-averaged rate of each neuron
+        t = bins.mean(axis=1) / 1000000 # trial time, mid bins, in s
+
+        # total MUA, and each of nids' own contribution to it:
+        muais, nidis = uids.searchsorted(muanids), uids.searchsorted(nids)
+        total = rates[muais].sum(axis=0)
+        ismua = np.isin(nids, muanids)
+        own = np.where(ismua[:, np.newaxis], rates[nidis], 0)
+        nmua = len(muanids) - ismua # number of neurons in each leave-one-out MUA
+        loos = (total - own) / np.maximum(nmua, 1)[:, np.newaxis] # Hz/unit
+        if signals is None:
+            signals = rates[nidis]
+        assert signals.shape == own.shape
+        coups = coupling.couplings(signals, total, own)
+        if nshuffles:
+            if minlag == None:
+                minlag = int(np.ceil(width / tres)) # width of kernel or bins, in bins
+            shufcoups = coupling.shufflecouplings(signals, total, own, nshuffles,
+                                                  minlag=minlag)
+        else:
+            shufcoups = np.zeros((len(nids), 0))
+        return nids, coups, loos, t, shufcoups
+
     def tune(self, nids='all', alpha=0.01, eid=0, var='ori', fixed=None,
              tdelay=None, strange=None, plot=True):
         """Plot tuning curves for given neurons, based on stimulus info in experiment eid.
-        alpha significance threshold only applied when var='ori'"""
+        alpha significance threshold only applied when var='ori'. Tuning curves and
+        preferences of all neurons are calculated at once by the experiment's Tunes object.
+        Return the plotted nids and the Tunes object"""
         if nids == None:
             nids = sorted(self.n) # use active neurons
         elif nids == 'quiet':
@@ -1815,21 +1949,20 @@ class RecordingRaster(BaseRecording):
             nids = sorted(self.alln) # use all neurons
         else:
             nids = tolist(nids) # use specified neurons
-        tunes = []
-        for nid in nids:
-            n = self.alln[nid]
-            tune = n.tune(eid=eid, tdelay=tdelay, strange=strange)
-            #in ['ori', 'phase0']: # test circular variables for significance
-            if var == 'ori':
-                theta, r, z, p = tune.pref(var=var, fixed=fixed)
-                if p >= alpha:
-                    continue # skip this nid
-            else:
-                tune.calc(var=var, fixed=fixed)
-            tunes.append(tune)
-            if plot:
-                tune.plot(var=var, fixed=fixed)
-        return tunes
+        tunes = self.e[eid].tunes(nids=nids, tdelay=tdelay, strange=strange)
+        if var == 'ori':
+            # test significance of all nids at once:
+            prefs = np.column_stack(tunes.pref(var=var, fixed=fixed)) # theta, r, z, p
+            x, y = tunes.x, tunes.y
+            nis = np.where(prefs[:, 3] < alpha)[0]
+        else:
+            x, y = tunes.calc(var=var, fixed=fixed)
+            prefs = [None] * len(nids)
+            nis = np.arange(len(nids))
+        if plot:
+            for ni in nis:
+                plottune(x, y[ni], var, tunes.nids[ni], pref=prefs[ni])
+        return [ tunes.nids[ni] for ni in nis ], tunes
 
 
 class RecordingCode(BaseRecording):
@@ -1937,7 +2070,7 @@ class BaseNetstate(object):
     def get_intcodes(self, nids=None, shufflecodes=False):
         """Given neuron indices (ordered LSB to MSB top to bottom), returns an array of the
         integer representation of the neuronal population binary code for each time bin"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         assert uns['CODEKIND'] == 'binary'
         if nids == None:
             # randomly sample CODEWORDLEN bits of the nids
@@ -1947,7 +2080,7 @@ class BaseNetstate(object):
     def intcodesPDF(self, nids=None):
         """Returns the observed pdf across all possible population binary code words,
         labelled according to their integer representation"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         if nids == None:
             # randomly sample CODEWORDLEN bits of the nids
             nids = random.sample(self.cs.nids, uns['CODEWORDLEN'])
@@ -1961,7 +2094,7 @@ class BaseNetstate(object):
         """the F stands for factorial. Returns the probability of getting each population
         binary code word, assuming independence between neurons, taking into account each
         neuron's spike (and no spike) probability"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         if nids == None:
             # randomly sample CODEWORDLEN bits of the nids
             nids = random.sample(self.cs.nids, uns['CODEWORDLEN'])
@@ -2001,7 +2134,7 @@ class BaseNetstate(object):
         """Returns a maximum entropy Ising model that takes into account pairwise
         correlations within neuron codes. R = (R0, R1) torus. Algorithm can be 'CG', 'BFGS',
         'LBFGSB', 'Powell', or 'Nelder-Mead'"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         if nids == None:
             nids = self.cs.nids[0:uns['CODEWORDLEN']]
         #print('nids:', nids.__repr__())
@@ -2036,7 +2169,7 @@ class NetstateIsingHist(BaseNetstate):
     def calc(self, ngroups=5, algorithm='CG'):
         """Collects hi and Jij parameter values computed from ising models
         of ngroups subgroups of cells of size nbits"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.nbits = uns['CODEWORDLEN']
         self.ngroups = ngroups
         self.algorithm = algorithm
@@ -2101,7 +2234,7 @@ class NetstateNspikingPMF(BaseNetstate):
     def calc(self):
         """Calcs the PMF of observing n cells spiking in the same time bin,
         as well as the PMF for indep cells (shuffled codes)"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         nbits = uns['CODEWORDLEN']
         if self.nidswasNone:
             self.nids = random.sample(self.cs.nids, nbits) # randomly sample nbits of the nids
@@ -2175,7 +2308,7 @@ class NetstateScatter(BaseNetstate):
         """Calculates the expected probabilities, assuming a model in ['indep', 'ising',
         'both'], of all possible population codes vs their observed probabilities. R = (R0,
         R1) torus. self's nids are treated in LSB to MSB order"""
-        uns = get_ipython().user_ns
+        uns = config.get()
         self.nbits = uns['CODEWORDLEN']
         self.model = model
         self.R = R
@@ -2253,7 +2386,7 @@ class NetstateScatter(BaseNetstate):
 
         # colour each scatter point according to how many 1s are in the population code word
         # it represents. This is done very nastily, could use a cleanup:
-        tres = get_ipython().user_ns['CODETRES']
+        tres = config.get()['CODETRES']
         if scale == 'freq':
             norm = tres / 1e6 # convert scale to pattern freq in Hz
         elif scale == 'prob':
@@ -2343,7 +2476,7 @@ class NetstateScatter(BaseNetstate):
                            horizontalalignment='left',
                            verticalalignment='top')
         # add stuff to bottom right of plot:
-        uns = get_ipython().user_ns
+        uns = config.get()
         a.text(0.99, 0.01, '%s'
                            'DJS = %s\n'
                            '%.1f%% missing\n'
@@ -2365,7 +2498,7 @@ class NetstateScatter(BaseNetstate):
         """Called during mouse motion over scatterplot figure. Pops up the corresponding
         population code word and its int representation when hovering over a neuron scatter
         point"""
-        tres = get_ipython().user_ns['CODETRES']
+        tres = config.get()['CODETRES']
         if event.xdata != None and event.ydata != None: # if mouse is inside the axes
             i  = approx(event.xdata, self.pobserved/self.norm, rtol=1e-1, atol=0).nonzero()[0] # find for what indices (if any) xdata == pobserved
             ii = approx(event.ydata, self.pexpected[i]/self.norm, rtol=1e-1, atol=0).nonzero()[0] # for those above, find for what index (if any) ydata == pexpected
@@ -2409,7 +2542,7 @@ class NetstateI2vsIN(BaseNetstate):
                                 nsamples=self.ngroups) # do it ngroups times
         I2s = []
         INs = []
-        tres = get_ipython().user_ns['CODETRES']
+        tres = config.get()['CODETRES']
         for groupi, nids in enumerate(self.nidss):
             p1 = np.asarray(self.intcodesFPDF(nids=nids)[0]) # indep model
             p2 = self.ising(nids=nids).p # expected, assuming maxent Ising model
@@ -2463,16 +2596,18 @@ class NetstateDJSHist(BaseNetstate):
     def __call__(self, groupi):
         """Convenient workaround for instance methods not being picklable. Assigning
         __call__ to calc_single eliminates need to pickle calc_single directly. See
-        http://stackoverflow.com/a/6975654/2020363"""
-        return self.calc_single(groupi)
+        http://stackoverflow.com/a/6975654/2020363. Worker processes have no IPython
+        user namespace, so run with the Config that was active when calc was called"""
+        with config.using(self.config):
+            return self.calc_single(groupi)
 
     def calc(self, ngroups=5, models=['indep', 'ising'], R=None, shufflecodes=False,
              algorithm='CG'):
         """Calculates Jensen-Shannon divergences and their ratios
         for ngroups random groups of cells, each of length nbits. R = (R0, R1) torus"""
         t0 = time.time()
-        uns = get_ipython().user_ns
-        self.nbits = uns['CODEWORDLEN']
+        self.config = config.get() # pickled along with self for worker processes
+        self.nbits = self.config['CODEWORDLEN']
         self.ngroups = ngroups
         self.models = models
         self.R = R
@@ -2486,13 +2621,18 @@ class NetstateDJSHist(BaseNetstate):
 
         if self.MULTIPROCESS and ngroups > 5:
             pool = mp.Pool() # init pool of worker processes:
-            # pickle self, then call self.__call__ in each subprocess. Return Jensen-Shannon
-            # divergences for different models and different groups of neurons:
-            self.DJSs = np.asarray(pool.map(self, np.arange(ngroups)))
+            # pickle self, then call self.__call__ in each subprocess. Return observed and
+            # expected distributions for different models and different groups of neurons:
+            ps = pool.map(self, np.arange(ngroups))
             pool.close()
         else: # single process alternative:
-            self.DJSs = np.asarray(map(self.calc_single, np.arange(ngroups)))
+            ps = list(map(self.calc_single, np.arange(ngroups)))
         print()
+        # Jensen-Shannon divergences of all models of all groups, in a single call:
+        ps = np.asarray(ps) # ngroups x nmodels x 2 x nwords
+        nwords = ps.shape[-1]
+        self.DJSs = info.DJS(ps[:, :, 0].reshape(-1, nwords),
+                             ps[:, :, 1].reshape(-1, nwords)).reshape(ngroups, -1)
         
         # for each group of neurons find the log DJS ratios between the two models:
         if len(self.models) == 2:
@@ -2504,14 +2644,15 @@ class NetstateDJSHist(BaseNetstate):
         return self
 
     def calc_single(self, groupi):
-        """Calculate Jensen-Shannon divergence for each model, for one group of neurons"""
+        """Return observed and expected distributions of code words for each model, for
+        one group of neurons. Their divergences are calculated for all groups at once"""
         nids = self.nidss[groupi]
-        DJS = []
+        ps = []
         for modeli, model in enumerate(self.models): # for each model, use the same nids
             nss = NetstateScatter(recording=self.r, experiments=self.e, nids=nids)
             nss.calc(model=model, R=self.R, shufflecodes=self.shufflecodes,
                      algorithm=self.algorithm)
-            DJS.append(core.DJS(nss.pobserved, nss.pexpected))
+            ps.append((nss.pobserved, nss.pexpected))
         if not self.MULTIPROCESS:
             # printing to stdout from multiple processes for the purpose of progress feedback
             # doesn't work right, printouts are naturally out of order, but worse, they all
@@ -2520,7 +2661,7 @@ class NetstateDJSHist(BaseNetstate):
                 print('%d' % groupi, end='')
             else:
                 print('.', end='')
-        return DJS
+        return ps
 
     # valuable attributes to save as results, plus their data types. None means array:
     RESULTS = {'fname':str, 'DJSs':None, 'logDJSratios':None, 'models':list, 'nbits':int,
@@ -2535,6 +2676,7 @@ class NetstateDJSHist(BaseNetstate):
             path = os.path.expanduser(mpl.rcParams['savefig.directory'])
             fname = rstrip(self.title, '.plot()') + '.npz'
             defaultfname = os.path.join(path, fname)
+        getSaveFileName = QtGui.QFileDialog.getSaveFileName
         fname = getSaveFileName(caption="Save DJSHist calc results to",
                                 directory=defaultfname)
         fname = str(fname)
@@ -2549,6 +2691,7 @@ class NetstateDJSHist(BaseNetstate):
         """Restore calc results from arrays in compressed .npz file, selected via
         Open dialog"""
         directory = os.path.expanduser(mpl.rcParams['savefig.directory'])
+        getOpenFileName = QtGui.QFileDialog.getOpenFileName
         fname = getOpenFileName(caption="Restore DJSHist calc results from",
                                 directory=directory,
                                 filter="Numpy files (*.npz);;"
@@ -2639,7 +2782,7 @@ class NetstateS1INvsN(BaseNetstate):
         # nsamples as a f'n of N. For each value of N, take up to maxnsamples of all the
         # other neurons, if that many are even possible
         self.nsamples = [ min(nCr(self.nneurons, r), self.maxnsamples) for r in self.N ]
-        tres = get_ipython().user_ns['CODETRES']
+        tres = config.get()['CODETRES']
         for ni, n in enumerate(self.N): # for all network sizes
             # get a list of lists of neuron indices
             nidss = nCrsamples(objects=list(self.neurons),
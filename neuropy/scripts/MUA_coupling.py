@@ -51,12 +51,11 @@ for rec in urecs:
         # n2count is needed for calculating reliability:
         n2count = rec.bintraster(nids=nids, blank=BLANK, strange=strange,
                                  binw=BINW, tres=TRES, gauss=GAUSS)[0]
-        for nid, psth in zip(nids, psths):
-            muanids = allnids.copy() # use all isolated units in rec to calculate MUA
-            muanids = muanids[muanids != nid] # exclude current nid
-            tmua = rec.tmua(neurons=muanids, width=BINW, tres=TRES, gauss=GAUSS, blank=BLANK,
-                            trange=strange, plot=False)[1] # Hz/unit
-            assert len(psth) == len(tmua)
+        # coupling of each PSTH with tMUA of all other isolated units in rec, all at once:
+        nidcoups = rec.tmuacouplings(nids=nids, signals=psths, muanids=allnids,
+                                     width=BINW, tres=TRES, gauss=GAUSS, blank=BLANK,
+                                     trange=strange)[1]
+        for nid, psth, coup in zip(nids, psths, nidcoups):
             # calculate reliability of this PSTH:
             cs = n2count[nid] # 2D array of spike counts over trial time, one row per trial
             rhos, weights = core.pairwisecorr(cs, weight=WEIGHT, invalid='ignore')
@@ -72,8 +71,6 @@ for rec in urecs:
             rels[statei].append(rel)
             # calculate sparseness of this PSTH:
             spars[statei].append(sparseness(psth))
-            # calculate coupling of this PSTH with tMUA:
-            coup = core.corrcoef(psth, tmua)
             coups[statei].append(coup)
         print()
 
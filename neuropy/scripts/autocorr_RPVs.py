@@ -14,17 +14,16 @@ autocorr for such a short interval are effectively the same thing.
 
 Meant to be copied and pasted into the neuropy console.
 
-TODO: taking xcorr really isn't necessary, only really need to take diff of each spike train
-and count the number of consecutive intervals (ISIs) that fall below RP, but this is the way I
-happened to do it at the time, and I don't want to regenerate my plots at the moment, so I'm
-leaving it be for now.
+RPVs of each spike train, and of each merged pair of spike trains, are counted for all
+pairs at once by util.rpvs(), without actually merging any spike trains. Intervals of 0
+are excluded, as they were when this was done by taking the autocorr with util.xcorr().
 
 TODO: instead of normalizing by number of ISIs (which is typically very large compared to
 nRPVs), normalize by the expected coincidence rate of a historyless Poisson spike train with a
 mean firing rate that corresponds to each cell.
 """
 
-import util
+from core import util # .pyx file, rebuilt if stale, see core.load_util()
 
 RP = 750 # refractory period, us
 REXCL = 0 # exclusion radius, um
@@ -37,57 +36,37 @@ fss = [] # collect fs arrays
 # each row: [nid0, nid1, f0, f1, df]
 farrdtype=[('nid0', np.int64), ('nid1', np.int64),
            ('f0', np.float64), ('f1', np.float64), ('df', np.float64)]
-# convert RP to half trange array, in us
-trange = np.array([0, RP]) # only need to work on one half of the autocorrelogram
 
 for track in tracks:
     print(track.absname)
     neurons = track.alln # dict
     nids = sorted(neurons) # sorted keys
     nn = len(nids)
-    # precalculate nrpvs and f values for reuse in pair loop:
-    nrpvs = np.zeros(nn, dtype=np.int64) # number of refractory period violations, per nid
-    fs = np.zeros(nn, dtype=np.float64) # f values, per nid
-    for nidi, nid in enumerate(nids):
-        s = neurons[nid].spikes # should be sorted
-        dts = util.xcorr(s, s, trange)
-        dts = dts[dts != 0] # remove 0s for autocorr
-        nrpvs[nidi] = len(dts)
-        nISI = len(s) - 1
-        fs[nidi] = nrpvs[nidi] / nISI
+    spikes = [ neurons[nid].spikes for nid in nids ] # each should be sorted
+    nspikes = np.array([ len(s) for s in spikes ])
+    # count RPVs within each neuron (diagonal) and between each pair of neurons (off
+    # diagonal), all at once. The number of RPVs of a merged pair of spike trains is
+    # the sum of the 3:
+    nrpvss = util.rpvs(spikes, RP)
+    nrpvs = np.diag(nrpvss) # number of refractory period violations, per nid
+    fs = nrpvs / (nspikes - 1) # f values, per nid
     fss.append(fs)
-        
+
     maxnpairs = nCr(nn, 2) # maximum number of pairs, actual will be less given REXCL
-    farr = np.zeros(maxnpairs, dtype=farrdtype)
-    pairi = 0
-    for nidi0 in range(nn):
-        for nidi1 in range(nidi0+1, nn): # for all neuron pairs
-            nid0 = nids[nidi0]
-            nid1 = nids[nidi1]
-            n0, n1 = neurons[nid0], neurons[nid1]
-            if core.dist(n0.pos, n1.pos) <= REXCL:
-                continue # skip this pair, they're too close together
-            s0 = n0.spikes # should be sorted
-            s1 = n1.spikes # should be sorted
-            # find dts for the merged spike train:
-            s = np.concatenate([s0, s1])
-            s.sort() # necessary for xcorr
-            mdts = util.xcorr(s, s, trange) # dts of merged spike trains
-            mdts = mdts[mdts != 0] # remove 0s for autocorr
-            nrpv0, nrpv1, nrpvm = nrpvs[nidi0], nrpvs[nidi1], len(mdts)
-            nISI = len(s) - 1
-            f0, f1 = fs[nidi0], fs[nidi1]
-            df = (nrpvm - (nrpv0 + nrpv1)) / nISI
-            farr[pairi] = nid0, nid1, f0, f1, df
-            #f.append(nid0, nid1, f0, f1, df)
-            pairi += 1
-            print('.', end='')
-    npairs = pairi
-    print()
+    nidi0s, nidi1s = np.triu_indices(nn, 1) # all neuron pairs
+    pos = np.array([ neurons[nid].pos for nid in nids ])
+    keep = core.pdist(pos) > REXCL # skip pairs that are too close together
+    nidi0s, nidi1s = nidi0s[keep], nidi1s[keep]
+    nISI = nspikes[nidi0s] + nspikes[nidi1s] - 1 # of the merged spike train
+    # nrpvm - (nrpv0 + nrpv1) is just the number of RPVs between the pair:
+    df = nrpvss[nidi0s, nidi1s] / nISI
+    farr = np.zeros(len(df), dtype=farrdtype)
+    farr['nid0'], farr['nid1'] = np.asarray(nids)[nidi0s], np.asarray(nids)[nidi1s]
+    farr['f0'], farr['f1'], farr['df'] = fs[nidi0s], fs[nidi1s], df
+    npairs = len(farr)
     print('maxnpairs = %d' % maxnpairs)
     print('actual npairs = %d' % npairs)
     print('fs descending: %r' % np.sort(fs)[::-1])
-    farr = farr[:npairs] # trim down to actual number of pairs
     sortis = np.argsort(farr['df'])
     sortis = sortis[::-1] # reverse
     farr = farr[sortis] # sorted by decreasing df values
@@ -2,9 +2,9 @@
 plot distributions and waveforms, as separated by shape thresholds. Run from within neuropy
 using `run -i scripts/cell_type_temporal_spatial.py`"""
 
-import scipy
 from pylab import get_current_fig_manager as gcfm
-from core import intround, argfwhm
+from core import intround
+import waveforms
 
 plotwaves = False
 
@@ -17,37 +17,6 @@ durationthresh = 350 # duration separation threshold
 nbins = 20
 tracks = [ptc15.tr7c, ptc22.tr1, ptc22.tr2] # need to be loaded ahead of time
 
-def calc_t(nt, tres, newtres):
-    """Generate original and desired interpolated timebases t0 and t1, as well as initial
-    guess for where the alignment point is in t1"""
-    tend = nt*tres
-    t0 = np.arange(0, tend, tres)
-    t1 = np.arange(0, tend-tres, newtres)
-    aligni = abs(t1 - alignt).argmin()
-    return t0, t1, aligni
-
-def argextrema(a):
-    """Return indices of local extrema in 1D array a.
-    Taken from http://stackoverflow.com/a/9667121/2020363"""
-    return np.diff(np.sign(np.diff(a))).nonzero()[0] + 1
-
-def arg0xextrema(a):
-    """Return indices of biggest extrema between edges and 0 crossings in 1D array a"""
-    zcis = np.where(np.diff(np.sign(a)) != 0)[0] # zero crossing indices
-    edgeis = np.hstack([0, zcis, len(a)-1]) # add left and right edges
-    extis = []
-    for edgei0, edgei1 in zip(edgeis[:-1], edgeis[1:]):
-        segment = a[edgei0:edgei1]
-        segmentextis = argextrema(segment)
-        if len(segmentextis) > 0: # start and end segments might not have any extrema
-            maxsegmentextii = abs(segment[segmentextis]).argmax()
-            extis.append(segmentextis[maxsegmentextii] + edgei0)
-    return hstack(extis)
-
-
-nt = 50
-tres = 20
-t0, t1, aligni = calc_t(nt, tres, newtres) # initial guess, for speed
 sigmas = []
 rftypes = []
 waves = []
@@ -59,143 +28,73 @@ ipis = [] # interpeak intervals
 duration2s = [] # start of primary to end of secondary peak
 # primary peak asymmetry index, secondary peak asymmetry index, amplitude asymmetry index
 ai1s, ai2s, aais = [], [], []
-#maxslopes = [] # maximum abs slopes of each waveform
-#maxnslopes = [] # maximum abs slopes of each normalized waveform
-#durations = [] # spike duration, measured by time between slope threshold crossings
-#ndurations = [] # spike duration measured from normalized waveforms
-#slopeiss = [] # start and end timepoint indices used for calculating durations
-#nslopeiss = [] # start and end timepoint indices used for calculating ndurations
 allnids = []
 splitis = [] # indices which demarcate neurons from different tracks in allnids
 nswaps = 0
 
-# collect maxchan waveforms and calculate various measures of waveform duration:
+# collect maxchan waveforms and calculate various measures of waveform duration, for all
+# neurons in each track at once:
 for track in tracks:
     splitis.append(len(allnids))
-    if tres != track.tres: # recalculate timepoints
-        tres = track.tres
-        t0, t1, aligni = calc_t(nt, tres, newtres)
     nids = sorted(track.alln)
-    for nid in nids:
-        n = track.alln[nid]
-        if nt != n.nt: # recalculate timepoints
-            nt = n.nt
-            t0, t1, aligni = calc_t(nt, tres, newtres)
-        sigmas.append(n.sigma)
-        rftypes.append(str(n.rftype)) # convert None to string for searching in array
-        maxchani = n.chans.searchsorted(n.maxchan)
-        wave = n.wavedata[maxchani]
-        # interpolate waveforms from original t0 timebase to higher rez t1 timebase:
-        wave = scipy.interpolate.spline(t0, wave, t1)
-        waves.append(wave)
-        Vpp = wave.ptp() # peak-to-peak amplitude
-        Vpps.append(Vpp)
-        nwave = wave / Vpp # normalize peak-to-peak amplitudes
-        nwaves.append(nwave)
-        extis = arg0xextrema(wave) # indices of biggest peaks between 0 crossings and edges
-        extii = abs(extis - aligni).argmin() # extremum closest to aligni
-        exti1 = extis[extii] # index of extremum closest to aligni, assume main extremum
-
-        # find index of extremum to the right of the one closest to aligni. If the one
-        # closest to aligni is already the rightmost, make that one the secondary, and the one
-        # to its left the primary:
-        try:
-            exti2 = extis[extii+1]
-        except IndexError:
-            exti2 = exti1 # make old primary the new secondary
-            # set new primary to be the one to the left, hopefully without another IndexError:
-            exti1 = extis[extii-1]
-            nswaps += 1
-        # 0.75 seems to give max fwhm2 bimodality, but 0.5 gives best overall clusterability
-        # in fwhm2 vs aai space
-        li1, ri1 = argfwhm(wave, exti1, fraction=0.5)
-        li2, ri2 = argfwhm(wave, exti2, fraction=0.5)
-        fwhm1 = (ri1 - li1) * newtres
-        fwhm2 = (ri2 - li2) * newtres
-        #ti1, ti2 = wave.argmax(), wave.argmin() # previously used biggest peaks for ipi
-        ipi = (exti2 - exti1) * newtres # interval between primary and secondary peaks
-        duration2 = (ri2 - li1) * newtres # start of primary to end of secondary peak
-        ext1medt, ext2medt = (li1 + ri1)/2, (li2 + ri2)/2
-        ext1width, ext2width = ri1 - li1, ri2 - li2
-        # new measure of peak temporal asymmetry: time between mode and median, normalized
-        # by peak width:
-        ai1 = (exti1 - ext1medt) / ext1width
-        ai2 = (exti2 - ext2medt) / ext2width
-        #ext1wave, ext2wave = wave[li1:ri1], wave[li2:ri2]
-        #ext1mean, ext2mean = ext1wave.mean(), ext2wave.mean()
-        #ext1med, ext2med = np.median(ext1wave), np.median(ext2wave)
-        #ext1std, ext2std = ext1wave.std(), ext2wave.std()
-        # nonparametric skew, not really what I want:
-        #ai1 = (ext1mean - ext1med) / ext1std
-        #ai2 = (ext2mean - ext2med) / ext2std
-        # old measure of peak temporal asymmetry:
-        #ai1 = (ri1 - exti1) / (exti1 - li1) # asymmetry index of primary peak
-        #ai2 = (ri2 - exti2) / (exti2 - li2) # asymmetry index of secondary peak
-        V1, V2 = abs(wave[exti1]), abs(wave[exti2])
-        aai = (V1 - V2)/(V1 + V2) # amplitude asymmetry index
-        fwhm1s.append(fwhm1)
-        fwhm2s.append(fwhm2)
-        ipis.append(ipi)
-        duration2s.append(duration2)
-        ai1s.append(ai1)
-        ai2s.append(ai2)
-        aais.append(aai)
-        if plotwaves:
+    neurons = [ track.alln[nid] for nid in nids ]
+    sigmas.extend([ n.sigma for n in neurons ])
+    # convert None to string for searching in array:
+    rftypes.extend([ str(n.rftype) for n in neurons ])
+    templates, maxchans = waveforms.stack(neurons)
+    # interpolate maxchan waveforms from track.tres to higher rez newtres, all at once:
+    trackwaves = waveforms.upsample(waveforms.maxchan(templates, maxchans),
+                                    track.tres, newtres)
+    # Primary peak is the biggest peak between 0 crossings closest to alignt, secondary
+    # is the one to its right. 0.75 seems to give max fwhm2 bimodality, but 0.5 gives best
+    # overall clusterability in fwhm2 vs aai space:
+    f = waveforms.features(trackwaves, newtres, alignt, fraction=0.5)
+    waves.extend(trackwaves)
+    Vpps.extend(f['Vpp'])
+    nwaves.extend(trackwaves / f['Vpp'][:, np.newaxis]) # normalize peak-to-peak amplitudes
+    fwhm1s.append(f['fwhm1'])
+    fwhm2s.append(f['fwhm2'])
+    ipis.append(f['ipi']) # interval between primary and secondary peaks
+    duration2s.append(f['duration2']) # start of primary to end of secondary peak
+    # measure of peak temporal asymmetry: time between mode and median, normalized by peak
+    # width:
+    ai1s.append(f['ai1'])
+    ai2s.append(f['ai2'])
+    aais.append(f['aai']) # amplitude asymmetry index
+    nswaps += f['swapped'].sum()
+    allnids.extend(nids)
+    if plotwaves:
+        # extremum indices, 0 where they couldn't be found:
+        exti1s = intround(np.nan_to_num(f['t1']) / newtres)
+        exti2s = intround(np.nan_to_num(f['t2']) / newtres)
+        li1s, ri1s = waveforms.argfwhm(trackwaves, exti1s)
+        li2s, ri2s = waveforms.argfwhm(trackwaves, exti2s)
+        for nidi, (nid, wave) in enumerate(zip(nids, trackwaves)):
+            li1, ri1, li2, ri2 = li1s[nidi], ri1s[nidi], li2s[nidi], ri2s[nidi]
+            exti1, exti2 = exti1s[nidi], exti2s[nidi]
             figure()
             plot(wave, 'k')
             # plot fwhm of primary and secondary peaks:
-            nit = len(t1) # number of interpolated timepoints
-            minri1 = min(ri1, nit)
-            minri2 = min(ri2, nit)
-            plot(np.arange(li1, minri1), wave[li1:minri1], 'r')
-            plot(np.arange(li2, minri2), wave[li2:minri2], 'b')
+            plot(np.arange(li1, ri1), wave[li1:ri1], 'r')
+            plot(np.arange(li2, ri2), wave[li2:ri2], 'b')
             # plot points used for ipi:
             plot(exti1, wave[exti1], 'g', ms=10)
             plot(exti2, wave[exti2], 'g', ms=10)
-            titlestr = 'wave %d (%s)' % (len(fwhm1s)-1, track.absname + '.n%d' % nid)
+            titlestr = 'wave %d (%s)' % (splitis[-1]+nidi, track.absname + '.n%d' % nid)
             gcfm().window.setWindowTitle(titlestr)
-        '''
-        absslope = abs(np.diff(wave)) / newtres # uV/us
-        maxslopes.append(max(absslope))
-        nabsslope = abs(np.diff(nwave)) / newtres # 1/us
-        maxnslopes.append(max(nabsslope))        
-        # another way to measure waveform duration is to see over what duration the abs(slope)
-        # is greater than something close to 0. Starting from each end, at what timepoint does
-        # the slope exceed this minimum threshold? Difference between timepoints is duration
-        # of waveform
-        slopeis = np.where(absslope > absslopethresh)[0]
-        if len(slopeis) < 2:
-            # exclude cells whose slope isn't above threshold for at least two timepoints:
-            duration = 0
-            slopeiss.append([0, 0])
-        else:
-            duration = (slopeis[-1] - slopeis[0]) * newtres
-            slopeiss.append([slopeis[0], slopeis[-1]])
-        durations.append(duration)
-        # repeat for normalized waveforms:
-        nslopeis = np.where(nabsslope > nabsslopethresh)[0]
-        if len(nslopeis) < 2:
-            # exclude cells whose slope isn't above threshold for at least two timepoints:
-            nduration = 0
-            nslopeiss.append([0, 0])
-        else:
-            nduration = (nslopeis[-1] - nslopeis[0]) * newtres
-            nslopeiss.append([nslopeis[0], nslopeis[-1]])
-        ndurations.append(nduration)
-        '''
-        allnids.append(nid)
-        # - as an alternative to using absslopethresh, measure the fwhm of the last
-        # extremum in each waveform. Looking at the overplotted waveforms, that, strangely,
-        # is where I see the most dichotomy. Not so much in the first peak.
-        # - try taking sum of slopes, or sum of 2nd derivatives, across entire waveform
-        # - plot Vpp
-        # - best of all might be to find the time between inflection points around the later of
-        # the two biggest peaks. However, this really would require using longer waveforms
-        # to ensure the inflection point after the second peak is found. Or, just estimate
-        # it manually for the few templates that don't have one. Also, might require some
-        # smoothing to get around the occasional noise in the slope
+    # - as an alternative to using absslopethresh, measure the fwhm of the last
+    # extremum in each waveform. Looking at the overplotted waveforms, that, strangely,
+    # is where I see the most dichotomy. Not so much in the first peak.
+    # - try taking sum of slopes, or sum of 2nd derivatives, across entire waveform
+    # - plot Vpp
+    # - best of all might be to find the time between inflection points around the later of
+    # the two biggest peaks. However, this really would require using longer waveforms
+    # to ensure the inflection point after the second peak is found. Or, just estimate
+    # it manually for the few templates that don't have one. Also, might require some
+    # smoothing to get around the occasional noise in the slope
 
 waves = np.asarray(waves)
+t1 = np.arange(waves.shape[1]) * newtres # interpolated timebase, us
 nwaves = np.asarray(nwaves)
 Vpps = np.asarray(Vpps)
 sigmas = np.hstack(sigmas)
@@ -6,7 +6,8 @@ from matplotlib import gridspec
 
 from scipy.stats import mannwhitneyu
 
-from core import sparseness, ceilsigfig, corrcoef
+from core import sparseness, ceilsigfig
+from trials import otherscorrs
 
 FIGSIZE = (6, 3)
 YLABELX = -0.06
@@ -46,14 +47,12 @@ for rec in urecs:
         MAXMUA[rec.absname] = max(MAXMUA[rec.absname], muas.max())
         ntrials = len(lfps)
         assert ntrials == len(muas)
+        # measure reliability as correlation of each trial with mean of all others.
+        # To exclude last sec of blankscreen in each trial, set BLANK=False:
+        LFPCORRS[statei].extend(otherscorrs(lfps))
+        MUACORRS[statei].extend(otherscorrs(muas))
         for triali in range(ntrials):
-            # measure reliability as correlation of each trial with mean of all others.
-            # To exclude last sec of blankscreen in each trial, set BLANK=False:
             lfptrial, muatrial = lfps[triali], muas[triali]
-            otheris = np.ones(ntrials, dtype=bool)
-            otheris[triali] = False # exclude current trial
-            LFPCORRS[statei].append(corrcoef(lfptrial, lfps[otheris].mean(axis=0)))
-            MUACORRS[statei].append(corrcoef(muatrial, muas[otheris].mean(axis=0)))
             LFPSPARS[statei].append(sparseness(abs(lfptrial)))
             MUASPARS[statei].append(sparseness(muatrial))
 
@@ -22,9 +22,8 @@ def cost(p, x, y):
 f1 = figure(1)
 allrates = []
 for track, c in zip(tracks, colours):
-    trackrates = sorted([ n.meanrate for n in track.alln.values() ])[::-1] # reverse order
+    trackrates = np.sort(track.meanrates)[::-1] # reverse order
     plot(trackrates, '--', c=c, linewidth=3, label=track.absname)
-    trackrates = np.asarray(trackrates)
     n = len(trackrates)
     print(track.absname)
     print('%.2f %% neurons < 1 Hz' % ((trackrates < 1).sum() / n * 100))
@@ -5,7 +5,6 @@ scripts/movie_motion_contrast_luminance.py`"""
 
 import os
 
-import cv2
 import numpy as np
 
 from scipy.stats import kurtosis, kurtosistest
@@ -16,14 +15,6 @@ from core import intround, ceilsigfig
 # sort recordings by their absname:
 urecs = [ eval(recname) for recname in sorted(REC2STATETRANGES) ] # unique, no reps, sorted
 
-pyr_scale = 0.5
-levels = 3
-winsize = 15
-iterations = 3
-poly_n = 5
-poly_sigma = 1.2
-flags = 0
-
 FIGSIZE = (6, 3)
 PLOTMOVIESIGNALS = True
 
@@ -56,20 +47,9 @@ for rec in urecs:
     print(name)
     e0 = rec.e0
     movie = e0.e
-    # load movie data for this recording, flips frames vertically by default
-    # for bottom left origin:
-    movie.load()
     degpermoviepix = e0.s.widthDeg / movie.ncellswide
     dt = e0.d.sweepSec # frame duration in seconds
-    # converting all the frames from a list of arrays to a 3D numpy array is slow and
-    # unnecessary. Take just the required frames before converting to an array:
-    allframes = movie.frames
     frameis = np.asarray(e0.d.framei) # movie frame indices used by this recording
-    frames = []
-    for framei in frameis:
-        frames.append(allframes[framei]) # dereference
-    frames = np.asarray(frames)
-    nframeintervals = len(frameis) - 1
     # calculate spatial limits of movie frames that were actually displayed:
     screenwidth = e0.I['SCREENWIDTHCM'] * e0.I['DEGPERCM'] # deg
     screenheight = e0.I['SCREENHEIGHTCM'] * e0.I['DEGPERCM']
@@ -93,35 +73,27 @@ for rec in urecs:
     bottomscredge_wrt_bottommviedge = halfmovieheight - mvicenter_wrt_bottomscredge
     y0i = intround(bottomscredge_wrt_bottommviedge / degpermoviepix)
     y1i = intround((bottomscredge_wrt_bottommviedge + screenheight) / degpermoviepix)
-    frames = frames[:, y0i:y1i, x0i:x1i]
     print('xis: %d:%d, yis: %d:%d' % (y0i, y1i, x0i, x1i))
-    print('movie shape:', frames.shape)
-
-    # optic flow magnitudes, in deg/sec, one per frame interval:
-    mot[name] = np.zeros(nframeintervals)
-    con[name] = np.zeros(nframeintervals)
-    dcon[name] = np.zeros(nframeintervals)
-    lum[name] = np.zeros(nframeintervals)
-    dlum[name] = np.zeros(nframeintervals)
-    frame0 = frames[0] # init
-    for i, frame1 in enumerate(frames[1:]):
-        flow = cv2.calcOpticalFlowFarneback(frame0, frame1, pyr_scale, levels, winsize,
-                                            iterations, poly_n, poly_sigma, flags)
-        mag, ang = cv2.cartToPolar(flow[:, :, 0], flow[:, :, 1]) # mag is in pix/frame
-        # average over entire vector flow field in space, convert from pix/frame to deg/sec:
-        mot[name][i] = mag.mean() * degpermoviepix / dt
-        con[name][i] = frame1.std()
-        dcon[name][i] = frame1.std() - frame0.std()
-        lum[name][i] = frame1.mean()
-        dlum[name][i] = frame1.mean() - frame0.mean()
-        frame0 = frame1 # update for next iteration
+    print('movie shape:', (len(frameis), y1i-y0i, x1i-x0i))
+
+    # optic flow magnitudes, contrast and luminance of the displayed frames, flipped
+    # vertically for bottom left origin. Calculated in parallel the first time, and cached
+    # to disk per movie, frame sequence and crop:
+    stats = movie.stats(frameis=frameis, crop=((y0i, y1i), (x0i, x1i)), flip=True)
+    # average over entire vector flow field in space, convert from pix/frame to deg/sec,
+    # one per frame interval:
+    mot[name] = stats['mot'] * degpermoviepix / dt
+    con[name] = stats['con'][1:]
+    dcon[name] = np.diff(stats['con'])
+    lum[name] = stats['lum'][1:]
+    dlum[name] = np.diff(stats['lum'])
 
     motspars[name] = core.sparseness(mot[name])
     # this doesn't measure the actual frame times, but there isn't any reason for their
     # actual display time to differ, on average, over all trials and recordings, vs how long
     # dimstim was told to display them for:
-    tmovie[name] = np.arange(1, len(frames)) * dt
-    tmoviefilm[name] = np.arange(1, len(frames)) / MOVIEFRAMERATE
+    tmovie[name] = np.arange(1, len(frameis)) * dt
+    tmoviefilm[name] = np.arange(1, len(frameis)) / MOVIEFRAMERATE
 
     if not PLOTMOVIESIGNALS:
         continue
@@ -41,10 +41,10 @@ for track in tracks:
         nids = [ neuron.id for neuron in neurons ] # corresponding nids
         tracknids.append(nids)
         snids = [] # significantly tuned nids for this rec
-        for nid in nids:
+        # orientation preferences of all nids at once:
+        recthetas, recrs, reczs, recps = rec.e[0].tunes(nids=nids).pref(var='ori')
+        for nid, theta, r, p in zip(nids, recthetas, recrs, recps):
             neuron = rec.alln[nid]
-            tune = neuron.tune()
-            theta, r, z, p = tune.pref(var='ori')
             if not p < ALPHA:
                 continue # insignificant tuning, skip to next nid
             if nid in rs and r <= rs[nid]:
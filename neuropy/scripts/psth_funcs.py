@@ -6,7 +6,8 @@ import pylab as pl
 from pylab import get_current_fig_manager as gcfm
 import numpy as np
 
-from core import argfwhm, dist
+import paircorr
+from core import argfwhm
 
 # until spyke is also converted to Python 3, have to use a copy of gac.pyx from spyke:
 #spykepath = '/home/mspacek/dev/spyke/' # where spyke (http://spyke.github.io) is installed
@@ -52,15 +53,9 @@ def get_nids_psths(rec, strange, kind='responsive', blank=False,
 
 def get_seps(nids, nd):
     """Build flattened array of distances between all unique pairs in nids, given neuron
-    dict nd"""
-    nn = len(nids)
-    lti = np.tril_indices(nn, -1) # lower triangle (below diagonal) indices, ie unique pairs
-    seps = []
-    for nidi0, nidi1 in np.asarray(lti).T:
-        sep = dist(nd[nids[nidi0]].pos, nd[nids[nidi1]].pos)
-        seps.append(sep)
-    seps = np.hstack(seps)
-    return seps
+    dict nd, in upper triangle (np.triu_indices(nn, 1)) order"""
+    pos = np.array([ nd[nid].pos for nid in nids ])
+    return paircorr.seps(pos)
 
 def plot_psth(psthparams, nid, fmt='k-', alpha=0.8, ms=6, mew=2, ymax=None, yticks=None,
               figsize=(24, 7)):
@@ -9,6 +9,7 @@ from scipy.stats import ttest_1samp, ttest_ind, ks_2samp
 import core
 from core import get_ssnids, ceilsigfig, floorsigfig, scatterbin
 
+import paircorr
 from psth_funcs import get_seps
 
 FIGSIZE = (3, 3)
@@ -43,15 +44,13 @@ def psthcorr(rec, nids=None, ssnids=None, ssseps=None, natexps=False, strange=No
     # results, probably doesn't matter for calculating corrs:
     midbins, psths, spikets = rec.psth(nids=nids, natexps=natexps, strange=strange, plot=False,
                                        binw=0.02, tres=0.005, norm=True)
-    rho = np.corrcoef(psths) # defaults to bias=1
+    rho = paircorr.corrmat(psths) # float32, calculated blockwise
     rho[np.diag_indices(nn)] = np.nan # nan the diagonal, which imshow plots as white
     ssrho = np.zeros((nnss, nnss)) # superset rho matrix
     ssrho.fill(np.nan) # init with nans
     # load up values into appropriate spots in superset rho matrix:
-    for i in range(nn):
-        for j in range(nn):
-            ssi, ssj = ssnids.searchsorted([nids[i], nids[j]])
-            ssrho[ssi, ssj] = rho[i, j]
+    ssis = ssnids.searchsorted(nids)
+    ssrho[np.ix_(ssis, ssis)] = rho
 
     if plot == False:
         return ssrho
@@ -72,8 +71,8 @@ def psthcorr(rec, nids=None, ssnids=None, ssseps=None, natexps=False, strange=No
     tight_layout(pad=0.3)
 
     # plot rho histogram:
-    lti = np.tril_indices(nnss, -1) # lower triangle (below diagonal) indices of ssrho
-    ssrhol = ssrho[lti]
+    uti = np.triu_indices(nnss, 1) # upper triangle (above diagonal) indices of ssrho
+    ssrhol = ssrho[uti]
     notnanis = np.logical_not(np.isnan(ssrhol)) # indices of non-nan values
     fssrhol = ssrhol[notnanis] # ssrhol filtered out for nans
     fssrholmean = fssrhol.mean()
@@ -140,8 +139,8 @@ def psthcorrdiff(rhos, seps, basetitle):
     tight_layout(pad=0.3)
 
     # plot rho difference histogram:
-    lti = np.tril_indices(nn, -1) # lower triangle (below diagonal) indices
-    rhol = rhod[lti]
+    uti = np.triu_indices(nn, 1) # upper triangle (above diagonal) indices
+    rhol = rhod[uti]
     notnanis = np.logical_not(np.isnan(rhol)) # indices of non-nan values
     frhol = rhol[notnanis] # rhol filtered out for nans
     frholmean = frhol.mean()
@@ -173,17 +172,10 @@ def psthcorrdiff(rhos, seps, basetitle):
     # scatter plot:
     pl.plot(fseps, frhol, 'k.')
     # bin seps and plot mean rho in each bin:
-    sortis = np.argsort(fseps)
-    seps = fseps[sortis]
-    rhos = frhol[sortis]
+    seps = fseps
     sepbins = np.arange(0, seps.max()+SEPBINW, SEPBINW) # left edges
-    sepis = seps.searchsorted(sepbins)
-    sepmeans, rhomeans, rhostds = [], [], []
-    for sepi0, sepi1 in zip(sepis[:-1], sepis[1:]): # iterate over sepbins
-        sepmeans.append(seps[sepi0:sepi1].mean()) # mean sep of all points in this sepbin
-        rhoslice = rhos[sepi0:sepi1] # rhos in this sepbin
-        rhomeans.append(rhoslice.mean()) # mean rho of all points in this sepbin
-        rhostds.append(rhoslice.std()) # std of rho in this sepbin
+    # mean sep, mean rho and std of rho of all points in each sepbin:
+    counts, sepmeans, rhomeans, rhostds = paircorr.binstats(seps, frhol, sepbins)
     #pl.plot(sepmeans, rhomeans, 'r.-', ms=10, lw=2)
     errorbar(sepmeans, rhomeans, yerr=rhostds, fmt='r.-', ms=10, lw=2, zorder=9999)
     xlim(xmin=0, xmax=SEPMAX)
@@ -224,27 +216,21 @@ def psthcorrtype(trackrecs, pool=False, alpha=ALPHA1, vmin=VMIN, vmax=VMAX,
         ssrhos[nanis] = 0 # replace nans with 0s
         maxabsssrhos = core.maxabs(ssrhos, axis=0) # keep only the max rho of each cell pair
         alln = track.alln
-        for i in range(nn):
-            ni = alln[ssnids[i]] # neuron i
-            si = celltype2int[ni.spiketype]
-            ri = celltype2int[ni.rftype]
-            for j in range(i+1, nn): # use only upper triangle, don't double count cell pairs
-                nj = alln[ssnids[j]] # neuron j
-                sj = celltype2int[nj.spiketype]
-                rj = celltype2int[nj.rftype]
-                rho = maxabsssrhos[i, j]
-                if rho == 0:
-                    # ignore this cell pair's rho (they were never simultaneously active) so it
-                    # doesn't mess up the celltype stats
-                    continue
-                # fill in the upper triangle of rhotype matrix:
-                rhotype[si, sj].append(rho)
-                rhotype[ri, rj].append(rho)
-                # these cross terms should best be left disabled, because they conflate the
-                # correlations between spiketype and rftype:
-                #rhotype[ri, sj].append(rho)
-                #rhotype[si, rj].append(rho)
-                npairs += 1
+        sis = [ celltype2int[alln[nid].spiketype] for nid in ssnids ]
+        ris = [ celltype2int[alln[nid].rftype] for nid in ssnids ]
+        # use only upper triangle, don't double count cell pairs:
+        rhos = maxabsssrhos[paircorr.pairis(nn)]
+        # ignore rho of cell pairs that were never simultaneously active, so they don't mess
+        # up the celltype stats:
+        keep = rhos != 0
+        rhos = rhos[keep]
+        # fill in rhotype matrix, with spiketype pairs and rftype pairs. Cross terms between
+        # spiketype and rftype are best left out, because they conflate the two:
+        for types in (sis, ris):
+            codes = paircorr.typepairs(types, 8)[keep]
+            for code, typerhos in enumerate(paircorr.group(codes, rhos, 8*8)):
+                rhotype.flat[code].extend(typerhos)
+        npairs += len(rhos)
         rhotypemeans = np.zeros(rhotype.shape); rhotypemeans.fill(nan)
         rhotypestds = np.zeros(rhotype.shape); rhotypestds.fill(nan)
         rhotypeps = np.zeros(rhotype.shape); rhotypeps.fill(np.inf)
@@ -10,6 +10,7 @@ from scipy.stats import mannwhitneyu, chisquare, linregress # ttest_1samp, ttest
 import core
 from core import ceilsigfig, floorsigfig, scatterbin, intround
 
+import paircorr
 from psth_funcs import get_nids_psths, get_psth_peaks_gac, get_seps
 
 BLANK = False # consider blank periods between trials?
@@ -66,7 +67,7 @@ for rec in urecs:
         nidslist[slabel].append(nids)
 
         # calculate signal correlations:
-        rho = np.corrcoef(psths) # rho matrix, defaults to bias=1
+        rho = paircorr.corrmat(psths) # rho matrix, float32, calculated blockwise
         diagis = np.diag_indices(nn)
         rho[diagis] = np.nan # nan the diagonal, which imshow plots as white
 
@@ -81,13 +82,13 @@ for rec in urecs:
             errs.append(err.ravel()) # flatten across trials for use in corrcoef()
         errs = np.asarray(errs)
         # calculate corrs between flattened 2D err arrays for all cell pairs:
-        nrho = np.corrcoef(errs)
+        nrho = paircorr.corrmat(errs)
         nrho[diagis] = np.nan # nan the diagonal, which imshow plots as white
 
         # collect rho and nrho values:
-        lti = np.tril_indices(nn, -1) # lower triangle indices of rho matrix
-        rhoslist[slabel].append(rho[lti])
-        nrhoslist[slabel].append(nrho[lti])
+        uti = np.triu_indices(nn, 1) # upper triangle indices of rho matrix
+        rhoslist[slabel].append(rho[uti])
+        nrhoslist[slabel].append(nrho[uti])
 
         # collect corresponding pairwise neuron separation distances:
         sepslist[slabel].append(get_seps(nids, rec.alln))
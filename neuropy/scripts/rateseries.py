@@ -42,31 +42,27 @@ for track in tracks:
             else:
                 rectranges.append(trange)
     rectranges = np.array(rectranges)
-    nids = np.sort(list(track.alln))
-    nn = len(nids)
+    # bin spikes of all neurons in all rectranges at once, one row per neuron, nid order is
+    # (or should be) also depth order:
+    rm = track.ratematrix(tranges=split_tranges(rectranges, width, tres)) # in us
+    nids = rm.nids
+    nn = rm.nn
+    allrates = rm.rates # spike rate per bin, in Hz
+    allrates[allrates == 0.0] = np.nan # replace 0s with nans so they're ignored by plot()
     figure(figsize=figsize)
     axes(axisbg=bg) # set background color
     # plot rates for each rectrange separately, so lines aren't drawn across time gaps:
     for rectrange in rectranges: # one per recording
-        recrates = [] # one row per neuron for this recording
-        tranges = split_tranges([rectrange], width, tres) # possibly overlapping bins, in us
-        midtranges = tranges.mean(axis=1) / 1e6 / 3600 # midpoints of tranges, in hours
-        #nmuspikes = np.zeros(len(tranges), dtype=np.int64) # count multiunit spikes per bin
-        for nidi, nid in enumerate(nids): # nid order is (or should be) also depth order
-            n = track.alln[nid]
-            spikeis = n.spikes.searchsorted(tranges) # slice indices into spikes
-            nspikes = spikeis[:, 1] - spikeis[:, 0] # number of spikes in each trange
-            #nmuspikes += nspikes # accumulate
-            rate = nspikes / (width / 1e6) # spike rate per bin, in Hz
-            rate[rate == 0.0] = np.nan # replace 0s with nans so they're ignored by plot()
+        mask = rm.mask([rectrange]) # bins of this recording
+        midtranges = rm.t[mask] / 1e6 / 3600 # midpoints of bins, in hours
+        recrates = allrates[:, mask] # one row per neuron for this recording
+        for nidi, rate in enumerate(recrates):
             if cmap:
                 cmapi = nidi / nn # from 0 to just under 1, cmaps wrap at 1
                 c = cmap(cmapmax*cmapi)
             else:
                 c = CCDICT[nidi] # use nidi to maximize colour alternation
             plot(midtranges, rate, '-', lw=lw, c=c, alpha=alpha)
-            recrates.append(rate)
-        recrates = np.vstack(recrates)
         trackrates.append(recrates)
         ## NOTE: np.nansum replaces nans with 0. scipy.stats.nanmean ignores nans completely
         # plot (arithmetic) meanrate line in transparent red:
@@ -9,12 +9,9 @@ simin, simax = 0, 1
 kind = 'L/(L+H)'
 PLOTTIMESERIES = True # also plot time series of each recording, not just distributions
 
-try:
-    SICACHE
-except NameError:
-    SICACHE = {} # init, caches sicalc results
-
 def calcsi(recs):
+    """Collect SI signals from all recs. LFP.si results are cached on disk, see cache.py,
+    except when plotting"""
     sis = []
     plot = False
     if len(recs) == 1:
@@ -30,11 +27,7 @@ def sihist(recs=None, basetitle='', sis=None):
     """Plot SI histogram across all recordings in recs"""
     # collect SI signals from all recs:
     if sis == None:
-        try:
-            sis = SICACHE[basetitle]
-        except KeyError:
-            sis = calcsi(recs)
-            SICACHE[basetitle] = sis # cache it
+        sis = calcsi(recs)
     else:
         pass # use sis provided by caller
 
@@ -87,7 +80,7 @@ for track in tracks:
     sihist(sorted(track.r.values()), track.absname)
 
 # plot histogram across all tracks:
-sis = np.hstack([ SICACHE[track.absname] for track in tracks ])
+sis = np.hstack([ calcsi(sorted(track.r.values())) for track in tracks ])
 sihist(basetitle='all tracks', sis=sis)
 dthourall = np.sum([ track.dthour for track in tracks ])
 print('all tracks: %.3f h' % dthourall)
@@ -2,6 +2,7 @@
 are Vpp, sx, x0, y0. Run with 'run -i scripts/sparams.py' or copy and paste into neuropy
 console"""
 
+import spikeparams
 from colour import CCBLACKDICT0, CCWHITEDICT0 # for plotting on black or white
 
 # style: 'points' or 'lines'. Binned lines have less detail but better visibility:
@@ -63,7 +64,7 @@ tm = 0.35 # top margin
 vpplbwh, sxlbwh, xlbwh, ylbwh  = [], [], [], []
 spikess, maxts, xtickss = [], [], []
 for tracki, spikefname in enumerate(spikefnames):
-    spikes = np.load(spikefname) # record array
+    spikes = spikeparams.load(spikefname) # memory-mapped record array
     spikess.append(spikes)
     maxt = spikes['t'].max() / 1e6 / 3600 # convert from us to hours
     xticks = range(0, intround(maxt), 2) # steps of 2 hours
@@ -115,29 +116,22 @@ for tracki, track in enumerate(tracks):
         bint = tranges[:, 0]
         if plotdydt:
             binys = []
+        # mean of each spike param of each neuron in each bin, np.nan for empty bins:
+        counts, means, stds = spikeparams.binstats(spikes, nids, tranges * 3600 * 1e6)
     # plot data for each nid, one at a time:
     for nidi, nid in enumerate(nids):
-        sids, = np.where(spikes['nid'] == nid)
-        t, vpp, sx, x, y = ts[sids], vpps[sids], sxs[sids], x0s[sids], y0s[sids]
-        t = t / 1e6 / 3600 # convert from us to hours
         c = CCDICT[nidi] # use nidi to maximize colour alternation
         if style == 'points':
+            sids, = np.where(spikes['nid'] == nid)
+            t, vpp, sx, x, y = ts[sids], vpps[sids], sxs[sids], x0s[sids], y0s[sids]
+            t = t / 1e6 / 3600 # convert from us to hours
             vppa.plot(t, vpp, '.', ms=1, c=c)
             sxa.plot(t, sx, '.', ms=1, c=c)
             xa.plot(t, x, '.', ms=1, c=c)
             ya.plot(t, y, '.', ms=1, c=c)
         elif style == 'lines':
-            tiranges = t.searchsorted(tranges)
-            # split each series into values that fall within each bin (defined by its trange),
-            # then take mean of each bin, using np.nan for empty bins:
-            binvpp = [ vpp[tirange[0]:tirange[1]] for tirange in tiranges ]
-            binvpp = np.array([ vals.mean() if len(vals) > 0 else np.nan for vals in binvpp ])
-            binsx = [ sx[tirange[0]:tirange[1]] for tirange in tiranges ]
-            binsx = np.array([ vals.mean() if len(vals) > 0 else np.nan for vals in binsx ])
-            biny = [ y[tirange[0]:tirange[1]] for tirange in tiranges ]
-            biny = np.array([ vals.mean() if len(vals) > 0 else np.nan for vals in biny ])
-            binx = [ x[tirange[0]:tirange[1]] for tirange in tiranges ]
-            binx = np.array([ vals.mean() if len(vals) > 0 else np.nan for vals in binx ])
+            binvpp, binsx = means['Vpp'][nidi], means['sx'][nidi]
+            binx, biny = means['x0'][nidi], means['y0'][nidi]
             if plotdydt:
                 binys.append(biny)
                 continue # don't bother plotting the sparams_lines figure
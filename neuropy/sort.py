@@ -7,6 +7,7 @@ import datetime
 import numpy as np
 
 import core
+import config
 from core import (PTCSHeader, MATHeader, SPKHeader, TAB, EPOCH, dictattr, rstrip, eof,
                   td2usec, intround)
 from neuron import Neuron, TrackNeuron
@@ -27,7 +28,7 @@ class Sort(object):
     def get_n(self):
         """Return dict of neurons that meet MINRATE"""
         n = {}
-        MINRATE = get_ipython().user_ns['MINRATE']
+        MINRATE = config.get()['MINRATE']
         for neuron in self.alln.values():
             if neuron.meanrate >= MINRATE:
                 n[neuron.id] = neuron
@@ -38,7 +39,7 @@ class Sort(object):
     def get_qn(self):
         """Return dict of quiet neurons, ie those that fail to meet MINRATE"""
         qn = {}
-        MINRATE = get_ipython().user_ns['MINRATE']
+        MINRATE = config.get()['MINRATE']
         for neuron in self.alln.values():
             if neuron.meanrate < MINRATE:
                 qn[neuron.id] = neuron
@@ -136,7 +137,7 @@ class TrackSort(object):
     def get_n(self):
         """Return dict of neurons that meet MINRATE"""
         n = {}
-        MINRATE = get_ipython().user_ns['MINRATE']
+        MINRATE = config.get()['MINRATE']
         for neuron in self.alln.values():
             if neuron.meanrate >= MINRATE:
                 n[neuron.id] = neuron
@@ -147,7 +148,7 @@ class TrackSort(object):
     def get_qn(self):
         """Return dict of quiet neurons, ie those that fail to meet MINRATE"""
         qn = {}
-        MINRATE = get_ipython().user_ns['MINRATE']
+        MINRATE = config.get()['MINRATE']
         for neuron in self.alln.values():
             if neuron.meanrate < MINRATE:
                 qn[neuron.id] = neuron
@@ -174,9 +175,6 @@ class TrackSort(object):
         self.tres = sort.tres
         # get the union of all nids in recs:
         nids = tr.get_allnids()
-        spikes = {}
-        for nid in nids:
-            spikes[nid] = [] # init each value to empty list
         alln = {} # dict of first Neurons encountered across recordings
         for rec in recs:
             # store time delta between start of track and start of rec:
@@ -184,19 +182,15 @@ class TrackSort(object):
             rec.tdsec = rec.td / 1e6
             rec.tdmin = rec.tdsec / 60
             rec.tdhour = rec.tdmin / 60
-            # for each neuron in this recording append appropriately offset spikes
-            # array to entry in spikes dict:
             for n in rec.alln.values():
-                spikes[n.id].append(n.spikes + rec.td)
                 # for each nid, store the first neuron encountered when iterating over
                 # recordings;
                 if n.id not in alln:
                     alln[n.id] = n
+        self.concatspikes(recs, nids)
 
         nspikes = 0 # add them up
         for nid in nids:
-            spikes[nid] = np.hstack(spikes[nid]) # concatenate each nid's spikes arrays:
-            assert (np.sort(spikes[nid]) == spikes[nid]).all() # should come out sorted
             # replace Neuron with TrackNeuron:
             n = alln[nid]
             tn = TrackNeuron(self)
@@ -214,7 +208,7 @@ class TrackSort(object):
             tn.wavedata = n.wavedata
             tn.wavestd = n.wavestd
             # assign spikes and calc static attribs:
-            tn.spikes = spikes[nid]
+            tn.spikes = self.spikes[self.spikeslices[nid]] # view into shared buffer
             tn.nspikes = len(tn.spikes)
             tn.trange = tn.spikes[0], tn.spikes[-1]
             tn.dt = tn.trange[1] - tn.trange[0]
@@ -227,3 +221,35 @@ class TrackSort(object):
 
         self.nspikes = nspikes
         self.alln = alln # save it
+
+    def concatspikes(self, recs, nids):
+        """Concatenate spikes of each nid across all recs, offset by each rec's td, into a
+        single contiguous int64 buffer, self.spikes. Each nid's spikes occupy their own
+        slice of the buffer, stored in the self.spikeslices dict. Each rec must already
+        have its td attrib set"""
+        # first pass: count each nid's spikes across all recs, to find its slice:
+        nidnspikes = dict.fromkeys(nids, 0)
+        for rec in recs:
+            for n in rec.alln.values():
+                nidnspikes[n.id] += len(n.spikes)
+        self.spikeslices = {}
+        i0 = 0
+        for nid in nids:
+            self.spikeslices[nid] = slice(i0, i0+nidnspikes[nid])
+            i0 += nidnspikes[nid]
+        self.spikes = np.empty(i0, dtype=np.int64) # one buffer for all spikes of all nids
+        # second pass: copy appropriately offset spikes of each neuron into the buffer:
+        nidi0s = { nid: sl.start for nid, sl in self.spikeslices.items() } # fill pointers
+        for rec in recs:
+            for n in rec.alln.values():
+                i0 = nidi0s[n.id]
+                i1 = i0 + len(n.spikes)
+                buf = self.spikes[i0:i1]
+                buf[:] = n.spikes
+                buf += rec.td # in place, no temporary
+                nidi0s[n.id] = i1
+        # each nid's spikes should come out sorted, O(n) check:
+        for nid in nids:
+            if not core.issorted(self.spikes[self.spikeslices[nid]]):
+                raise RuntimeError("n%d spikes aren't sorted across recordings in %r"
+                                   % (nid, self.tr.absname))
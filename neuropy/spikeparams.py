@@ -0,0 +1,67 @@
+"""Time binned spike parameters, such as Vpp, sx, x0 and y0, of all neurons in a spyke .spike
+file, for drift and position stability analyses. A .spike file is a record array with one
+record per spike, sorted by spike time. It's memory-mapped instead of read, and all
+fields of all neurons are binned at once: spikes are stably sorted by neuron id, which
+keeps each neuron's spikes sorted by time, then the bin edges of all neurons are found
+with a single searchsorted call, and per-bin sums with np.add.reduceat"""
+
+import numpy as np
+
+FIELDS = ['Vpp', 'sx', 'x0', 'y0']
+
+
+def load(fname):
+    """Return record array of spikes in spyke .spike file fname, memory-mapped read-only"""
+    return np.load(fname, mmap_mode='r')
+
+def binsums(vals, los, his):
+    """Return sum of vals[lo:hi] for each lo, hi in los, his. Empty slices sum to 0"""
+    # reduceat sums between consecutive indices, so interleave los and his, and keep only
+    # every other sum. Pad with a 0 so that his can point to one past the last value:
+    vals = np.append(vals, 0)
+    idx = np.empty(2*len(los), dtype=np.int64)
+    idx[0::2], idx[1::2] = los, his
+    sums = np.add.reduceat(vals, idx)[0::2]
+    sums[los == his] = 0 # reduceat returns vals[lo] for empty slices
+    return sums
+
+def binstats(spikes, nids, tranges, fields=FIELDS):
+    """Return spike counts, and the mean and stdev of each of fields of the spikes of each
+    of nids within each of tranges (in us, can overlap). Counts are an (nn, nbins) array,
+    means and stdevs are dicts of (nn, nbins) arrays, indexed by field, NaN where there
+    are no spikes"""
+    nids = np.asarray(nids)
+    tranges = np.asarray(tranges)
+    nn, nbins = len(nids), len(tranges)
+    spikenids = np.asarray(spikes['nid'])
+    # keep only spikes of nids, and sort them by nid, keeping each nid's spikes sorted by t:
+    keep = np.isin(spikenids, nids)
+    sortis = np.where(keep)[0][np.argsort(spikenids[keep], kind='stable')]
+    t = np.asarray(spikes['t'])[sortis].astype(np.int64)
+    # offset each nid's spike times to its own nonoverlapping span of time, so that one
+    # sorted array holds all of them, and a single searchsorted finds all bin edges:
+    t0, t1 = tranges.min(), tranges.max()
+    if len(t) > 0:
+        t0, t1 = min(t0, t.min()), max(t1, t.max())
+    t0, t1 = np.int64(np.floor(t0)), np.int64(np.ceil(t1))
+    span = t1 - t0 + 1
+    nidis = nids.argsort()
+    ranks = np.empty(nn, dtype=np.int64)
+    ranks[nidis] = np.arange(nn) # rank of each nid in sorted nids
+    spikeranks = np.searchsorted(nids[nidis], spikenids[sortis])
+    key = spikeranks * span + (t - t0)
+    edges = ranks[:, np.newaxis, np.newaxis]*span + np.ceil(tranges - t0).astype(np.int64)
+    tis = key.searchsorted(edges.ravel()).reshape(nn, nbins, 2)
+    los, his = tis[..., 0].ravel(), tis[..., 1].ravel()
+    counts = (his - los).reshape(nn, nbins)
+    means, stds = {}, {}
+    for field in fields:
+        vals = np.asarray(spikes[field])[sortis].astype(np.float64)
+        sums = binsums(vals, los, his).reshape(nn, nbins)
+        sqsums = binsums(vals**2, los, his).reshape(nn, nbins)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = sums / counts
+            var = sqsums / counts - mean**2
+        means[field] = mean # NaN for empty bins
+        stds[field] = np.sqrt(np.maximum(var, 0))
+    return counts, means, stds
@@ -0,0 +1,188 @@
+"""Firing rate estimators that run on many spike trains at once, sampled at a common set of
+timepoints t (us). Kernel rates histogram all trains together at a fine base resolution,
+smooth them all at once (see smooth.py), and resample them to t. Rectangular window rates
+count spikes in windows centered on t. ISI based rates are step functions, held from the
+spike that ends each group of intervals until the next one, as in core.sah(). All trains
+are concatenated and offset to their own nonoverlapping span of time, so that a single
+searchsorted samples all of them, without any Python loop over spikes or trains. Used by
+the Rate classes in neuron.py, which call them with a single train"""
+
+import numpy as np
+
+import smooth
+from core import scipy # lazily imported
+from core import intround
+from ratematrix import bincounts
+
+BLOCKSIZE = 64 # number of trains to smooth at a time, to limit memory use over long tranges
+
+
+def timebase(trange, tres):
+    """Return timepoints spanning trange at tres, starting at the nearest multiple of tres
+    at or before trange[0], so that timepoints of different Rates line up"""
+    tstart = trange[0] - (trange[0] % tres)
+    return np.arange(tstart, trange[1], tres)
+
+def _concat(trains):
+    """Return concatenated trains, and the index of the train each value belongs to"""
+    trains = [ np.asarray(train) for train in trains ]
+    lens = [ len(train) for train in trains ]
+    if sum(lens) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(trains), np.repeat(np.arange(len(trains)), lens)
+
+def sah(ts, vals, tis, ntrains, t):
+    """Sample and hold many step functions at timepoints t, all at once. ts are the sorted
+    times of the steps of each train, concatenated, and vals their values. tis is the train
+    index of each step. Same as core.sah() of each train. Trains without steps are 0.
+    Return (ntrains, len(t)) array"""
+    t = np.asarray(t)
+    r = np.zeros((ntrains, len(t)))
+    if len(ts) == 0:
+        return r
+    t0 = min(ts.min(), t.min())
+    span = max(ts.max(), t.max()) - t0 + 1
+    keys = tis*span + (ts - t0) # sorted, since ts are sorted within each train
+    starts = np.searchsorted(tis, np.arange(ntrains)) # first step of each train
+    stops = np.searchsorted(tis, np.arange(ntrains), side='right')
+    queries = np.arange(ntrains)[:, np.newaxis]*span + (t - t0)
+    # most recent step of each train at each timepoint, held from its first step:
+    i = np.maximum(keys.searchsorted(queries) - 1, starts[:, np.newaxis])
+    i = np.minimum(i, len(vals) - 1)
+    r[:] = vals[i]
+    r[starts == stops] = 0 # trains without steps
+    return r
+
+def gaussrates(trains, t, width, baseres=None, blocksize=BLOCKSIZE):
+    """Return rates (Hz) of trains at timepoints t, convolved with a Gaussian kernel with
+    sigma = width/2 (us), normalized to unit area. Trains are histogrammed at baseres (us,
+    default: the finer of tres and sigma/20), smoothed, and linearly resampled at t"""
+    t = np.asarray(t)
+    sigma = width / 2
+    if baseres == None:
+        tres = t[1] - t[0] if len(t) > 1 else sigma
+        baseres = max(intround(min(tres, sigma/20)), 1)
+    pad = intround(sigma*5) + baseres # kernel half span
+    tb = np.arange(t[0] - pad, t[-1] + pad, baseres) # base bin left edges
+    bins = np.column_stack([tb, tb + baseres])
+    # convolution output i is centered on the kernel sample at (nk-1)//2, see smooth.gauss(),
+    # which is usually not exactly at the kernel's peak. Offset the time of each output
+    # sample accordingly:
+    nk = len(smooth.kernel(sigma, baseres))
+    tb = tb + baseres / 2 + (-sigma*5 + (nk - 1) // 2 * baseres) # smoothed sample times
+    # linear interpolation indices and weights, the same for all trains:
+    j = np.clip(tb.searchsorted(t, side='right') - 1, 0, len(tb) - 2)
+    w = (t - tb[j]) / baseres
+    kernelsum = smooth.kernel(sigma, baseres).sum()
+    ntrains = len(trains)
+    r = np.zeros((ntrains, len(t)))
+    for i0 in range(0, ntrains, blocksize):
+        i1 = min(i0 + blocksize, ntrains)
+        ts, tis = _concat(trains[i0:i1])
+        counts = bincounts(ts, tis, i1 - i0, bins)
+        rb = smooth.gauss(counts, sigma, baseres) / kernelsum / (baseres / 1e6) # Hz
+        r[i0:i1] = rb[:, j] * (1 - w) + rb[:, j+1] * w
+    return r
+
+def rectrates(trains, t, width):
+    """Return rates (Hz) of trains at timepoints t, counted in rectangular windows of
+    width (us) centered on t"""
+    t = np.asarray(t)
+    half = width // 2
+    bins = np.column_stack([t - half, t - half + width])
+    ts, tis = _concat(trains)
+    return bincounts(ts, tis, len(trains), bins) / (width / 1e6)
+
+def nisisteps(trains, nisi):
+    """Return the time, rate (Hz) and train index of each nisi-interval step of trains.
+    Each group of nisi intervals holds nisi+1 spikes, as in nISIRate. Each step's time is
+    that of the spike that ends its group, to keep it causal"""
+    ts, tis = _concat(trains)
+    if len(ts) <= nisi:
+        return ts[:0], np.zeros(0), tis[:0]
+    # keep only groups of nisi intervals whose spikes all belong to the same train:
+    same = tis[nisi:] == tis[:-nisi]
+    d = (ts[nisi:] - ts[:-nisi])[same]
+    with np.errstate(divide='ignore'):
+        r = (nisi + 1) / d * 1e6 # spikes/sec
+    return ts[nisi:][same], r, tis[nisi:][same]
+
+def nisirates(trains, t, nisi=3):
+    """Return nisi-interval rates (Hz) of trains, sampled and held at timepoints t.
+    nisi == 1 is the ISI rate"""
+    ts, r, tis = nisisteps(trains, nisi)
+    return sah(ts, r, tis, len(trains), t)
+
+def wnisirates(trains, t, nisis=(1, 2, 3, 4), weights=None):
+    """Return weighted average of the nisi-interval rates (Hz) of trains over nisis,
+    sampled and held at timepoints t. Equal weights by default"""
+    if weights == None:
+        weights = np.ones(len(nisis))
+    weights = np.asarray(weights, dtype=np.float64)
+    r = sum([ w * nisirates(trains, t, nisi=nisi) for w, nisi in zip(weights, nisis) ])
+    return r / weights.sum()
+
+def idpsteps(trains, a=4, pthresh=0.05):
+    """Return the time, rate (Hz) and train index of each step of the instantaneous
+    discharge probability of trains, see Pauluis and Baker, 2000. Each interval is tested
+    against gamma distributions of order a with the means of the next 2 intervals. If it's
+    significantly longer than both, the rate increases at the end of it: the next
+    interval's ISI rate is extended back over its second half. Likewise, if it's
+    significantly longer than both previous intervals, the previous interval's ISI rate is
+    extended forward over its first half"""
+    ts, tis = _concat(trains)
+    if len(ts) < 2:
+        return ts[:0], np.zeros(0), tis[:0]
+    same = tis[1:] == tis[:-1] # intervals within the same train
+    I, t0s, iis = np.diff(ts)[same], ts[:-1][same], tis[:-1][same]
+    with np.errstate(divide='ignore'):
+        r = 1 / I * 1e6 # ISI rate, spikes/sec
+    n = len(I)
+    gdtrc = scipy.special.gdtrc # integral from x to infinity of gamma pdf
+
+    def islonger(k):
+        """Return whether each interval is significantly longer than the one k intervals
+        away from it in the same train"""
+        result = np.zeros(n, dtype=bool)
+        if abs(k) >= n:
+            return result
+        src = slice(max(0, -k), n - max(0, k)) # intervals with a neighbour k away
+        dst = slice(max(0, k), n - max(0, -k)) # their neighbours
+        valid = iis[src] == iis[dst]
+        with np.errstate(divide='ignore'):
+            p = gdtrc(a / I[dst], a, I[src]) # gamma with mean of neighbouring interval
+        result[src] = valid & (p < pthresh)
+        return result
+
+    inc = islonger(1) & islonger(2) # rate increases at end of interval
+    dec = islonger(-1) & islonger(-2) # rate decreased at start of interval
+    lr, rr = r.copy(), r.copy() # rates of first and second half of each interval
+    lr[dec] = r[np.where(dec)[0] - 1] # extend previous ISI rate forward
+    rr[inc] = r[np.where(inc)[0] + 1] # extend next ISI rate back
+    # interleave the two halves of each interval, the last spike of each train holds:
+    ts = np.column_stack([t0s, t0s + I / 2]).ravel()
+    rs = np.column_stack([lr, rr]).ravel()
+    iis = np.repeat(iis, 2)
+    return ts, rs, iis
+
+def idprates(trains, t, a=4, pthresh=0.05):
+    """Return instantaneous discharge probability rates (Hz) of trains, sampled and held at
+    timepoints t, see idpsteps()"""
+    ts, r, tis = idpsteps(trains, a=a, pthresh=pthresh)
+    return sah(ts, r, tis, len(trains), t)
+
+KINDS = {'gauss': gaussrates, 'rect': rectrates, 'nisi': nisirates, 'wnisi': wnisirates,
+         'idp': idprates}
+
+def population(neurons, kind='gauss', trange=None, tres=50000, **kwargs):
+    """Return sorted nids of neurons (a dict of nid:neuron), timepoints (us) spanning
+    trange at tres, and (nn, nt) array of rates (Hz) of kind of all neurons at those
+    timepoints. kwargs are passed to the rate function of kind, see KINDS"""
+    nids = np.sort(list(neurons))
+    trains = [ neurons[nid].spikes for nid in nids ]
+    if trange == None:
+        nonempty = [ train for train in trains if len(train) > 0 ]
+        trange = (min([ train[0] for train in nonempty ]),
+                  max([ train[-1] for train in nonempty ]))
+    t = timebase(trange, tres)
+    return nids, t, KINDS[kind](trains, t, **kwargs)
@@ -16,6 +16,7 @@ from pylab import get_current_fig_manager as gcfm
 from animal import Animal
 from track import Track
 from recording import Recording
+import loader
 #import pool
 import core
 from core import nCr, nPr, SpikeCorr, intround
@@ -5,18 +5,16 @@ from io import StringIO
 
 import numpy as np
 
-import matplotlib as mpl
-import pylab as pl
-from pylab import get_current_fig_manager as gcfm
-
-import pyximport
-pyximport.install(build_in_temp=False, inplace=True)
-import util # .pyx file
-
 import core
+import config
+from core import util # .pyx file, see core.load_util()
+from core import mpl, pl, gcfm # lazily imported
 from core import dictattr, TAB, td2usec, lastcmd, intround
 from recording import Recording
 from sort import TrackSort
+import ratematrix
+from ratematrix import RateMatrix
+from geometry import Geometry
 
 
 class Track(object):
@@ -71,11 +69,8 @@ class Track(object):
         if self.animal != None:
             self.animal.writetree(string)
 
-    def load(self):
-        treestr = self.level*TAB + self.name + '/'
-        # print string to tree hierarchy and screen
-        self.writetree(treestr + '\n')
-        print(treestr)
+    def find_rnames(self):
+        """Return sorted names of all recording folders in this track's path"""
         dirnames = [ name for name in os.listdir(self.path)
                      if os.path.isdir(os.path.join(self.path, name)) ]
         # collect recording names: either the 1st char of each name must be a digit,
@@ -89,6 +84,16 @@ class Track(object):
                 if lastfield[0] == 'e' and lastfield[1:].isnumeric():
                     rnames.append(dirname)
         rnames.sort() # alphabetical order
+        return rnames
+
+    def load(self, onrecording=None):
+        """Load all recordings in this track. If specified, onrecording is called with each
+        recording as soon as it's loaded, see loader.py"""
+        treestr = self.level*TAB + self.name + '/'
+        # print string to tree hierarchy and screen
+        self.writetree(treestr + '\n')
+        print(treestr)
+        rnames = self.find_rnames()
         dt = 0 # calculate total track duration by summing durations of all recordings
         # does this track have any missing sorts, or rely on old impoverished .spk files?:
         missingsort, simplesort = False, False
@@ -102,6 +107,8 @@ class Track(object):
                 simplesort = True
             self.r[recording.id] = recording
             self.__setattr__('r' + str(recording.id), recording) # add shortcut attrib
+            if onrecording != None:
+                onrecording(recording)
             dt += recording.dt
         self.rnames = rnames # easy way to print out all recording names
         self.dt = dt
@@ -170,7 +177,7 @@ class Track(object):
 
     def calc_meanrates(self):
         """Calculate mean firing rates of all TrackNeurons in this track"""
-        TRACKNEURONPERIOD = get_ipython().user_ns['TRACKNEURONPERIOD']
+        TRACKNEURONPERIOD = config.get()['TRACKNEURONPERIOD']
         if TRACKNEURONPERIOD == 'track':
             # calc tn.meanrate using entire track duration:
             for tn in self.alln.values():
@@ -197,7 +204,8 @@ class Track(object):
         a = f.add_subplot(111)
         if bins == None:
             bins = np.arange(0, 1, 0.05)
-        n, mr = np.histogram(self.meanrates, bins=bins, density=False)
+        mr = np.asarray(bins) # rate bin edges
+        n = ratematrix.hists(self.meanrates, mr, density=False)[0]
         binwidth = mr[1] - mr[0] # take width of first bin
         a.bar(left=mr[:-1], height=n, width=binwidth, bottom=0, color='k', ec='k')
         titlestr = lastcmd()
@@ -221,6 +229,18 @@ class Track(object):
     samplerate = property(lambda self: self.sort.samplerate)
     tres = property(lambda self: self.sort.tres)
 
+    def get_geometry(self):
+        """Positions, layers and pair separations of all neurons in this track's default
+        sort, stacked once per sort, see geometry.py"""
+        sort = self.sort
+        try:
+            return sort._geometry
+        except AttributeError: # not built yet for this sort
+            sort._geometry = Geometry(sort.alln, self.absname)
+            return sort._geometry
+
+    geometry = property(get_geometry)
+
     def get_nids(self, rids=None):
         """Return nids of active neurons common to all recordings specified in rids.
         Otherwise, return all active nids in all recordings. Active neurons in a recording
@@ -314,7 +334,7 @@ class Track(object):
 
         if stats:
             # add stuff to top right of plot:
-            uns = get_ipython().user_ns
+            uns = config.get()
             a.text(0.99, 0.99, 'mean = %.3f\n'
                                'median = %.3f\n'
                                'mode = %.3f\n'
@@ -341,7 +361,7 @@ class Track(object):
         """Plot (x, y) cell positions over top of polytrode channel positions, to get an idea
         of how cells are distributed in space. Colour cells by 'active', 'rftype',
         'spiketype' or 'sigma'."""
-        uns = get_ipython().user_ns
+        uns = config.get()
         npos = np.asarray([ neuron.pos for neuron in self.alln.values() ])
         chanpos = self.chanpos
         chanxs, chanys = chanpos[:, 0], chanpos[:, 1]
@@ -448,6 +468,28 @@ class Track(object):
         #a.set_ylabel('$\mu$m')
         #f.tight_layout(pad=0.3) # resizes contents to figure (not crop figure to contents!)
 
+    def ratematrix(self, tranges=None, width=None, tres=None, neurons='all'):
+        """Return a RateMatrix of spike counts of neurons ('all', 'quiet', None for active,
+        or a list of nids) in each of tranges (us). If tranges is None, split each of
+        this track's recording tranges into bins of width and tres (us), which default to
+        config SCWIDTH and SCTRES, same as SpikeCorr. See ratematrix.py"""
+        if neurons is None:
+            neurons = self.n
+        elif type(neurons) == str:
+            neurons = getattr(self, {'quiet': 'qn', 'all': 'alln'}[neurons])
+        else:
+            neurons = { nid:self.alln[nid] for nid in neurons }
+        if tranges is None:
+            uns = config.get()
+            if width == None:
+                width = intround(uns['SCWIDTH'] * 1000000) # convert from sec to us
+            if tres == None:
+                tres = intround(uns['SCTRES'] * 1000000) # convert from sec to us
+            # split_tranges() requires each trange to be wider than width:
+            tranges = [ trange for trange in self.tranges if trange[1] - trange[0] > width ]
+            tranges = core.split_tranges(tranges, width, tres) # possibly overlapping
+        return RateMatrix(neurons, tranges)
+
     def cch(self, nid0, nid1=None, trange=50, binw=None, shift=None, nshifts=10,
             rate=False, norm=False, c='k', title=True, figsize=(7.5, 6.5)):
         """Copied from Recording.cch(). Plot cross-correlation histogram given nid0 and nid1.
@@ -528,7 +570,7 @@ class Track(object):
 
         ## TODO: maybe limit to visually responsive cells
 
-        uns = get_ipython().user_ns
+        uns = config.get()
         if width == None:
             width = uns['SCWIDTH']
         if tres == None:
@@ -579,7 +621,7 @@ class Track(object):
         ## TODO: maybe limit to visually responsive cells
         ## TODO: add linear regression of si vs log(sc)
 
-        uns = get_ipython().user_ns
+        uns = config.get()
         if width == None:
             width = uns['LFPSIWIDTH']
         if tres == None:
@@ -0,0 +1,63 @@
+"""Trial-aligned extraction of continuous signals, such as LFP and MUA, and trial-pair
+correlations. Instead of slicing and stacking one trial at a time, trial start times are
+converted to sample indices in a single searchsorted call, and all trials of all channels
+are gathered at once by fancy indexing a strided (sliding window) view of the signal,
+giving an (ntrials, nchans, nt) array without any Python loop over trials. Correlations
+between all pairs of trials, and between each trial and the mean of all the others, are
+likewise calculated with a single matrix product"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def tis(t, ttranges):
+    """Return sample index of the start of each trial in ttranges, given sorted sample times
+    t (same units as ttranges), and the number of samples nt in the shortest trial. All
+    trials are truncated to nt samples, so that they can be stacked"""
+    ttranges = np.asarray(ttranges)
+    tis = t.searchsorted(ttranges) # (ntrials, 2)
+    nt = (tis[:, 1] - tis[:, 0]).min()
+    return tis[:, 0], nt
+
+def gather(data, tis, nt):
+    """Return nt samples of data starting at each sample index in tis. data can be 1D
+    (nsamples), or 2D (nchans, nsamples), giving a 2D (ntrials, nt) or 3D (ntrials,
+    nchans, nt) array, respectively. Uses a strided view of data, which doesn't copy it,
+    so only the gathered samples are ever copied"""
+    data = np.asarray(data)
+    tis = np.asarray(tis)
+    assert tis.min() >= 0 and tis.max() + nt <= data.shape[-1], "trials out of range"
+    windows = sliding_window_view(data, nt, axis=-1) # (..., nsamples-nt+1, nt) view
+    trials = windows[..., tis, :] # (..., ntrials, nt) copy
+    return np.moveaxis(trials, -2, 0) # trials first
+
+def zscore(x):
+    """Normalize x along its last (time) axis to zero mean and unit norm, so that the dot
+    product of any two normalized signals is their correlation coefficient. Constant
+    signals are set to NaN, since their correlation is undefined"""
+    x = np.float64(x)
+    x = x - x.mean(axis=-1, keepdims=True)
+    norm = np.sqrt((x**2).sum(axis=-1, keepdims=True))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x / norm
+
+def paircorrs(x):
+    """Return correlation coefficients between all pairs of trials in x, a 2D (ntrials, nt)
+    or 3D (ntrials, nchans, nt) array. Return a 2D (ntrials, ntrials) or 3D (nchans,
+    ntrials, ntrials) array, respectively"""
+    z = zscore(x)
+    if z.ndim == 3:
+        z = np.moveaxis(z, 0, 1) # (nchans, ntrials, nt)
+    return z @ np.swapaxes(z, -1, -2)
+
+def otherscorrs(x):
+    """Return correlation coefficient between each trial in x and the mean of all other
+    trials, a common measure of reliability. x is a 2D (ntrials, nt) or 3D (ntrials,
+    nchans, nt) array. Return a 1D (ntrials) or 2D (ntrials, nchans) array,
+    respectively"""
+    x = np.float64(x)
+    ntrials = len(x)
+    assert ntrials > 1
+    # mean of all other trials, for each trial:
+    others = (x.sum(axis=0) - x) / (ntrials - 1)
+    return (zscore(x) * zscore(others)).sum(axis=-1)
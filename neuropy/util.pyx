@@ -125,6 +125,69 @@ def xcorr(int64_t[::1] x,
     return np.asarray(dts[:dtsi]) # trim it down, convert memory view slice to array
 
 
+cdef int64_t nrpvs_own(int64_t *x, int64_t nx, int64_t rp) nogil:
+    """Count pairs of timepoints in sorted x that are more than 0 and less than rp apart,
+    using a two-pointer sweep"""
+    cdef int64_t i, hi = 0, eqhi = 0, n = 0
+    for i in range(nx):
+        while hi < nx and x[hi] - x[i] < rp: # first timepoint rp or more after x[i]
+            hi += 1
+        if eqhi < i + 1: # first timepoint after x[i], ignoring x[i] itself
+            eqhi = i + 1
+        while eqhi < nx and x[eqhi] == x[i]:
+            eqhi += 1
+        if hi > eqhi:
+            n += hi - eqhi
+    return n
+
+
+cdef int64_t nrpvs_cross(int64_t *x, int64_t nx, int64_t *y, int64_t ny,
+                         int64_t rp) nogil:
+    """Count pairs of timepoints, one from sorted x and one from sorted y, that are more
+    than 0 and less than rp apart, in either direction, using a two-pointer sweep"""
+    cdef int64_t i, t, lo = 0, eqlo = 0, eqhi = 0, hi = 0, n = 0
+    for i in range(nx):
+        t = x[i]
+        while lo < ny and y[lo] <= t - rp: # first y within rp before t
+            lo += 1
+        while eqlo < ny and y[eqlo] < t: # first y at t
+            eqlo += 1
+        while eqhi < ny and y[eqhi] <= t: # first y after t
+            eqhi += 1
+        while hi < ny and y[hi] < t + rp: # first y rp or more after t
+            hi += 1
+        n += (hi - lo) - (eqhi - eqlo) # exclude simultaneous timepoints
+    return n
+
+
+def rpvs(trains, int64_t rp):
+    """Count refractory period violations (RPVs) within and between all spike trains in list
+    trains, each sorted. An RPV is a pair of spikes more than 0 and less than rp apart.
+    Return symmetric (ntrains, ntrains) array, with the number of RPVs within each train
+    on the diagonal, and the number of RPVs between each pair of trains off the diagonal.
+    The number of RPVs in the merger of trains i and j is then n[i, i] + n[j, j] + n[i, j],
+    without ever having to merge them"""
+    cdef int64_t i, j, ntrains = len(trains)
+    cdef int64_t[::1] flat = np.concatenate([np.int64([])] +
+                                            [ np.int64(train) for train in trains ])
+    cdef int64_t[::1] ns = np.int64([ len(train) for train in trains ])
+    cdef int64_t[::1] offsets = np.int64(np.concatenate([[0], np.cumsum(ns)[:-1]]))
+    cdef int64_t[:, ::1] n = np.zeros((ntrains, ntrains), dtype=np.int64)
+    cdef int64_t *x
+    cdef int64_t *y
+    if ntrains == 0 or flat.shape[0] == 0:
+        return np.asarray(n)
+    # each row has a different number of pairs to do, so schedule dynamically:
+    for i in prange(ntrains, nogil=True, schedule='dynamic'):
+        x = &flat[offsets[i]]
+        n[i, i] = nrpvs_own(x, ns[i], rp)
+        for j in range(i+1, ntrains):
+            y = &flat[offsets[j]]
+            n[i, j] = nrpvs_cross(x, ns[i], y, ns[j], rp)
+            n[j, i] = n[i, j]
+    return np.asarray(n)
+
+
 def sct(int8_t[:, ::1] c,
         int64_t[::1] t,
         int64_t[:, ::1] tranges,
@@ -0,0 +1,157 @@
+"""Batched template waveform processing for cell typing. Templates of all neurons are
+stacked into a single (nn, nchans, nt) array, upsampled together in a single polyphase
+resampling call, and measured together: peak-to-peak amplitude, primary and secondary
+extrema, their FWHMs and asymmetries, and spatial extent, without any Python loop over
+neurons or waveforms"""
+
+from fractions import Fraction
+
+import numpy as np
+
+from core import scipy # lazily imported
+
+# per-neuron waveform features returned by features(), all times in us:
+FEATURESDTYPE = [('Vpp', np.float64), # peak-to-peak amplitude
+                 ('t1', np.float64), ('t2', np.float64), # primary and secondary extrema
+                 ('V1', np.float64), ('V2', np.float64), # their voltages
+                 ('fwhm1', np.float64), ('fwhm2', np.float64), # and their FWHMs
+                 ('ipi', np.float64), # interpeak interval, t2 - t1
+                 ('duration2', np.float64), # start of primary to end of secondary FWHM
+                 ('ai1', np.float64), ('ai2', np.float64), # peak temporal asymmetries
+                 ('aai', np.float64), # amplitude asymmetry index
+                 ('swapped', bool)] # primary was rightmost, made it secondary
+
+
+def stack(neurons, nchans=None):
+    """Return (nn, nchans, nt) array of the templates of neurons, indexed by channel ID,
+    NaN on channels missing from each neuron's wavedata, and array of each neuron's max
+    channel ID"""
+    nts = np.unique([ neuron.nt for neuron in neurons ])
+    if len(nts) != 1:
+        raise RuntimeError("Not all neuron templates have the same number of timepoints. "
+                           "That's probably bad.")
+    if nchans == None:
+        nchans = max([ neuron.chans.max() for neuron in neurons ]) + 1
+    waves = np.full((len(neurons), nchans, nts[0]), np.nan)
+    for i, neuron in enumerate(neurons):
+        waves[i, neuron.chans] = neuron.wavedata
+    maxchans = np.array([ neuron.maxchan for neuron in neurons ])
+    return waves, maxchans
+
+def maxchan(waves, maxchans):
+    """Return (nn, nt) array of the max channel waveform of each neuron in waves"""
+    return waves[np.arange(len(waves)), maxchans]
+
+def upsample(waves, tres, newtres):
+    """Resample waves along their last (time) axis from tres to newtres, all at once.
+    Timepoint i of the result is at i*newtres. NaN waveforms stay NaN"""
+    ratio = Fraction(tres) / Fraction(newtres)
+    return scipy.signal.resample_poly(waves, ratio.numerator, ratio.denominator, axis=-1,
+                                      padtype='line')
+
+def extrema(waves):
+    """Find the biggest local extremum between each pair of successive 0 crossings (and
+    edges) of each waveform in 2D waves. Return their row and column indices, sorted by
+    row, then column"""
+    nn, nt = waves.shape
+    d = np.sign(np.diff(waves, axis=1))
+    isext = np.zeros(waves.shape, dtype=bool)
+    isext[:, 1:-1] = d[:, :-1] != d[:, 1:] # local extrema
+    s = np.sign(waves)
+    zc = s[:, 1:] != s[:, :-1] # 0 crossing between timepoints j and j+1
+    # segment of each timepoint, starting at each 0 crossing's timepoint j:
+    seg = np.zeros(waves.shape, dtype=np.int64)
+    seg[:, :-1] = np.cumsum(zc, axis=1)
+    # as in scripts' arg0xextrema(), extrema at either end of a segment don't count, and
+    # the last timepoint ends the last segment:
+    isext[:, 1:-1] &= ~zc[:, 1:]
+    isext[:, 1:-2] &= ~zc[:, 2:]
+    isext[:, -2:] = False
+    rows, cols = isext.nonzero()
+    keys = rows*nt + seg[rows, cols] # unique for each segment of each row
+    # sort by segment, then descending abs value, then keep first of each segment:
+    order = np.lexsort((-abs(waves[rows, cols]), keys))
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    order = order[first] # still sorted by row, then column, since segments are
+    return rows[order], cols[order]
+
+def argfwhm(waves, extis, fraction=0.5):
+    """Vectorized version of core.argfwhm() with method='inner'. Return left and right
+    indices of the full width at fraction of max around extremum extis[i] of each waveform
+    waves[i], or -1 where a waveform doesn't change enough to have one"""
+    nn, nt = waves.shape
+    extis = np.asarray(extis)
+    rowis = np.arange(nn)
+    fm = waves[rowis, extis] * fraction # fraction of max
+    d = waves - fm[:, np.newaxis]
+    changes = np.diff(np.sign(d), axis=1) != 0 # sign change between j and j+1
+    j = np.arange(nt-1)
+    left = changes & (j <= extis[:, np.newaxis] - 2)
+    right = changes & (j >= extis[:, np.newaxis])
+    lis = np.where(left, j, -1).max(axis=1) # rightmost of left indices
+    ris = np.where(right, j, nt).min(axis=1) + 1 # leftmost of right indices
+    bad = (lis == -1) | (ris == nt + 1)
+    lis[bad], ris[bad] = -1, -1
+    return lis, ris
+
+def features(waves, tres, alignt, fraction=0.5):
+    """Measure waveform features of each waveform in 2D waves, sampled at tres, see
+    FEATURESDTYPE. The primary extremum is the one closest to alignt (us), the secondary
+    is the next one to its right. If the primary is the rightmost extremum, it's instead
+    taken as the secondary, and the one to its left as the primary. FWHMs are at
+    fraction of each extremum. Features that can't be measured are NaN"""
+    nn, nt = waves.shape
+    f = np.zeros(nn, dtype=FEATURESDTYPE)
+    f['Vpp'] = np.ptp(waves, axis=1)
+    rows, cols = extrema(waves)
+    # extremum closest to alignt in each row:
+    aligni = int(round(alignt / tres))
+    starts = rows.searchsorted(np.arange(nn))
+    ends = rows.searchsorted(np.arange(nn), side='right')
+    valid = ends - starts >= 2
+    order = np.lexsort((abs(cols - aligni), rows))
+    p = order[np.minimum(starts, len(order)-1)] if len(order) > 0 else starts
+    p1, p2 = p, p + 1
+    swapped = p2 >= ends # closest is rightmost, make it the secondary
+    p1, p2 = np.where(swapped, p - 1, p1), np.where(swapped, p, p2)
+    p1, p2 = np.where(valid, p1, 0), np.where(valid, p2, 0)
+    if len(cols) > 0:
+        exti1, exti2 = np.where(valid, cols[p1], 0), np.where(valid, cols[p2], 0)
+    else:
+        exti1 = exti2 = np.zeros(nn, dtype=np.int64)
+    li1, ri1 = argfwhm(waves, exti1, fraction=fraction)
+    li2, ri2 = argfwhm(waves, exti2, fraction=fraction)
+    valid1, valid2 = valid & (li1 != -1), valid & (li2 != -1)
+    rowis = np.arange(nn)
+    V1, V2 = abs(waves[rowis, exti1]), abs(waves[rowis, exti2])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # temporal asymmetry: time between mode and median, normalized by peak width:
+        ai1 = (exti1 - (li1 + ri1)/2) / (ri1 - li1)
+        ai2 = (exti2 - (li2 + ri2)/2) / (ri2 - li2)
+        aai = (V1 - V2) / (V1 + V2)
+    f['t1'] = np.where(valid, exti1 * tres, np.nan)
+    f['t2'] = np.where(valid, exti2 * tres, np.nan)
+    f['V1'] = np.where(valid, waves[rowis, exti1], np.nan)
+    f['V2'] = np.where(valid, waves[rowis, exti2], np.nan)
+    f['fwhm1'] = np.where(valid1, (ri1 - li1) * tres, np.nan)
+    f['fwhm2'] = np.where(valid2, (ri2 - li2) * tres, np.nan)
+    f['ipi'] = f['t2'] - f['t1']
+    f['duration2'] = np.where(valid1 & valid2, (ri2 - li1) * tres, np.nan)
+    f['ai1'] = np.where(valid1, ai1, np.nan)
+    f['ai2'] = np.where(valid2, ai2, np.nan)
+    f['aai'] = np.where(valid, aai, np.nan)
+    f['swapped'] = valid & swapped
+    return f
+
+def spatialextent(waves, chanpos):
+    """Return spatial extent (um) of each neuron's templates in 3D waves: the RMS distance
+    of its channels from its biggest channel, weighted by each channel's peak-to-peak
+    amplitude. chanpos are the positions of all channels"""
+    waves = np.nan_to_num(waves) # missing channels have 0 amplitude
+    Vpps = np.ptp(waves, axis=2) # (nn, nchans)
+    chanpos = np.asarray(chanpos)[:waves.shape[1]]
+    maxchans = Vpps.argmax(axis=1)
+    d2 = ((chanpos[np.newaxis] - chanpos[maxchans][:, np.newaxis])**2).sum(axis=2)
+    return np.sqrt((Vpps * d2).sum(axis=1) / Vpps.sum(axis=1))